@@ -0,0 +1,232 @@
+"""
+bill_simulation.py
+
+Compute per-plan kWh totals and costs straight from parsed intervals, without building a workbook.
+"""
+
+from typing import Optional, TypedDict
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from tou_engine import (OFF_PEAK, PEAK, SUPER_OFF_PEAK, INTERVAL_SECONDS, SECONDS_PER_DAY, UsageArrays,
+                        load_usage_intervals)
+from rate_schedules import PERIOD_NAMES, RATE_SCHEDULES, RateSchedule, get_compiled_schedule, use_rate_schedules
+from interval_table import IntervalTable, as_interval_table
+from interval_cache import IntervalCache
+from pseg_batch import find_usage_files
+
+SUMMER_MONTHS: list[int] = [6, 7, 8, 9]
+DAYS_PER_MONTH: float = 30
+
+
+class RatePrices(TypedDict, total=False):
+    daily_service_charge: float
+    delivery: dict[str, list[float]]        # Period name -> [summer, non-summer] $ per kWh
+    power_supply: dict[str, list[float]]    # Period name -> [summer, non-summer] fraction of published rate
+    excess_kwh_per_month: float             # Net kWh per 30 days billed at delivery rate before excess_delivery
+    excess_delivery: list[float]            # [summer, non-summer] $ per kWh above excess_kwh_per_month
+
+
+# Delivery & system charges from the 2025 PSEG Long Island residential rate guide ('PSEG Bills/PSEGLI Residential
+# Rate Plans.pdf').  Power supply is billed as a fraction of the monthly published rate.
+RATE_PRICES: dict[str, RatePrices] = {
+    '180': {
+        'daily_service_charge': 0.54,
+        'delivery': {'Off-Peak': [0.1021, 0.1021]},
+        'power_supply': {'Off-Peak': [1.0, 1.0]},
+        'excess_kwh_per_month': 250,
+        'excess_delivery': [0.1294, 0.1021],
+    },
+    '194': {
+        'daily_service_charge': 0.54,
+        'delivery': {'Off-Peak': [0.1049, 0.0891], 'Peak': [0.2127, 0.1809]},
+        'power_supply': {'Off-Peak': [0.83, 0.83], 'Peak': [1.9465, 2.1036]},
+    },
+    '195': {
+        'daily_service_charge': 0.54,
+        'delivery': {'Super Off-Peak': [0.0434, 0.0432], 'Off-Peak': [0.1332, 0.0891], 'Peak': [0.2859, 0.2341]},
+        'power_supply': {'Super Off-Peak': [0.60, 0.60], 'Off-Peak': [1.0, 1.0], 'Peak': [1.7282, 1.9261]},
+    },
+}
+
+COMPARISON_FIELDS: list[str] = [
+    'source', 'meter', 'start', 'end', 'days', 'plan', 'name',
+    'consumed', 'generated', 'net', 'peak_net', 'off_peak_net', 'super_off_peak_net',
+    'service_charge', 'delivery', 'power_supply', 'total', 'unmatched',
+]
+
+
+def load_rate_prices(json_file_name: str) -> dict[str, RatePrices]:
+    """
+    Read prices in the RATE_PRICES format from a JSON file.
+
+    Raises ValueError if a plan has no schedule in RATE_SCHEDULES or prices a period that doesn't exist.
+    """
+    with open(json_file_name) as json_file:
+        prices: dict[str, RatePrices] = json.load(json_file)
+    if not isinstance(prices, dict):
+        raise ValueError(f'{json_file_name} must be an object of prices keyed by plan.')
+    for plan, plan_prices in prices.items():
+        if plan not in RATE_SCHEDULES:
+            raise ValueError(f'Plan {plan!r} has no rate schedule.  Choose from {", ".join(RATE_SCHEDULES)}, '
+                             'or add one with --schedules.')
+        for charge in ('delivery', 'power_supply'):
+            unknown: list[str] = [name for name in plan_prices.get(charge, {}) if name not in PERIOD_NAMES.values()]
+            if unknown:
+                raise ValueError(f'Plan {plan!r} has {charge} prices for unknown periods {", ".join(unknown)}.')
+    return prices
+
+
+def simulate_usage(usage: UsageArrays, source: str = '', prices: Optional[dict[str, RatePrices]] = None,
+                   power_supply_rate: float = 0.0) -> list[dict]:
+    """
+    Return one comparison row per meter and plan in prices.
+
+    Net kWh is consumed + generated, as in the workbook.  power_supply_rate is the monthly published power supply
+    rate in $ per kWh.
+    """
+    prices = prices if prices is not None else RATE_PRICES
+    rows: list[dict] = []
+    if len(usage.timestamps) == 0:
+        return rows
+
+    table: IntervalTable = as_interval_table(usage)
+    timestamps: np.ndarray = np.asarray(table.timestamps)
+    months: np.ndarray = timestamps.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+    # Season index: 0 = summer, 1 = non-summer, matching the [summer, non-summer] price lists.
+    seasons: np.ndarray = (~np.isin(months, SUMMER_MONTHS)).astype(np.int64)
+    net: np.ndarray = np.asarray(table.consumed) + np.asarray(table.generated)
+    meters: np.ndarray = np.asarray(table.meters)
+
+    for meter in np.unique(meters).tolist():
+        selected: np.ndarray = meters == meter
+        meter_timestamps: np.ndarray = timestamps[selected]
+        meter_seasons: np.ndarray = seasons[selected]
+        meter_net: np.ndarray = net[selected]
+        start: int = int(meter_timestamps.min())
+        end: int = int(meter_timestamps.max())
+        # Readings are at the start of each interval, so the last one covers one more interval.
+        days: float = (end - start + INTERVAL_SECONDS) / SECONDS_PER_DAY
+        season_days: np.ndarray = np.bincount(meter_seasons, minlength=2) * INTERVAL_SECONDS / SECONDS_PER_DAY
+        consumed: float = float(np.asarray(table.consumed)[selected].sum())
+        generated: float = float(np.asarray(table.generated)[selected].sum())
+
+        for plan, plan_prices in prices.items():
+            periods: np.ndarray = table.periods(plan)[selected]
+            # Net kWh by [season, period] in one pass.
+            totals: np.ndarray = np.bincount(meter_seasons * 3 + periods, weights=meter_net, minlength=6).reshape(2, 3)
+
+            delivery: float = 0.0
+            power_supply: float = 0.0
+            for period, name in PERIOD_NAMES.items():
+                for season in (0, 1):
+                    kwh: float = float(totals[season, period])
+                    delivery += kwh * plan_prices.get('delivery', {}).get(name, [0.0, 0.0])[season]
+                    power_supply += kwh * power_supply_rate * plan_prices.get('power_supply', {}).get(name, [0.0, 0.0])[season]
+
+            if 'excess_kwh_per_month' in plan_prices:
+                for season in (0, 1):
+                    threshold: float = plan_prices['excess_kwh_per_month'] * season_days[season] / DAYS_PER_MONTH
+                    excess: float = max(float(totals[season].sum()) - threshold, 0.0)
+                    base_rate: float = plan_prices['delivery']['Off-Peak'][season]
+                    delivery += excess * (plan_prices['excess_delivery'][season] - base_rate)
+
+            service_charge: float = plan_prices.get('daily_service_charge', 0.0) * days
+            rows.append({
+                'source': source,
+                'meter': meter,
+                'start': str(np.datetime64(start, 's')),
+                'end': str(np.datetime64(end, 's')),
+                'days': round(days, 2),
+                'plan': plan,
+                'name': get_compiled_schedule(plan).name,
+                'consumed': round(consumed, 3),
+                'generated': round(generated, 3),
+                'net': round(consumed + generated, 3),
+                'peak_net': round(float(totals[:, PEAK].sum()), 3),
+                'off_peak_net': round(float(totals[:, OFF_PEAK].sum()), 3),
+                'super_off_peak_net': round(float(totals[:, SUPER_OFF_PEAK].sum()), 3),
+                'service_charge': round(service_charge, 2),
+                'delivery': round(delivery, 2),
+                'power_supply': round(power_supply, 2),
+                'total': round(service_charge + delivery + power_supply, 2),
+            })
+    return rows
+
+
+def simulate_file(csv_file_name: str, prices: Optional[dict[str, RatePrices]] = None, power_supply_rate: float = 0.0,
+                  cache_dir: Optional[str] = None) -> list[dict]:
+    """
+    Parse one usage csv and simulate it.  Returns a single row with an 'error' entry if it can't be read or parsed.
+
+    Each row's 'unmatched' entry counts intervals in the file that were left out for lack of a matching row.
+    """
+    try:
+        if cache_dir is not None:
+            usage, unmatched = IntervalCache(cache_dir).load_usage_intervals(csv_file_name)
+        else:
+            usage, unmatched = load_usage_intervals(csv_file_name)
+    except (OSError, ValueError) as error:
+        return [{'source': csv_file_name, 'error': str(error)}]
+
+    rows: list[dict] = simulate_usage(usage, csv_file_name, prices, power_supply_rate)
+    for row in rows:
+        row['unmatched'] = len(unmatched)
+    return rows
+
+
+def write_comparison(rows: list[dict], output_format: str, output_file) -> None:
+    """
+    Write comparison rows as 'json' or 'csv'.
+    """
+    if output_format == 'json':
+        json.dump(rows, output_file, indent=2)
+        output_file.write('\n')
+    else:
+        writer = csv.DictWriter(output_file, COMPARISON_FIELDS + ['error'], extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_simulation(paths: list[str], output_format: str = 'json', output: Optional[str] = None,
+                   rates_file: Optional[str] = None, power_supply_rate: float = 0.0, jobs: Optional[int] = None,
+                   cache_dir: Optional[str] = None, schedules: Optional[dict[str, RateSchedule]] = None) -> int:
+    """
+    Simulate every usage csv in paths (files or directories) and write the comparison table.  schedules (see
+    rate_schedules.load_rate_schedules) are added to RATE_SCHEDULES here and in the worker processes.
+
+    Returns the number of files that couldn't be read or parsed, or 1 if rates_file can't be read.
+    """
+    csv_files: list[str] = []
+    for path in map(Path, paths):
+        csv_files.extend(map(str, find_usage_files(path)) if path.is_dir() else [str(path)])
+
+    if schedules is not None:
+        use_rate_schedules(schedules)
+    try:
+        prices: Optional[dict[str, RatePrices]] = load_rate_prices(rates_file) if rates_file is not None else None
+    except (OSError, ValueError) as error:
+        print(f'Unable to read {rates_file}: {error}')
+        return 1
+    rows: list[dict] = []
+    if jobs is not None and jobs > 1 and len(csv_files) > 1:
+        # Workers may be started fresh rather than forked, so they're given the schedules too.
+        with ProcessPoolExecutor(max_workers=jobs, initializer=use_rate_schedules,
+                                 initargs=(schedules or {},)) as executor:
+            for file_rows in executor.map(simulate_file, csv_files, [prices] * len(csv_files),
+                                          [power_supply_rate] * len(csv_files), [cache_dir] * len(csv_files),
+                                          chunksize=16):
+                rows.extend(file_rows)
+    else:
+        for csv_file_name in csv_files:
+            rows.extend(simulate_file(csv_file_name, prices, power_supply_rate, cache_dir))
+
+    if output is None:
+        write_comparison(rows, output_format, sys.stdout)
+    else:
+        with open(output, 'w', newline='') as output_file:
+            write_comparison(rows, output_format, output_file)
+    return sum('error' in row for row in rows)
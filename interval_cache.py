@@ -0,0 +1,159 @@
+"""
+interval_cache.py
+
+On-disk cache of parsed usage intervals so unchanged csv files don't have to be parsed again.
+
+Entries are .npy files of INTERVAL_DTYPE records named by a hash of the csv contents and PARSER_VERSION, and are
+loaded with memory mapping.  Least recently used entries are evicted once the cache is over its size limit, and
+entries that haven't been used within the age limit are removed.
+"""
+
+from typing import Optional
+import hashlib
+import os
+import time
+import tempfile
+from pathlib import Path
+import numpy as np
+from tou_engine import PARSER_VERSION, UnmatchedInterval, UsageArrays
+from parallel_parse import load_usage_intervals_parallel
+
+INTERVAL_DTYPE: np.dtype = np.dtype([
+    ('timestamp', '<i8'),
+    ('meter', '<i8'),
+    ('consumed', '<f8'),
+    ('generated', '<f8'),
+    ('demand', '<f8'),
+    ('utc_offset', '<i4'),
+])
+
+DEFAULT_CACHE_DIR: Path = Path(os.environ.get('LOCALAPPDATA') or Path.home() / '.cache') / 'pseg_parse'
+DEFAULT_MAX_BYTES: int = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS: float = 90
+HASH_CHUNK_SIZE: int = 1024 * 1024
+
+
+def hash_file(file_name: str) -> str:
+    """
+    Return the sha256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IntervalCache:
+    """
+    Cache of UsageArrays keyed by csv content hash and parser version.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.cache_dir: Path = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        self.max_bytes: int = max_bytes
+        self.max_age_seconds: float = max_age_days * 24 * 3600
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def entry_path(self, content_hash: str) -> Path:
+        return self.cache_dir / f'{content_hash}-v{PARSER_VERSION}.npy'
+
+    def get(self, content_hash: str) -> Optional[UsageArrays]:
+        """
+        Return memory mapped arrays for content_hash, or None if they aren't cached.
+        """
+        path: Path = self.entry_path(content_hash)
+        try:
+            records: np.ndarray = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if records.dtype != INTERVAL_DTYPE:
+            return None
+
+        # Touch the entry so eviction treats it as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return UsageArrays(records['timestamp'], records['meter'], records['consumed'], records['generated'],
+                           records['demand'], records['utc_offset'])
+
+    def put(self, content_hash: str, usage: UsageArrays) -> None:
+        """
+        Store arrays for content_hash, then evict old entries.
+        """
+        records: np.ndarray = np.empty(len(usage.timestamps), dtype=INTERVAL_DTYPE)
+        records['timestamp'] = usage.timestamps
+        records['meter'] = usage.meters
+        records['consumed'] = usage.consumed
+        records['generated'] = usage.generated
+        records['demand'] = usage.demand
+        records['utc_offset'] = usage.utc_offsets
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename so parallel batch workers never see a partial entry.
+        file_descriptor, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                np.save(temp_file, records)
+            os.replace(temp_name, self.entry_path(content_hash))
+        except OSError:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def load_usage_intervals(self, csv_file_name: str,
+                             jobs: Optional[int] = 1) -> tuple[UsageArrays, list[UnmatchedInterval]]:
+        """
+        Cached tou_engine.load_usage_intervals.  Misses are parsed by up to jobs processes (see parallel_parse).
+
+        Files that fail to parse or have unmatched intervals aren't cached, so their problems are reported every run.
+        """
+        content_hash: str = hash_file(csv_file_name)
+        usage: Optional[UsageArrays] = self.get(content_hash)
+        if usage is not None:
+            self.hits += 1
+            return usage, []
+
+        self.misses += 1
+        usage, unmatched = load_usage_intervals_parallel(csv_file_name, jobs)
+        if not unmatched:
+            try:
+                self.put(content_hash, usage)
+            except OSError as error:
+                print(f'Unable to cache parsed usage data: {error}')
+        return usage, unmatched
+
+    def evict(self) -> None:
+        """
+        Remove entries from other parser versions or older than the age limit, then least recently used entries until
+        under the size limit.
+        """
+        now: float = time.time()
+        current_suffix: str = f'-v{PARSER_VERSION}.npy'
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.cache_dir.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            # Entries from other parser versions will never be read again, so evict them first.
+            mtime: float = stat.st_mtime if path.name.endswith(current_suffix) else 0
+            entries.append((mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes: int = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age_seconds and total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped by another process on Windows.
+                continue
+            total_bytes -= size
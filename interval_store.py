@@ -0,0 +1,195 @@
+"""
+interval_store.py
+
+Append-only SQLite store of usage intervals from every downloaded billing period.
+
+Downloads are ingested once.  Intervals are keyed by (meter, local time, UTC offset), so the boundary intervals
+that overlapping billing periods share are only kept the first time they're seen.  Reports for any date range are
+read back from the store without rereading the csv files.
+"""
+
+from typing import NamedTuple, Optional
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import numpy as np
+from tou_engine import EPOCH, SECONDS_PER_DAY, UsageArrays, load_usage_intervals
+from interval_cache import INTERVAL_DTYPE, hash_file
+from pseg_batch import find_usage_files
+from output_writers import write_usage
+
+DEFAULT_STORE_PATH: Path = (Path(os.environ.get('LOCALAPPDATA') or Path.home() / '.local' / 'share')
+                            / 'pseg_parse' / 'intervals.sqlite')
+
+# Intervals are keyed by local time and UTC offset, so both 1 AM hours are kept when DST ends.
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL UNIQUE,
+    ingested TEXT NOT NULL,
+    intervals INTEGER NOT NULL,
+    added INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS intervals (
+    meter INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    utc_offset INTEGER NOT NULL,
+    consumed REAL NOT NULL,
+    generated REAL NOT NULL,
+    demand REAL,
+    source INTEGER NOT NULL REFERENCES sources (id),
+    PRIMARY KEY (meter, timestamp, utc_offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS intervals_by_time ON intervals (timestamp, meter);
+"""
+
+
+class IngestResult(NamedTuple):
+    csv_file_name: str
+    status: str         # 'ingested', 'skipped' (same contents already ingested) or 'failed'
+    intervals: int      # Matched intervals in the file
+    added: int          # Intervals that weren't already in the store
+    unmatched: int
+    message: str
+
+
+def day_to_timestamp(day: date) -> int:
+    """
+    Return the timestamp (seconds since EPOCH, local time) of midnight at the start of day.
+    """
+    return (datetime(day.year, day.month, day.day) - EPOCH).days * SECONDS_PER_DAY
+
+
+class IntervalStore:
+    """
+    SQLite file of intervals keyed by (meter, timestamp, utc_offset) with a time index.
+    """
+
+    def __init__(self, store_path: Optional[str] = None):
+        self.store_path: Path = Path(store_path) if store_path is not None else DEFAULT_STORE_PATH
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection: sqlite3.Connection = sqlite3.connect(self.store_path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> 'IntervalStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def ingest(self, csv_file_name: str) -> IngestResult:
+        """
+        Add a downloaded usage csv's intervals.  Intervals already in the store keep their original values.
+        """
+        try:
+            content_hash: str = hash_file(csv_file_name)
+            if self.connection.execute('SELECT 1 FROM sources WHERE sha256 = ?', (content_hash,)).fetchone():
+                return IngestResult(csv_file_name, 'skipped', 0, 0, 0, 'Already ingested.')
+            usage, unmatched = load_usage_intervals(csv_file_name)
+        except (OSError, ValueError) as error:
+            return IngestResult(csv_file_name, 'failed', 0, 0, 0, str(error))
+
+        with self.connection:
+            source: int = self.connection.execute(
+                'INSERT INTO sources (path, sha256, ingested, intervals, added) VALUES (?, ?, ?, ?, 0)',
+                (str(Path(csv_file_name).resolve()), content_hash, datetime.now().isoformat(timespec='seconds'),
+                 len(usage.timestamps))).lastrowid
+            changes: int = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO intervals (meter, timestamp, utc_offset, consumed, generated, demand, source) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                zip(usage.meters.tolist(), usage.timestamps.tolist(), usage.utc_offsets.tolist(),
+                    usage.consumed.tolist(), usage.generated.tolist(), usage.demand.tolist(),
+                    [source] * len(usage.timestamps)))
+            added: int = self.connection.total_changes - changes
+            self.connection.execute('UPDATE sources SET added = ? WHERE id = ?', (added, source))
+
+        message: str = f'{len(unmatched)} unmatched intervals were left out.' if unmatched else ''
+        return IngestResult(csv_file_name, 'ingested', len(usage.timestamps), added, len(unmatched), message)
+
+    def load_usage(self, start: Optional[date] = None, end: Optional[date] = None,
+                   meter: Optional[int] = None) -> UsageArrays:
+        """
+        Return intervals from start through end, ordered by time (UTC, so the repeated 1 AM hour is in order) then
+        meter.
+
+        Timestamps are interval starts (see tou_engine.INTERVAL_SECONDS), so a day's intervals run from its 12:00 AM
+        reading through its 11:45 PM reading.
+        """
+        conditions: list[str] = []
+        parameters: list[int] = []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(day_to_timestamp(start))
+        if end is not None:
+            conditions.append('timestamp < ?')
+            parameters.append(day_to_timestamp(end + timedelta(days=1)))
+        if meter is not None:
+            conditions.append('meter = ?')
+            parameters.append(meter)
+        where: str = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+        rows: list[tuple] = self.connection.execute(
+            f'SELECT timestamp, meter, consumed, generated, demand, utc_offset FROM intervals {where} '
+            'ORDER BY timestamp - utc_offset, meter', parameters).fetchall()
+        # NULL demand comes back as None, which numpy stores as NaN.
+        records: np.ndarray = np.array(rows, dtype=INTERVAL_DTYPE)
+        return UsageArrays(records['timestamp'], records['meter'], records['consumed'], records['generated'],
+                           records['demand'], records['utc_offset'])
+
+    def sources(self) -> list[tuple]:
+        """
+        Return (path, ingested, intervals, added) for each ingested file, oldest first.
+        """
+        return self.connection.execute('SELECT path, ingested, intervals, added FROM sources ORDER BY id').fetchall()
+
+
+def ingest_paths(paths: list[str], store_path: Optional[str] = None) -> int:
+    """
+    Ingest every usage csv in paths (files or directories) and print a line per file.
+
+    Returns the number of files that failed.
+    """
+    csv_files: list[str] = []
+    for path in map(Path, paths):
+        csv_files.extend(map(str, find_usage_files(path)) if path.is_dir() else [str(path)])
+
+    results: list[IngestResult] = []
+    with IntervalStore(store_path) as store:
+        for csv_file_name in csv_files:
+            result: IngestResult = store.ingest(csv_file_name)
+            results.append(result)
+            line: str = f'{result.status.upper():9}{csv_file_name}'
+            if result.status == 'ingested':
+                line += f': {result.added} of {result.intervals} intervals added'
+            if result.message:
+                line += f'  ({result.message})'
+            print(line)
+
+    counts: dict[str, int] = {status: sum(result.status == status for result in results)
+                              for status in ('ingested', 'failed', 'skipped')}
+    print(f'{len(results)} files: {counts["ingested"]} ingested, {counts["failed"]} failed, {counts["skipped"]} skipped.')
+    return counts['failed']
+
+
+def write_report(xlsx_file_name: str, store_path: Optional[str] = None, start: Optional[date] = None,
+                 end: Optional[date] = None, meter: Optional[int] = None, streaming: bool = False,
+                 output_format: Optional[str] = None, rollups: Optional[list[str]] = None,
+                 intervals: bool = True) -> bool:
+    """
+    Create the pseg_parse workbook (or another output_writers format) for a date range of stored intervals.
+
+    Returns False if there are no intervals in the range.  Problems are printed.
+    """
+    with IntervalStore(store_path) as store:
+        usage: UsageArrays = store.load_usage(start, end, meter)
+    if len(usage.timestamps) == 0:
+        print('No stored intervals in that date range!')
+        return False
+    return write_usage(usage, xlsx_file_name, output_format,
+                       {'streaming': streaming, 'rollups': rollups or [], 'intervals': intervals})
@@ -0,0 +1,55 @@
+"""
+interval_table.py
+
+Parsed intervals as one in-memory table that every stage after parsing reads.
+
+IntervalTable is a UsageArrays (times, meters, kWh and kW in NumPy arrays, about 44 bytes per interval), so it can
+be passed anywhere UsageArrays can.  It adds each rate plan's period codes, classified the first time a stage asks for
+them and then shared by the workbook, the other output formats, totals, rollups and plan comparisons.
+"""
+
+from typing import Optional
+from datetime import datetime
+import numpy as np
+from tou_engine import UsageArrays
+from rate_schedules import classify_rate
+
+
+class IntervalTable(UsageArrays):
+    """
+    UsageArrays with per-plan period codes.  Make one with as_interval_table.
+    """
+
+    def periods(self, rate: str) -> np.ndarray:
+        """
+        Return the uint8 period code of every interval under RATE_SCHEDULES[rate], classifying them the first time.
+        """
+        # NamedTuple subclasses without __slots__ have a __dict__, which holds the codes.
+        codes: dict[str, np.ndarray] = self.__dict__.setdefault('period_codes', {})
+        periods: Optional[np.ndarray] = codes.get(rate)
+        if periods is None:
+            periods = codes[rate] = classify_rate(rate, self.timestamps)
+        return periods
+
+    def select(self, rows: np.ndarray) -> 'IntervalTable':
+        """
+        Return the intervals picked by rows (a boolean mask or indexes) as a new table, with the period codes
+        classified so far.
+        """
+        table: IntervalTable = IntervalTable(*(np.asarray(column)[rows] for column in self))
+        table.__dict__['period_codes'] = {rate: periods[rows]
+                                          for rate, periods in self.__dict__.get('period_codes', {}).items()}
+        return table
+
+    def get_datetimes(self, start: int = 0, stop: Optional[int] = None) -> list[datetime]:
+        """
+        Return the times of intervals start through stop - 1 as naive datetimes, converted in one call.
+        """
+        return np.asarray(self.timestamps[start:stop]).astype('datetime64[s]').tolist()
+
+
+def as_interval_table(usage: UsageArrays) -> IntervalTable:
+    """
+    Return usage as an IntervalTable, sharing its arrays.  A table is returned as is, keeping its period codes.
+    """
+    return usage if isinstance(usage, IntervalTable) else IntervalTable(*usage)
@@ -0,0 +1,324 @@
+"""
+output_writers.py
+
+Output formats for parsed usage data.
+
+The xlsx format is usage_workbook's TOU usage workbook, and xlsx-compact is the same workbook with a period code column
+per plan in place of the repeated kWh columns.  The other formats are for scripts: they write whole arrays at once,
+one row per interval with its rate 194 and 195 periods (csv, npz, parquet), or per-meter totals (json).
+Format modules such as xlsxwriter and pyarrow are only imported when that format is written.
+
+Rollups (see usage_rollups.py) are extra sheets in the workbook formats.  Other formats write each rollup next to
+the output file, e.g. 'usage-daily.csv' for 'usage.csv'.
+"""
+
+from typing import Callable, NamedTuple, Optional, TypedDict
+import json
+from pathlib import Path
+import numpy as np
+from tou_engine import UsageArrays
+from rate_schedules import PERIOD_NAMES, RATE_SCHEDULES
+from interval_table import IntervalTable, as_interval_table
+from usage_rollups import ROLLUP_COLUMNS, UsageRollup, compute_rollup
+from usage_workbook import write_usage_workbook
+import profiling
+
+# Rate plans with a period column in the row-per-interval formats.
+PERIOD_COLUMN_RATES: list[str] = ['194', '195']
+DEFAULT_OUTPUT_FORMAT: str = 'xlsx'
+
+
+class OutputOptions(TypedDict, total=False):
+    streaming: bool         # Flush workbook rows as they are written.  Only used by the workbook formats.
+    rollups: list[str]      # usage_rollups.ROLLUP_SECONDS names to write as well
+    intervals: bool         # Write the interval rows (or json summary).  Defaults to True.
+
+
+# Writers take (usage, output file name, options) and return False if the output couldn't be written.
+UsageWriter = Callable[[UsageArrays, str, OutputOptions], bool]
+# Column writers write named, equal length arrays to a file.
+ColumnWriter = Callable[[str, dict[str, np.ndarray]], None]
+
+
+class OutputFormat(NamedTuple):
+    name: str
+    extensions: tuple[str, ...]     # Lower case, with the dot
+    writer: UsageWriter
+
+
+OUTPUT_FORMATS: dict[str, OutputFormat] = {}
+
+
+def register_output_format(name: str, extensions: tuple[str, ...], writer: UsageWriter) -> None:
+    """
+    Add or replace an output format.  Extensions are used to pick the format from the output file name.
+    """
+    OUTPUT_FORMATS[name] = OutputFormat(name, extensions, writer)
+
+
+def get_output_format(file_name: str, name: Optional[str] = None) -> OutputFormat:
+    """
+    Return the format called name, or the format for file_name's extension.  Other extensions get the workbook.
+    """
+    if name is not None:
+        if name not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format {name!r}.  Choose from {", ".join(OUTPUT_FORMATS)}.')
+        return OUTPUT_FORMATS[name]
+
+    extension: str = Path(file_name).suffix.lower()
+    for output_format in OUTPUT_FORMATS.values():
+        if extension in output_format.extensions:
+            return output_format
+    return OUTPUT_FORMATS[DEFAULT_OUTPUT_FORMAT]
+
+
+def write_usage(usage: UsageArrays, file_name: str, format_name: Optional[str] = None,
+                options: Optional[OutputOptions] = None) -> bool:
+    """
+    Write usage to file_name in the named format, or the format for its extension.  Problems are printed.
+
+    usage is made an IntervalTable first, so the writer and its rollups classify each plan only once.
+    """
+    options = options or {}
+    if not options.get('intervals', True) and not options.get('rollups'):
+        print('Nothing to write: interval rows are turned off and no rollups were requested.')
+        return False
+    try:
+        output_format: OutputFormat = get_output_format(file_name, format_name)
+    except ValueError as error:
+        print(error)
+        return False
+    return output_format.writer(as_interval_table(usage), file_name, options)
+
+
+def get_period_columns(usage: UsageArrays) -> dict[str, np.ndarray]:
+    """
+    Return period codes for each rate in PERIOD_COLUMN_RATES, keyed by column name.
+    """
+    with profiling.stage('classify'):
+        columns: dict[str, np.ndarray] = {f'period_{rate}': as_interval_table(usage).periods(rate)
+                                          for rate in PERIOD_COLUMN_RATES}
+        profiling.count(rows=len(PERIOD_COLUMN_RATES) * len(usage.timestamps))
+    return columns
+
+
+def get_interval_columns(usage: UsageArrays) -> dict[str, np.ndarray]:
+    """
+    Return the row-per-interval columns.  Times are local, as read from the csv, and utc_offset (seconds) tells
+    apart the two 1 AM hours when DST ends.
+    """
+    columns: dict[str, np.ndarray] = {
+        'time': np.asarray(usage.timestamps).astype('datetime64[s]'),
+        'utc_offset': np.asarray(usage.utc_offsets),
+        'meter': np.asarray(usage.meters),
+        'consumed': np.asarray(usage.consumed),
+        'generated': np.asarray(usage.generated),
+        'demand': np.asarray(usage.demand),
+    }
+    columns.update(get_period_columns(usage))
+    return columns
+
+
+def get_rollup_columns(rollup: UsageRollup) -> dict[str, np.ndarray]:
+    """
+    Return a rollup's columns, named as in ROLLUP_COLUMNS.  Bucket starts are local times, and utc_offset (seconds)
+    tells apart the two 1 AM hours when DST ends, as in the interval columns.
+    """
+    columns: dict[str, np.ndarray] = dict(zip(ROLLUP_COLUMNS, rollup))
+    columns['start'] = columns['start'].astype('datetime64[s]')
+    return columns
+
+
+def get_rollup_file_name(file_name: str, rollup: str) -> str:
+    """
+    Return the file a rollup is written to for output file_name ('usage.csv' -> 'usage-daily.csv').
+    """
+    path: Path = Path(file_name)
+    return str(path.with_name(f'{path.stem}-{rollup}{path.suffix}'))
+
+
+def write_columns_format(usage: UsageArrays, file_name: str, options: OutputOptions, write_columns: ColumnWriter,
+                         interval_columns: Optional[Callable[[UsageArrays], dict[str, np.ndarray]]] = None) -> bool:
+    """
+    Write the interval columns to file_name and each requested rollup to its own file with write_columns.
+    """
+    if options.get('intervals', True):
+        columns: dict[str, np.ndarray] = (interval_columns or get_interval_columns)(usage)
+        with profiling.stage('write_cells'):
+            write_columns(file_name, columns)
+            profiling.count(rows=len(usage.timestamps), cells=len(usage.timestamps) * len(columns))
+
+    for rollup in options.get('rollups', []):
+        with profiling.stage(f'{rollup}_rollup'):
+            table: UsageRollup = compute_rollup(usage, rollup)
+            profiling.count(rows=len(table.starts))
+        with profiling.stage('write_cells'):
+            columns = get_rollup_columns(table)
+            write_columns(get_rollup_file_name(file_name, rollup), columns)
+            profiling.count(rows=len(table.starts), cells=len(table.starts) * len(columns))
+    return True
+
+
+def write_xlsx(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write the TOU usage workbook.
+    """
+    return write_usage_workbook(usage, file_name, options.get('streaming', False), 'full',
+                                options.get('rollups', []), options.get('intervals', True))
+
+
+def write_compact_xlsx(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write the TOU usage workbook in the compact layout, with one period code column per plan.
+    """
+    return write_usage_workbook(usage, file_name, options.get('streaming', False), 'compact',
+                                options.get('rollups', []), options.get('intervals', True))
+
+
+def format_text_column(column: np.ndarray) -> np.ndarray:
+    """
+    Convert a column to strings for csv: ISO times, and blanks for NaN.
+    """
+    text: np.ndarray = column.astype(str)
+    if column.dtype.kind == 'f':
+        text = np.where(np.isnan(column), '', text)
+    return text
+
+
+def write_csv_columns(file_name: str, columns: dict[str, np.ndarray]) -> None:
+    """
+    Write columns as csv with a header line.
+    """
+    text_columns: list[np.ndarray] = [format_text_column(column) for column in columns.values()]
+    lines: np.ndarray = text_columns[0]
+    for column in text_columns[1:]:
+        lines = np.char.add(np.char.add(lines, ','), column)
+    with open(file_name, 'w', newline='') as csv_file:
+        csv_file.write(','.join(columns) + '\n')
+        if len(lines):
+            csv_file.write('\n'.join(lines.tolist()) + '\n')
+
+
+def get_csv_interval_columns(usage: UsageArrays) -> dict[str, np.ndarray]:
+    """
+    Interval columns with period names in place of period codes.
+    """
+    columns: dict[str, np.ndarray] = get_interval_columns(usage)
+    period_names: np.ndarray = np.array([PERIOD_NAMES[code] for code in sorted(PERIOD_NAMES)])
+    for rate in PERIOD_COLUMN_RATES:
+        columns[f'period_{rate}'] = period_names[columns[f'period_{rate}']]
+    return columns
+
+
+def write_csv(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write one line per interval: ISO time, UTC offset, meter, consumed and generated kWh, kW demand and period names.
+    """
+    return write_columns_format(usage, file_name, options, write_csv_columns, get_csv_interval_columns)
+
+
+def write_npz_columns(file_name: str, columns: dict[str, np.ndarray]) -> None:
+    """
+    Write columns as a numpy .npz archive with one array per column.
+    """
+    # Pass a file so savez doesn't add .npz to other names.
+    with open(file_name, 'wb') as npz_file:
+        np.savez(npz_file, **columns)
+
+
+def write_npz(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write a numpy .npz archive with one array per column.  Times are datetime64[s] local times.
+    """
+    return write_columns_format(usage, file_name, options, write_npz_columns)
+
+
+def write_parquet(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write a Parquet file with one column per interval field.  Requires pyarrow.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        print('Parquet output requires pyarrow (pip install pyarrow).  Use npz for a numpy archive instead.')
+        return False
+
+    def write_parquet_columns(parquet_file_name: str, columns: dict[str, np.ndarray]) -> None:
+        pyarrow.parquet.write_table(pyarrow.table(columns), parquet_file_name)
+
+    return write_columns_format(usage, file_name, options, write_parquet_columns)
+
+
+def summarize_usage(usage: UsageArrays) -> list[dict]:
+    """
+    Return per-meter totals, with consumed and generated kWh for each period of each rate in RATE_SCHEDULES.
+    """
+    table: IntervalTable = as_interval_table(usage)
+    timestamps: np.ndarray = np.asarray(table.timestamps)
+    meters: np.ndarray = np.asarray(table.meters)
+    consumed: np.ndarray = np.asarray(table.consumed)
+    generated: np.ndarray = np.asarray(table.generated)
+    demand: np.ndarray = np.asarray(table.demand)
+    periods: dict[str, np.ndarray] = {rate: table.periods(rate) for rate in RATE_SCHEDULES}
+
+    summary: list[dict] = []
+    for meter in np.unique(meters).tolist():
+        selected: np.ndarray = meters == meter
+        plans: dict[str, dict] = {}
+        for rate, rate_periods in periods.items():
+            meter_periods: np.ndarray = rate_periods[selected]
+            consumed_totals: np.ndarray = np.bincount(meter_periods, weights=consumed[selected], minlength=len(PERIOD_NAMES))
+            generated_totals: np.ndarray = np.bincount(meter_periods, weights=generated[selected], minlength=len(PERIOD_NAMES))
+            plans[rate] = {
+                PERIOD_NAMES[code]: {'consumed': round(float(consumed_totals[code]), 3),
+                                     'generated': round(float(generated_totals[code]), 3)}
+                for code in np.unique(meter_periods).tolist()
+            }
+        summary.append({
+            'meter': meter,
+            'start': str(timestamps[selected].min().astype('datetime64[s]')),
+            'end': str(timestamps[selected].max().astype('datetime64[s]')),
+            'intervals': int(selected.sum()),
+            'consumed': round(float(consumed[selected].sum()), 3),
+            'generated': round(float(generated[selected].sum()), 3),
+            'net': round(float(consumed[selected].sum() + generated[selected].sum()), 3),
+            'peak_demand': None if np.isnan(demand[selected]).all() else float(np.nanmax(demand[selected])),
+            'plans': plans,
+        })
+    return summary
+
+
+def write_json_columns(file_name: str, columns: dict[str, np.ndarray]) -> None:
+    """
+    Write columns as a JSON list of records, with null for NaN.
+    """
+    values: list[list] = [format_text_column(column).tolist() if column.dtype.kind == 'M' else column.tolist()
+                          for column in columns.values()]
+    records: list[dict] = [{name: None if value != value else value for name, value in zip(columns, row)}
+                           for row in zip(*values)]
+    with open(file_name, 'w') as json_file:
+        json.dump(records, json_file, indent=2)
+        json_file.write('\n')
+
+
+def write_json(usage: UsageArrays, file_name: str, options: OutputOptions) -> bool:
+    """
+    Write per-meter totals from summarize_usage as JSON, and rollups as lists of records.
+    """
+    if options.get('intervals', True):
+        with profiling.stage('write_cells'):
+            summary: list[dict] = summarize_usage(usage)
+            with open(file_name, 'w') as json_file:
+                json.dump(summary, json_file, indent=2)
+                json_file.write('\n')
+            profiling.count(rows=len(usage.timestamps))
+    return write_columns_format(usage, file_name, {**options, 'intervals': False}, write_json_columns)
+
+
+register_output_format('xlsx', ('.xlsx',), write_xlsx)
+register_output_format('xlsx-compact', (), write_compact_xlsx)
+register_output_format('csv', ('.csv',), write_csv)
+register_output_format('npz', ('.npz',), write_npz)
+register_output_format('parquet', ('.parquet',), write_parquet)
+register_output_format('json', ('.json',), write_json)
@@ -0,0 +1,210 @@
+"""
+parallel_parse.py
+
+Parse one large PSEG usage CSV in a process pool.
+
+The file is split into byte ranges that start on an interval boundary (a line whose meter and time differ from the
+line before it), so a consumed row and its generated row land in the same range.  Each worker counts its lines, then
+reads and joins its range with the same tou_engine functions as the serial parse.  The chunks are concatenated in
+file order, which keeps the arrays in consumed-row order.
+
+Results, unmatched intervals and error messages (including line numbers) are the same as
+tou_engine.load_usage_intervals.  When a chunk's result could depend on rows in another chunk (an interval whose rows
+are in more than one range, or a bad time, whose message depends on every time in the file), the file is parsed
+serially instead.  Quoted fields with line breaks aren't supported; PSEG downloads don't have them.
+"""
+
+from typing import NamedTuple, Optional
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from csv import reader
+import numpy as np
+from tou_engine import (UnmatchedInterval, UsageArrays, UsageRows, join_usage_rows, load_usage_intervals,
+                        get_utc_offsets, parse_kw, parse_kwh, parse_timestamps, read_usage_header, read_usage_rows)
+import profiling
+
+# Smaller chunks spend more time starting workers than parsing.
+MIN_CHUNK_BYTES: int = 4 * 1024 * 1024
+
+# Error stages, in the order the serial parse raises them.
+LABEL_ERROR: int = 0
+TIME_ERROR: int = 1
+CONSUMED_ERROR: int = 2
+GENERATED_ERROR: int = 3
+DEMAND_ERROR: int = 4
+
+# Time and meter number of a data line.  PSEG downloads quote every field, so the quotes are optional.
+INTERVAL_KEY = re.compile(rb'"?([^,"]*)"?,"?Meter #(\d+)')
+
+
+class ChunkTask(NamedTuple):
+    csv_file_name: str
+    start: int              # Byte offset of the first line
+    end: int                # Byte offset after the last line
+    line_offset: int        # Lines before the chunk
+    kwh_col: int
+    kw_col: Optional[int]
+
+
+class ChunkResult(NamedTuple):
+    usage: Optional[UsageArrays]
+    unmatched: list[UnmatchedInterval]
+    key_meters: np.ndarray          # int64, meter of every matched and unmatched interval in the chunk
+    key_timestamps: np.ndarray      # int64, time of every matched and unmatched interval in the chunk
+    error_stage: Optional[int]
+    error: str
+
+
+def get_interval_key(line: bytes) -> bytes:
+    """
+    Return the time and meter number of a data line, or the whole line if it isn't one.  A consumed row and its
+    generated row have the same key, so a change of key is the start of an interval.
+    """
+    match: Optional[re.Match] = INTERVAL_KEY.match(line)
+    return match.group(1) + b',' + match.group(2) if match else line
+
+
+def split_file(csv_file_name: str, chunks: int) -> list[tuple[int, int]]:
+    """
+    Return (start, end) byte ranges of up to chunks pieces of the data rows, each starting on an interval boundary.
+    """
+    size: int = os.path.getsize(csv_file_name)
+    with open(csv_file_name, 'rb') as csv_file:
+        header_length: int = len(csv_file.readline())
+        boundaries: list[int] = [header_length]
+        step: int = (size - header_length) // chunks
+        for chunk in range(1, chunks):
+            boundary: int = find_interval_start(csv_file, max(header_length + chunk * step, boundaries[-1]), size)
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def find_interval_start(csv_file, offset: int, size: int) -> int:
+    """
+    Return the byte offset of the first line after offset whose interval differs from the line before it, or size
+    if there isn't one.
+    """
+    # Reading from offset - 1 finishes the line offset is in.  If offset starts a line, this reads just the newline.
+    csv_file.seek(offset - 1)
+    position: int = offset - 1 + len(csv_file.readline())
+    previous_key: Optional[bytes] = None
+    while True:
+        line: bytes = csv_file.readline()
+        if not line:
+            return size
+        key: bytes = get_interval_key(line)
+        if previous_key is not None and key != previous_key:
+            return position
+        previous_key = key
+        position += len(line)
+
+
+def count_lines(csv_file_name: str, start: int, end: int) -> int:
+    """
+    Return the number of newlines from start to end.
+    """
+    with open(csv_file_name, 'rb') as csv_file:
+        csv_file.seek(start)
+        return csv_file.read(end - start).count(b'\n')
+
+
+def parse_chunk(task: ChunkTask) -> ChunkResult:
+    """
+    Read and join the rows in one byte range.  Errors are returned with their stage rather than raised.
+    """
+    with open(task.csv_file_name, 'rb') as csv_file:
+        csv_file.seek(task.start)
+        data: bytes = csv_file.read(task.end - task.start)
+    empty: np.ndarray = np.empty(0, dtype=np.int64)
+
+    # Decoded the same way open() decodes the serial parse.
+    with io.TextIOWrapper(io.BytesIO(data), newline='') as text:
+        try:
+            rows: UsageRows = read_usage_rows(reader(text), task.kwh_col, task.kw_col, task.line_offset)
+        except ValueError as error:
+            return ChunkResult(None, [], empty, empty, LABEL_ERROR, str(error))
+
+    joined, unmatched = join_usage_rows(rows)
+    try:
+        timestamps: np.ndarray = parse_timestamps(joined.times)
+        unmatched_timestamps: np.ndarray = parse_timestamps([interval.time for interval in unmatched])
+    except ValueError as error:
+        return ChunkResult(None, [], empty, empty, TIME_ERROR, str(error))
+    key_meters: np.ndarray = np.concatenate([np.asarray(joined.meters, dtype=np.int64),
+                                             np.asarray([interval.meter for interval in unmatched], dtype=np.int64)])
+    key_timestamps: np.ndarray = np.concatenate([timestamps, unmatched_timestamps])
+
+    stage: int = CONSUMED_ERROR
+    try:
+        consumed: np.ndarray = parse_kwh(joined.consumed, joined.consumed_lines)
+        stage = GENERATED_ERROR
+        generated: np.ndarray = parse_kwh(joined.generated, joined.generated_lines)
+        stage = DEMAND_ERROR
+        demand: np.ndarray = parse_kw(joined.demand, joined.consumed_lines)
+    except ValueError as error:
+        return ChunkResult(None, unmatched, key_meters, key_timestamps, stage, str(error))
+
+    usage: UsageArrays = UsageArrays(timestamps, np.asarray(joined.meters, dtype=np.int64), consumed, generated, demand,
+                                     get_utc_offsets(timestamps, np.asarray(joined.folds, dtype=np.int8)))
+    return ChunkResult(usage, unmatched, key_meters, key_timestamps, None, '')
+
+
+def has_split_intervals(results: list[ChunkResult]) -> bool:
+    """
+    Returns True if any (meter, time) appears in more than one chunk.
+    """
+    meters: np.ndarray = np.concatenate([result.key_meters for result in results])
+    timestamps: np.ndarray = np.concatenate([result.key_timestamps for result in results])
+    chunks: np.ndarray = np.concatenate([np.full(len(result.key_meters), index) for index, result in enumerate(results)])
+    order: np.ndarray = np.lexsort((chunks, timestamps, meters))
+    meters, timestamps, chunks = meters[order], timestamps[order], chunks[order]
+    return bool(np.any((meters[1:] == meters[:-1]) & (timestamps[1:] == timestamps[:-1]) & (chunks[1:] != chunks[:-1])))
+
+
+def load_usage_intervals_parallel(csv_file_name: str,
+                                  jobs: Optional[int] = None) -> tuple[UsageArrays, list[UnmatchedInterval]]:
+    """
+    tou_engine.load_usage_intervals using up to jobs worker processes (default: one per CPU).
+
+    Files too small to give each worker MIN_CHUNK_BYTES are parsed serially.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    chunks: int = min(jobs, os.path.getsize(csv_file_name) // MIN_CHUNK_BYTES)
+    if chunks < 2:
+        return load_usage_intervals(csv_file_name)
+
+    with open(csv_file_name, newline='') as csv_file:
+        kwh_col, kw_col = read_usage_header(reader(io.StringIO(csv_file.readline())))
+    ranges: list[tuple[int, int]] = split_file(csv_file_name, chunks)
+    if len(ranges) < 2:
+        return load_usage_intervals(csv_file_name)
+    profiling.count(chunks=len(ranges))
+
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        line_counts: list[int] = list(executor.map(count_lines, [csv_file_name] * len(ranges), *zip(*ranges)))
+        line_offsets: list[int] = np.cumsum([1] + line_counts[:-1]).tolist()
+        results: list[ChunkResult] = list(executor.map(parse_chunk, [
+            ChunkTask(csv_file_name, start, end, line_offset, kwh_col, kw_col)
+            for (start, end), line_offset in zip(ranges, line_offsets)]))
+
+    # The serial parse stops at the first bad row in the file, before any joining.
+    label_errors: list[str] = [result.error for result in results if result.error_stage == LABEL_ERROR]
+    if label_errors:
+        raise ValueError(label_errors[0])
+    # Joining or reporting these needs the whole file, which is rare enough to just parse it again serially.
+    if any(result.error_stage == TIME_ERROR for result in results) or has_split_intervals(results):
+        return load_usage_intervals(csv_file_name)
+    failed: list[ChunkResult] = [result for result in results if result.error_stage is not None]
+    if failed:
+        # Stages are raised in order, and within a stage the first chunk has the first bad value.
+        raise ValueError(min(failed, key=lambda result: result.error_stage).error)
+
+    usage: UsageArrays = UsageArrays(*(np.concatenate(column) for column in zip(*(result.usage for result in results))))
+    unmatched: list[UnmatchedInterval] = sorted(interval for result in results for interval in result.unmatched)
+    return usage, unmatched
@@ -0,0 +1,145 @@
+"""
+profiling.py
+
+Opt-in per-stage wall time and counters for pseg_parse and the border helpers.
+
+Code marks stages with 'with profiling.stage(name):' and reports work done with profiling.count(rows=..., cells=...).
+Nothing is measured until a hook is subscribed with add_hook (or a Profiler is entered).  Until then stage() returns
+a shared no-op context manager and count() returns immediately, so instrumented code pays one function call per
+stage rather than per cell.
+"""
+
+from typing import Callable, Optional, TextIO, TypedDict
+import json
+import sys
+import time
+from contextlib import nullcontext
+
+# Counters every stage reports, in table column order.
+STANDARD_COUNTERS: list[str] = ['rows', 'cells', 'formats']
+
+
+class StageProfile(TypedDict):
+    stage: str
+    seconds: float
+    counters: dict[str, int]    # 'rows', 'cells' and 'formats' (formats added to the workbook), plus any others
+
+
+StageHook = Callable[[StageProfile], None]
+
+_hooks: list[StageHook] = []
+_active: list[StageProfile] = []
+_NO_STAGE = nullcontext()
+
+
+def add_hook(hook: StageHook) -> None:
+    """
+    Call hook with a StageProfile each time a stage finishes.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: StageHook) -> None:
+    """
+    Stop calling a hook added with add_hook.
+    """
+    _hooks.remove(hook)
+
+
+def is_enabled() -> bool:
+    """
+    Returns True if any hook is subscribed.
+    """
+    return bool(_hooks)
+
+
+def stage(name: str, workbook=None):
+    """
+    Context manager timing a stage.  With workbook, formats added to it during the stage are counted.
+    """
+    if not _hooks:
+        return _NO_STAGE
+    return _Stage(name, workbook)
+
+
+def count(**counters: int) -> None:
+    """
+    Add to counters of the innermost running stage, e.g. count(rows=2880, cells=46080).
+    """
+    if not _active:
+        return
+    totals: dict[str, int] = _active[-1]['counters']
+    for counter, amount in counters.items():
+        totals[counter] = totals.get(counter, 0) + amount
+
+
+class _Stage:
+    """
+    Running stage.  If stages are nested, counts go to the innermost one.
+    """
+
+    def __init__(self, name: str, workbook):
+        self.profile: StageProfile = {'stage': name, 'seconds': 0.0, 'counters': dict.fromkeys(STANDARD_COUNTERS, 0)}
+        self.workbook = workbook
+        self.formats: int = 0
+        self.started: float = 0.0
+
+    def __enter__(self) -> StageProfile:
+        if self.workbook is not None:
+            self.formats = len(self.workbook.formats)
+        _active.append(self.profile)
+        self.started = time.perf_counter()
+        return self.profile
+
+    def __exit__(self, *exc_info) -> None:
+        self.profile['seconds'] = time.perf_counter() - self.started
+        _active.remove(self.profile)
+        if self.workbook is not None:
+            self.profile['counters']['formats'] += len(self.workbook.formats) - self.formats
+        for hook in list(_hooks):
+            hook(self.profile)
+
+
+class Profiler:
+    """
+    Hook that collects finished stages.  Use as a context manager to subscribe for the duration of a block.
+    """
+
+    def __init__(self):
+        self.stages: list[StageProfile] = []
+
+    def __call__(self, profile: StageProfile) -> None:
+        self.stages.append(profile)
+
+    def __enter__(self) -> 'Profiler':
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        remove_hook(self)
+
+    def print_table(self, output: Optional[TextIO] = None) -> None:
+        """
+        Print one line per stage with its time and counters, then a total line.
+        """
+        output = output or sys.stdout
+        extra: list[str] = sorted({counter for profile in self.stages for counter in profile['counters']}
+                                  - set(STANDARD_COUNTERS))
+        columns: list[str] = STANDARD_COUNTERS + extra
+        # Long counter names get wider columns, so they stay apart.
+        widths: list[int] = [max(12, len(column) + 2) for column in columns]
+        print(f'{"Stage":16}{"Seconds":>10}' + ''.join(f'{column:>{width}}' for column, width in zip(columns, widths)),
+              file=output)
+        for profile in self.stages:
+            print(f'{profile["stage"]:16}{profile["seconds"]:10.4f}'
+                  + ''.join(f'{profile["counters"].get(column, 0):{width}}' for column, width in zip(columns, widths)),
+                  file=output)
+        print(f'{"total":16}{sum(profile["seconds"] for profile in self.stages):10.4f}', file=output)
+
+    def write_json(self, json_file_name: str) -> None:
+        """
+        Write the collected stages as a JSON list.
+        """
+        with open(json_file_name, 'w') as json_file:
+            json.dump(self.stages, json_file, indent=2)
+            json_file.write('\n')
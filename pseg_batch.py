@@ -0,0 +1,159 @@
+"""
+pseg_batch.py
+
+Convert a directory of PSEG downloaded usage files on a pool of worker processes.
+"""
+
+from typing import NamedTuple, Optional
+import io
+import os
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from pseg_parse import pseg_parse
+from usage_check import CheckReport, check_usage_file, format_problem_counts
+
+# Generated files are named like 'PSEG Bills/Parsed/2025-07-17 to 2025-08-15--TOU Usage Detail.xlsx' for
+# 'PSEG Bills/Downloaded Usage/2025-07-17 to 2025-08-15--PSEGLI Usage.csv'.
+NAME_SEPARATOR: str = '--'
+OUTPUT_SUFFIX: str = 'TOU Usage Detail.xlsx'
+DEFAULT_OUTPUT_DIR_NAME: str = 'Parsed'
+
+
+class BatchResult(NamedTuple):
+    csv_path: Path
+    xlsx_path: Path
+    status: str         # 'ok', 'failed' or 'skipped'
+    message: str
+
+
+def find_usage_files(directory: Path) -> list[Path]:
+    """
+    Return every csv file under directory, sorted by path.
+    """
+    return sorted(path for path in directory.rglob('*') if path.is_file() and path.suffix.lower() == '.csv')
+
+
+def get_output_name(csv_path: Path) -> str:
+    """
+    Derive the Excel file name from the billing period at the start of the csv name.
+    """
+    period, separator, _ = csv_path.stem.partition(NAME_SEPARATOR)
+    return f'{period if separator else csv_path.stem}{NAME_SEPARATOR}{OUTPUT_SUFFIX}'
+
+
+def get_output_dir(directory: Path, output_dir: Optional[str]) -> Path:
+    """
+    Return output_dir if given, otherwise 'Parsed' next to directory (e.g. 'PSEG Bills/Parsed').
+    """
+    if output_dir is not None:
+        return Path(output_dir)
+    return directory.resolve().parent / DEFAULT_OUTPUT_DIR_NAME
+
+
+def is_up_to_date(csv_path: Path, xlsx_path: Path) -> bool:
+    """
+    Returns True if xlsx_path exists and is newer than csv_path.
+    """
+    return xlsx_path.exists() and xlsx_path.stat().st_mtime > csv_path.stat().st_mtime
+
+
+def warm_up_worker() -> None:
+    """
+    Pool initializer, or start-up step for long-running modes: import what writing a workbook needs before the first
+    file arrives.
+    """
+    import xlsxwriter
+    import xlsx_streaming
+    import set_outer_border_for_range_xlsx
+
+
+def handle_sigterm(signum, frame) -> None:
+    """
+    Stop a long-running mode (watch or serve) on SIGTERM, e.g. from a service manager, the same way as Ctrl+C.
+    """
+    raise KeyboardInterrupt
+
+
+def convert_usage_file(csv_path: Path, xlsx_path: Path, streaming: bool = False,
+                       cache_dir: Optional[str] = None, check: bool = False) -> BatchResult:
+    """
+    Run pseg_parse on one file, capturing what it prints so results from parallel workers don't interleave.
+    With check, a file with any usage_check problems fails without being converted.
+    """
+    output: io.StringIO = io.StringIO()
+    try:
+        if check:
+            report: CheckReport = check_usage_file(str(csv_path))
+            if report.problems:
+                return BatchResult(csv_path, xlsx_path, 'failed', format_problem_counts(report))
+        with redirect_stdout(output):
+            converted: bool = pseg_parse(str(csv_path), str(xlsx_path), streaming, cache_dir)
+    except Exception as error:
+        return BatchResult(csv_path, xlsx_path, 'failed', f'{type(error).__name__}: {error}')
+
+    message: str = ' '.join(output.getvalue().split())
+    return BatchResult(csv_path, xlsx_path, 'ok' if converted else 'failed', message)
+
+
+def run_batch(directory: str, output_dir: Optional[str] = None, jobs: Optional[int] = None, force: bool = False,
+              streaming: bool = False, cache_dir: Optional[str] = None, check: bool = False) -> int:
+    """
+    Convert every usage csv under directory and print a per-file summary.  With check, files with problems (see
+    usage_check) aren't converted.
+
+    Returns the number of files that failed.
+    """
+    input_dir: Path = Path(directory)
+    if not input_dir.is_dir():
+        print(f'{directory} is not a directory!')
+        return 1
+
+    target_dir: Path = get_output_dir(input_dir, output_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    results: list[BatchResult] = []
+    pending: list[tuple[Path, Path]] = []
+    for csv_path in find_usage_files(input_dir):
+        xlsx_path: Path = target_dir / get_output_name(csv_path)
+        if not force and is_up_to_date(csv_path, xlsx_path):
+            results.append(BatchResult(csv_path, xlsx_path, 'skipped', 'Excel file is newer than csv.'))
+        else:
+            pending.append((csv_path, xlsx_path))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs or min(len(pending), os.cpu_count() or 1)) as executor:
+            futures = {executor.submit(convert_usage_file, csv_path, xlsx_path, streaming, cache_dir, check): (csv_path, xlsx_path)
+                       for csv_path, xlsx_path in pending}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    # Worker process died (e.g. out of memory).
+                    csv_path, xlsx_path = futures[future]
+                    results.append(BatchResult(csv_path, xlsx_path, 'failed', f'{type(error).__name__}: {error}'))
+
+    print_summary(sorted(results, key=lambda result: result.csv_path))
+    return sum(result.status == 'failed' for result in results)
+
+
+def print_summary(results: list[BatchResult]) -> None:
+    """
+    Print one line per file followed by totals.
+    """
+    for result in results:
+        print(format_result(result))
+
+    counts: dict[str, int] = {status: sum(result.status == status for result in results)
+                              for status in ('ok', 'failed', 'skipped')}
+    print(f'{len(results)} files: {counts["ok"]} converted, {counts["failed"]} failed, {counts["skipped"]} skipped.')
+
+
+def format_result(result: BatchResult) -> str:
+    """
+    Return the summary line for one file.
+    """
+    line: str = f'{result.status.upper():8}{result.csv_path} -> {result.xlsx_path.name}'
+    if result.message:
+        line += f'  ({result.message})'
+    return line
@@ -0,0 +1,150 @@
+"""
+pseg_benchmark.py
+
+Time each stage of pseg_parse on synthetic usage files and keep a history of results.
+
+Each run appends one JSON line per size to the results file and prints the change from the previous result for the
+same size and meter count, so regressions show up between versions.
+"""
+
+from typing import Optional
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import date, datetime
+from pseg_parse import pseg_parse
+import profiling
+from usage_generator import SIZES, write_usage_csv
+
+DEFAULT_RESULTS_FILE: str = 'benchmark_results.jsonl'
+# Start on the sample file's first day so every size spans both DST transitions once it passes March.
+GENERATED_START: date = date(2025, 1, 16)
+STAGES: list[str] = ['parse', 'classify', 'write_cells', 'format_cells', 'close']
+
+
+def get_git_commit() -> str:
+    """
+    Return the short commit hash of the working tree, or '' outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def time_stages(csv_file_name: str, xlsx_file_name: str, jobs: int = 1) -> tuple[dict[str, float], int]:
+    """
+    Run pseg_parse on one file with profiling on.  Returns (seconds per stage, number of intervals).
+    """
+    with profiling.Profiler() as profiler, redirect_stdout(io.StringIO()):
+        if not pseg_parse(csv_file_name, xlsx_file_name, jobs=jobs):
+            raise ValueError(f'{csv_file_name} could not be converted.')
+
+    times: dict[str, float] = {profile['stage']: profile['seconds'] for profile in profiler.stages}
+    intervals: int = next(profile['counters']['rows'] for profile in profiler.stages if profile['stage'] == 'write_cells')
+    return times, intervals
+
+
+def run_size(size: str, meters: int, repeats: int, work_dir: str, jobs: int = 1) -> dict:
+    """
+    Generate a usage file for size and return a result with the best time of each stage over repeats.
+    """
+    csv_file_name: str = os.path.join(work_dir, f'{size}-{meters}.csv')
+    with open(csv_file_name, 'w', newline='') as csv_file:
+        write_usage_csv(csv_file, GENERATED_START, SIZES[size], meters)
+
+    best: dict[str, float] = {}
+    intervals: int = 0
+    for _ in range(repeats):
+        times, intervals = time_stages(csv_file_name, os.path.join(work_dir, f'{size}-{meters}.xlsx'), jobs)
+        for stage, seconds in times.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    best['total'] = sum(best[stage] for stage in STAGES)
+
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': size,
+        'meters': meters,
+        'jobs': jobs,
+        'intervals': intervals,
+        'repeats': repeats,
+        'seconds': {stage: round(seconds, 4) for stage, seconds in best.items()},
+    }
+
+
+def load_results(results_file_name: str) -> list[dict]:
+    """
+    Read earlier results, oldest first.  A missing file has no results.
+    """
+    if not os.path.exists(results_file_name):
+        return []
+    with open(results_file_name) as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+
+def find_previous(results: list[dict], size: str, meters: int, jobs: int) -> Optional[dict]:
+    """
+    Return the latest earlier result for the same size, meter count and parse jobs.
+    """
+    for result in reversed(results):
+        if result.get('size') == size and result.get('meters') == meters and result.get('jobs') == jobs:
+            return result
+    return None
+
+
+def print_result(result: dict, previous: Optional[dict]) -> None:
+    """
+    Print stage times for result, with the change from previous if there is one.
+    """
+    print(f'{result["size"]} ({result["meters"]} meter(s), {result["intervals"]} intervals, {result["jobs"]} parse job(s))'
+          + (f' vs {previous["commit"] or "?"} at {previous["time"]}' if previous else ''))
+    for stage, seconds in result['seconds'].items():
+        line: str = f'  {stage:14}{seconds:10.4f} s'
+        old_seconds: Optional[float] = previous['seconds'].get(stage) if previous else None
+        if old_seconds:
+            line += f'  {(seconds - old_seconds) / old_seconds:+8.1%}'
+        print(line)
+
+
+def main():
+    """
+    Main function for pseg_benchmark.
+    """
+    parser = ArgumentParser(description='Benchmark pseg_parse stages on synthetic usage files.')
+    parser.add_argument('--size', '-s', choices=SIZES, action='append',
+                        help='Usage history length to benchmark.  May be repeated.  Defaults to month and year.')
+    parser.add_argument('--meters', '-m', type=int, default=1, help='Number of meters in each generated file.')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='Runs per size.  The best time of each stage is kept.')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Processes used to parse each file.  Defaults to 1.')
+    parser.add_argument('--results', type=str, default=DEFAULT_RESULTS_FILE,
+                        help=f'JSON lines file results are appended to.  Defaults to {DEFAULT_RESULTS_FILE}.')
+    parser.add_argument('--no-save', action='store_true', help='Compare with earlier results without saving these.')
+    args = parser.parse_args()
+
+    if args.repeats < 1 or args.meters < 1 or args.jobs < 1:
+        print('--repeats, --meters and --jobs must be at least 1!')
+        sys.exit(1)
+
+    results: list[dict] = load_results(args.results)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.size or ['month', 'year']:
+            result: dict = run_size(size, args.meters, args.repeats, work_dir, args.jobs)
+            print_result(result, find_previous(results, size, args.meters, args.jobs))
+            results.append(result)
+            if not args.no_save:
+                with open(args.results, 'a') as results_file:
+                    results_file.write(json.dumps(result) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -2,317 +2,245 @@
 pseg_parse.py
 """
 
-from typing import Union
-import re
-from csv import reader
+from typing import Optional
+import csv
+import sys
 from argparse import ArgumentParser
-from datetime import datetime, time, timedelta
-import xlsxwriter
-from set_outer_border_for_range_xlsx import apply_outer_border_to_range
+from datetime import date
+from interval_cache import DEFAULT_CACHE_DIR, IntervalCache
+from tou_engine import UnmatchedInterval
+from parallel_parse import load_usage_intervals_parallel
+from rate_schedules import RateSchedule, load_rate_schedules, use_rate_schedules
+from output_writers import OUTPUT_FORMATS, OutputOptions, write_usage
+from usage_rollups import ROLLUP_SECONDS
+from usage_check import CheckReport, check_usage_file, print_check_report
+import profiling
 
-FIRST_HEADER_ROW: int = 3
+MAX_LISTED_UNMATCHED: int = 50
+SCHEDULES_HELP: str = ('JSON file of TOU rate schedules in the rate_schedules.RATE_SCHEDULES format, replacing or '
+                       'adding to the built-in ones.')
 
-# Peak and super off peak time periods.
-# Peak time is from 3:00 PM up to 7:00 PM except weekends.  3:00 PM reading is last meter reading for off-peak.  3:15 is first peam reading.
-# Similarly, the last peak reading is at 7:00 PM, and off-peak starts with the 7:15 PM reading.
-PEAK_START: time = time(15, 0, 0)
-PEAK_END: time = time(18, 59, 59)
 
-# Super Off-Peak is from 10:00 PM up to 6:00:00 AM including weekends.
-# Similar to peak start and end, The last off-peak reading ends at 10:00 PM and 10:15 is the first meter reading for super off-peak.
-# The last meter reading for super off-peak occurs at 6:00 AM the next day.
-# Shift by three hours to make comparisons easier.  This gets the time periods in the same day (1 AM to 9 AM).
-TIME_OFFSET: timedelta = timedelta (hours = 2)
-SUPER_OFF_PEAK_START: time = (datetime(1, 1, 1, 22, 0, 1) + TIME_OFFSET).time()
-SUPER_OFF_PEAK_END: time = (datetime(1, 1, 1, 6, 00, 00) + TIME_OFFSET).time()
-
-def get_day_of_week(date: datetime) -> int:
-    """
-    Return day of week (0 = Sunday, 1 = Monday, ..., 6 = Saturday) given a datetime object.
-    """
-    return int(date.strftime('%w'))
-
-def is_peak_time(date_time_val: datetime) -> bool:
-    """
-    Returns True if date_time_val is in peak period.
-
-    Peak begins at PEAK_START and ends at PEAK_END, except Saturady and Sunday.
-    """
-
-    # Weekends aren't peak.
-    if get_day_of_week(date_time_val) in [0, 6]:
-        return False
-    
-    return (date_time_val.time() >= PEAK_START) and (date_time_val.time() <= PEAK_END)
-
-def is_super_off_peak_time(date_time_val: datetime) -> bool:
-    """
-    Returns True if date_time_val is in super_off_peak_period.
-
-    Super off peak is between 10:00 PM and 5:59:59 AM inclusive.  Adding two hours to super off peak start, super off peak end,
-    and the candidate date_time_val makes the comparisons easier, since then they all fall within the same day.
-    """
-    time_val: time = (date_time_val + TIME_OFFSET).time()
-
-    return (time_val >= SUPER_OFF_PEAK_START) and (time_val <= SUPER_OFF_PEAK_END)
-
-def add_title_cells(book, sheet, default_format) -> int:
-    """
-    Adds titles for various TOU plans
-    """
-    merge_center = book.add_format({
-        "bold": 0,
-        "border": 0,
-        "align": "center",
-        "valign": "vcenter"
-    })
-    merge_left = book.add_format({
-        "bold": 0,
-        "border": 0,
-        "align": "left",
-        "valign": "vcenter"
-    })
-
-    row_num: int = FIRST_HEADER_ROW
-    sheet.write(f'B{row_num}', 'Non-TOU Consumed:', merge_left)
-    sheet.write(f'E{row_num}', 'Off-Peak Consumed:', merge_left)
-    sheet.write(f'H{row_num}', 'Super Off-Peak Consumed:', merge_left)
-    row_num += 1
-
-    sheet.write(f'B{row_num}', 'Non-TOU Generated:', merge_left)
-    sheet.write(f'E{row_num}', 'Off-Peak Generated:', merge_left)
-    sheet.write(f'H{row_num}', 'Super Off-Peak Generated:', merge_left)
-    row_num += 1
-
-    sheet.write(f'E{row_num}', 'Peak Consumed:', merge_left)
-    sheet.write(f'H{row_num}', 'Off-Peak Consumed:', merge_left)
-    row_num += 1
-
-    sheet.write(f'E{row_num}', 'Peak Generated:', merge_left)
-    sheet.write(f'H{row_num}', 'Off-Peak Generated:', merge_left)
-    row_num += 1
-
-    sheet.write(f'H{row_num}', 'Peak Consumed:', merge_left)
-    row_num += 1
-
-    sheet.write(f'H{row_num}', 'Peak Generated:', merge_left)
-    row_num += 2
-
-    sheet.write(f'B{row_num}', 'Non-TOU Net:', merge_left)
-    sheet.write(f'E{row_num}', 'Off-Peak Net:', merge_left)
-    sheet.write(f'H{row_num}', 'Super Off-Peak Net:', merge_left)
-    row_num += 1
-
-    sheet.write(f'E{row_num}', 'Peak Net:', merge_left)
-    sheet.write(f'H{row_num}', 'Off-Peak Net:', merge_left)
-    row_num += 1
-
-    sheet.write(f'H{row_num}', 'Peak Net:', merge_left)
-    row_num += 2
-
-    sheet.write(f'B{row_num}', 'Bill:', merge_left)
-    sheet.write(f'E{row_num}', 'Bill:', merge_left)
-    sheet.write(f'H{row_num}', 'Bill:', merge_left)
-    row_num += 2
-
-    sheet.merge_range(f'B{row_num}:C{row_num}', 'Non-TOU Billing', merge_center)
-    sheet.merge_range(f'E{row_num}:H{row_num}', 'Off-Peak Billing', merge_center)
-    sheet.merge_range(f'J{row_num}:O{row_num}', 'Super Off-Peak Billing', merge_center)
-    row_num += 1
-
-    sheet.merge_range(f'E{row_num}:F{row_num}', 'Peak', merge_center)
-    sheet.merge_range(f'G{row_num}:H{row_num}', 'Off-Peak', merge_center)
-
-    sheet.merge_range(f'J{row_num}:K{row_num}', 'Peak', merge_center)
-    sheet.merge_range(f'L{row_num}:M{row_num}', 'Off-Peak', merge_center)
-    sheet.merge_range(f'N{row_num}:O{row_num}', 'Super Off-Peak', merge_center)
-    row_num += 1
-
-    sheet.write_row(f'A{row_num}', ['Time', 'Consumed', 'Generated', '',
-                           'Consumed', 'Generated', 'Consumed', 'Generated', '',
-                           'Consumed', 'Generated', 'Consumed', 'Generated', 'Consumed', 'Generated'], default_format)
-    row_num += 1
-
-    # Return first row number after titles
-    return row_num
-
-def add_formulas(sheet, first_header_row: int, first_data_row: int, last_data_row: int) -> None:
+def print_unmatched_intervals(unmatched: list[UnmatchedInterval]) -> None:
     """
-    Populates formulas in header of worksheet.
+    List intervals that were left out because their consumed or generated row is missing or repeated.
     """
-
-    # Non-TOU billing formulas
-    sheet.write_formula(f'C{first_header_row}', f'=SUM(B{first_data_row}:B{last_data_row})')                # Consumed
-    sheet.write_formula(f'C{first_header_row + 1}', f'=SUM(C{first_data_row}:C{last_data_row})')            # Generated
-    sheet.write_formula(f'C{first_header_row + 7}', f'=C{first_header_row} + C{first_header_row + 1}')      # Net
-
-    # Off-Peak billing formulas
-    sheet.write_formula(f'F{first_header_row}', f'=SUM(G{first_data_row}:G{last_data_row})')                # Off-Peak consumed
-    sheet.write_formula(f'F{first_header_row + 1}', f'=SUM(H{first_data_row}:H{last_data_row})')            # Off-Peak generated
-    sheet.write_formula(f'F{first_header_row + 7}', f'=F{first_header_row} + F{first_header_row + 1}')      # Off-Peak net
-    sheet.write_formula(f'F{first_header_row + 2}', f'=SUM(E{first_data_row}:E{last_data_row})')            # Peak consumed
-    sheet.write_formula(f'F{first_header_row + 3}', f'=SUM(F{first_data_row}:F{last_data_row})')            # Peak generated
-    sheet.write_formula(f'F{first_header_row + 8}', f'=F{first_header_row + 2} + F{first_header_row + 3}')  # Peak net
-
-    # Super Off-Peak billing formulas
-    sheet.write_formula(f'I{first_header_row}', f'=SUM(N{first_data_row}:N{last_data_row})')                # Super Off-Peak consumed
-    sheet.write_formula(f'I{first_header_row + 1}', f'=SUM(O{first_data_row}:O{last_data_row})')            # Super Off-Peak generated
-    sheet.write_formula(f'I{first_header_row + 7}', f'=I{first_header_row} + I{first_header_row + 1}')      # Super Off-Peak net
-    sheet.write_formula(f'I{first_header_row + 2}', f'=SUM(L{first_data_row}:L{last_data_row})')            # Off-Peak consumed
-    sheet.write_formula(f'I{first_header_row + 3}', f'=SUM(M{first_data_row}:M{last_data_row})')            # Off-Peak generated
-    sheet.write_formula(f'I{first_header_row + 8}', f'=I{first_header_row + 2} + I{first_header_row + 3}')  # Off-Peak net
-    sheet.write_formula(f'I{first_header_row + 4}', f'=SUM(J{first_data_row}:J{last_data_row})')            # Peak consumed
-    sheet.write_formula(f'I{first_header_row + 5}', f'=SUM(K{first_data_row}:K{last_data_row})')            # Peak generated
-    sheet.write_formula(f'I{first_header_row + 9}', f'=I{first_header_row + 4} + I{first_header_row + 5}')  # Peak net
-
-
-def format_cells(book, sheet, first_data_row: int, last_data_row: int) -> None:
-    """
-    Add borders to data and header columns.
-    """
-    # Non-TOU Billing Header
-    apply_outer_border_to_range(book, sheet, {"range_string": "B18:B18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "C18:C18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "B16:C18", "border_style": 5})
-
-    # Non-TOU Billing data
-    apply_outer_border_to_range(book, sheet, {"range_string": f"B{first_data_row}:B{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"B{first_data_row}:C{last_data_row}", "border_style": 5})
-
-    # Off-Peak Billing Header
-    apply_outer_border_to_range(book, sheet, {"range_string": "E17:F17", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "G17:H17", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "E18:E18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "F18:F18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "G18:G18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "H18:H18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "E16:H18", "border_style": 5})
-
-    # Off-Peak Billing data
-    apply_outer_border_to_range(book, sheet, {"range_string": f"E{first_data_row}:E{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"F{first_data_row}:F{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"G{first_data_row}:G{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"E{first_data_row}:H{last_data_row}", "border_style": 5})
-
-    # Super Off-Peak Billing Header
-    apply_outer_border_to_range(book, sheet, {"range_string": "J17:K17", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "L17:M17", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "N17:O17", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "J18:J18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "K18:K18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "L18:L18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "M18:M18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "N18:N18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "O18:O18", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": "J16:O18", "border_style": 5})
-
-    # Super Off-Peak Billing data
-    apply_outer_border_to_range(book, sheet, {"range_string": f"J{first_data_row}:J{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"K{first_data_row}:K{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"L{first_data_row}:L{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"M{first_data_row}:M{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"N{first_data_row}:N{last_data_row}", "border_style": 1})
-    apply_outer_border_to_range(book, sheet, {"range_string": f"J{first_data_row}:O{last_data_row}", "border_style": 5})
-
-    sheet.autofit()
-    sheet.freeze_panes(f'B{first_data_row}')
+    if not unmatched:
+        return
+    print(f'{len(unmatched)} unmatched intervals were left out:')
+    for interval in unmatched[:MAX_LISTED_UNMATCHED]:
+        print(f'  Line {interval.line}: {interval.kind} row for meter {interval.meter} at {interval.time} has no matching row.')
+    if len(unmatched) > MAX_LISTED_UNMATCHED:
+        print(f'  ... and {len(unmatched) - MAX_LISTED_UNMATCHED} more.')
 
 
-def pseg_parse(csv_file_name: str, xslx_file_name: str) -> None:
+def pseg_parse(csv_file_name: str, xslx_file_name: str, streaming: bool = False,
+               cache_dir: Optional[str] = None, output_format: Optional[str] = None,
+               rollups: Optional[list[str]] = None, intervals: bool = True, jobs: Optional[int] = 1) -> bool:
     """
     Parse PSEG downloaded CSV file and create Excel xslx file.
-    """
-    workbook: Workbook = xlsxwriter.Workbook(xslx_file_name, {'default_date_format': 'mmm dd yyyy hh:mm'})
-    worksheet: Unknown | Worksheet = workbook.add_worksheet('PSEG TOU Usage')
-    centered_fmt = workbook.add_format({'align': 'center', 'valign': 'vcenter'})
-    if worksheet is None:
-        print('Error creating worksheet!')
-        return
 
-    # first_row is cell addressing (one-based).
-    # sheet_row is row addressing (zero-based).
-    # add_title_cells returns row in cell addressing mode, which is one-based.
-    first_row: int = add_title_cells(workbook, worksheet, centered_fmt)
-    sheet_row: int = first_row - 1
-
-    with open(csv_file_name) as csv_file:
-        csv_reader = reader(csv_file)
-
-        try:
-            kwh_col: int = next(csv_reader).index('kWh')
-        except ValueError:
-            print('Downloaded usage data must include kWh!')
-            return
-        
-        try:
-            line: int = 0
-            meter: list[str]
-            for line, meter in enumerate(csv_reader):
-                gen_meter = next(csv_reader)
-                try:
-                    meter_num = int(re.split(' #| - ', meter[1])[1])
-                    gen_meter_num = int(re.split(' #|g - ', gen_meter[1])[1])
-                except ValueError:
-                    print(f'Error parsing usage data at lines [{line} - {line + 1}].  Check that both meter and generated meter data are included.')
-                    return
-                
-                if meter_num != gen_meter_num:
-                    print(f'Mismatched meters at lines [{line} - {line + 1}].')
-                    return
-                
-                meter_time: datetime = datetime.strptime(meter[0], '%m/%d/%Y %I:%M:%S %p')
-                gen_meter_time: datetime = datetime.strptime(gen_meter[0], '%m/%d/%Y %I:%M:%S %p')
-
-                if meter_time != gen_meter_time:
-                    print(f'Mismatched meter times at lines [{line} - {line + 1}].')
-                    return
-                
-                # Column 0: Time
-                worksheet.write_datetime(sheet_row, 0, meter_time)
-
-                consumed: float = float(meter[kwh_col])
-                generated: float = float(gen_meter[kwh_col])
-                # Columns B-D - Non-TOU Billing: Consumed, Gen'd, and empty cell.
-                kwh_data: list[Union[float, str]] = [consumed, generated, '']
-
-                # Rate 195 Super off-peak is off-peak for rate 194
-                if is_super_off_peak_time(meter_time):
-                    # Columns E-I = Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, and empty cell.
-                    kwh_data.extend([0, 0, consumed, generated, ''])
-                    # Columns J-P - Super Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, Super Off-Peak Consumed and Gen'd, and empty cell.
-                    kwh_data.extend([0, 0, 0, 0, consumed, generated, ''])
-                else:
-                    if is_peak_time(meter_time):
-                        # Columns E-I = Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, and empty cell.
-                        kwh_data.extend([consumed, generated, 0, 0, ''])
-                        # Columns J-P - Super Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, Super Off-Peak Consumed and Gen'd, and empty cell.
-                        kwh_data.extend([consumed, generated, 0, 0, 0, 0, ''])
-                    else:
-                        # If it's neither super off-peak nor peak, then it's off-peak.
-                        # Columns E-I = Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, and empty cell.
-                        kwh_data.extend([0, 0, consumed, generated, ''])
-                        # Columns J-P - Super Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, Super Off-Peak Consumed and Gen'd, and empty cell.
-                        kwh_data.extend([0, 0, consumed, generated, 0, 0, ''])
-                worksheet.write_row(sheet_row, 1, kwh_data, centered_fmt)
-                sheet_row += 1
+    With streaming, rows are flushed as they are written (xlsxwriter constant_memory) so memory use doesn't grow
+    with the length of the usage history.  With cache_dir, parsed intervals are reused from and saved to an
+    IntervalCache in that directory.  output_format names an output_writers format; by default it comes from the
+    output file's extension, and is the workbook for .xlsx or any other extension.  rollups names hourly, daily or
+    weekly totals to add, and intervals=False leaves out the row per interval.  jobs is the number of processes
+    that parse a large csv (None for one per CPU); see parallel_parse.
+
+    Returns False if the usage data couldn't be converted.  Problems are printed.
+    """
+    try:
+        with profiling.stage('parse'):
+            if cache_dir is not None:
+                usage, unmatched = IntervalCache(cache_dir).load_usage_intervals(csv_file_name, jobs)
+            else:
+                usage, unmatched = load_usage_intervals_parallel(csv_file_name, jobs)
+            profiling.count(rows=len(usage.timestamps) + len(unmatched))
+    except ValueError as error:
+        print(error)
+        return False
+    except (OSError, csv.Error) as error:
+        print(f'Unable to read {csv_file_name}: {error}')
+        return False
+    print_unmatched_intervals(unmatched)
 
-        except StopIteration:
-            print('Read beyond end of file.  Check that both meter and generated meter data are included.')
+    options: OutputOptions = {'streaming': streaming, 'rollups': rollups or [], 'intervals': intervals}
+    return write_usage(usage, xslx_file_name, output_format, options)
 
-    add_formulas(worksheet, FIRST_HEADER_ROW, first_row, sheet_row)
-    format_cells(workbook, worksheet, first_row, sheet_row)
-    workbook.close()
 
 def main():
     """
     Main function for pseg_parse.
     """
     parser = ArgumentParser()
-    parser.add_argument('--bill', '-b', type=str, required=True, help='Path to downloaded bill as csv.')
-    parser.add_argument('--excel', '-e', type=str, required=True, help='Path to Excel file that will be generated.')
+    parser.add_argument('--bill', '-b', type=str, help='Path to downloaded bill as csv.')
+    parser.add_argument('--excel', '-e', '--output', '-o', type=str, dest='excel',
+                        help='Path to Excel (or --format) file that will be generated.')
+    parser.add_argument('--format', '-f', choices=OUTPUT_FORMATS, dest='output_format',
+                        help='Output format.  Defaults to the output file extension, or xlsx.')
+    parser.add_argument('--rollups', choices=ROLLUP_SECONDS, nargs='*',
+                        help='Add hourly, daily and/or weekly totals per TOU period (all three if none are listed).')
+    parser.add_argument('--no-intervals', action='store_false', dest='intervals',
+                        help='Leave out the row per interval and only write --rollups.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Flush rows as they are written to keep memory flat for long usage histories.')
+    parser.add_argument('--cache-dir', type=str, nargs='?', const=str(DEFAULT_CACHE_DIR),
+                        help=f'Reuse parsed intervals from this directory (default {DEFAULT_CACHE_DIR}).')
+    parser.add_argument('--profile', type=str, nargs='?', const='-',
+                        help='Print time, rows, cells and formats for each stage, or write them as JSON to a file.')
+    parser.add_argument('--jobs', '-j', type=int, default=None, dest='parse_jobs',
+                        help='Processes used to parse a large csv.  Defaults to one per CPU.')
+    parser.add_argument('--check', action='store_true',
+                        help='List every problem in the csv instead of converting it.  Exits with 1 if there are any.')
+    parser.add_argument('--schedules', type=str, help=SCHEDULES_HELP)
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch_parser = subparsers.add_parser('batch', help='Convert every usage csv under a directory.')
+    batch_parser.add_argument('directory', type=str, help='Directory to search for downloaded usage csv files.')
+    batch_parser.add_argument('--output-dir', '-o', type=str,
+                              help='Directory for generated Excel files.  Defaults to "Parsed" next to directory.')
+    batch_parser.add_argument('--jobs', '-j', type=int, default=None, help='Number of worker processes.')
+    batch_parser.add_argument('--force', '-f', action='store_true',
+                              help='Convert files even if their Excel file is newer than the csv.')
+    batch_parser.add_argument('--streaming', action='store_true',
+                              help='Flush rows as they are written to keep memory flat for long usage histories.')
+    batch_parser.add_argument('--cache-dir', type=str, nargs='?', const=str(DEFAULT_CACHE_DIR),
+                              help=f'Reuse parsed intervals from this directory (default {DEFAULT_CACHE_DIR}).')
+    batch_parser.add_argument('--check', action='store_true',
+                              help='Check each csv first and leave out files with problems (see --check).')
+
+    watch_parser = subparsers.add_parser('watch', help='Keep converting usage csv files as they are added to a directory.')
+    watch_parser.add_argument('directory', type=str, help='Directory to watch, e.g. "PSEG Bills/Downloaded Usage".')
+    watch_parser.add_argument('--output-dir', '-o', type=str,
+                              help='Directory for generated Excel files.  Defaults to "Parsed" next to directory.')
+    watch_parser.add_argument('--jobs', '-j', type=int, default=None, help='Number of worker processes.  Defaults to 2.')
+    watch_parser.add_argument('--settle', type=float,
+                              help='Seconds a file must stay unchanged before it is converted.  Defaults to 2.')
+    watch_parser.add_argument('--poll', action='store_true', help='Poll the directory instead of using inotify.')
+    watch_parser.add_argument('--poll-interval', type=float, help='Seconds between scans when polling.  Defaults to 2.')
+    watch_parser.add_argument('--state', type=str,
+                              help='File recording converted files.  Defaults to .pseg_watch.json in the output directory.')
+    watch_parser.add_argument('--streaming', action='store_true',
+                              help='Flush rows as they are written to keep memory flat for long usage histories.')
+    watch_parser.add_argument('--cache-dir', type=str, nargs='?', const=str(DEFAULT_CACHE_DIR),
+                              help=f'Reuse parsed intervals from this directory (default {DEFAULT_CACHE_DIR}).')
+
+    serve_parser = subparsers.add_parser('serve', help='Serve plan totals and workbooks over local HTTP.')
+    serve_parser.add_argument('--host', type=str, help='Address to listen on.  Defaults to 127.0.0.1.')
+    serve_parser.add_argument('--port', '-p', type=int, help='Port to listen on.  Defaults to 8765.')
+    serve_parser.add_argument('--cache-size', type=int, help='Parsed files kept in memory.  Defaults to 16.')
+    serve_parser.add_argument('--root', type=str, action='append', dest='roots',
+                              help='Directory ?path= requests may read from.  Can be repeated.  Defaults to the current directory.')
+    serve_parser.add_argument('--jobs', '-j', type=int, default=1, help='Processes used to parse a large csv.')
+
+    simulate_parser = subparsers.add_parser('simulate', help='Compare plan costs without building workbooks.')
+    simulate_parser.add_argument('paths', type=str, nargs='+', help='Usage csv files or directories of them.')
+    simulate_parser.add_argument('--format', choices=['json', 'csv'], default='json', help='Output format.')
+    simulate_parser.add_argument('--output', '-o', type=str, help='File to write.  Defaults to standard output.')
+    simulate_parser.add_argument('--rates', type=str, help='JSON file of plan prices in the RATE_PRICES format.')
+    simulate_parser.add_argument('--power-supply-rate', type=float, required=True,
+                                 help='Monthly published power supply rate in $ per kWh, from the PSEG bill or tariff.  '
+                                      'Power supply charges are a large part of each plan\'s cost.')
+    simulate_parser.add_argument('--schedules', type=str, help=SCHEDULES_HELP)
+    simulate_parser.add_argument('--jobs', '-j', type=int, default=None, help='Number of worker processes.')
+    simulate_parser.add_argument('--cache-dir', type=str, nargs='?', const=str(DEFAULT_CACHE_DIR),
+                                 help=f'Reuse parsed intervals from this directory (default {DEFAULT_CACHE_DIR}).')
+
+    ingest_parser = subparsers.add_parser('ingest', help='Add usage csv files to the interval store.')
+    ingest_parser.add_argument('paths', type=str, nargs='+', help='Usage csv files or directories of them.')
+    ingest_parser.add_argument('--store', type=str,
+                               help='Interval store file.  Defaults to pseg_parse/intervals.sqlite in the user data directory.')
+
+    report_parser = subparsers.add_parser('report', help='Create the Excel file for a date range of stored intervals.')
+    report_parser.add_argument('--excel', '-e', '--output', '-o', type=str, dest='excel', required=True,
+                               help='Path to Excel (or --format) file that will be generated.')
+    report_parser.add_argument('--format', '-f', choices=OUTPUT_FORMATS, dest='output_format',
+                               help='Output format.  Defaults to the output file extension, or xlsx.')
+    report_parser.add_argument('--rollups', choices=ROLLUP_SECONDS, nargs='*',
+                               help='Add hourly, daily and/or weekly totals per TOU period (all three if none are listed).')
+    report_parser.add_argument('--no-intervals', action='store_false', dest='intervals',
+                               help='Leave out the row per interval and only write --rollups.')
+    report_parser.add_argument('--start', type=date.fromisoformat, help='First day (YYYY-MM-DD).  Defaults to the first stored day.')
+    report_parser.add_argument('--end', type=date.fromisoformat, help='Last day (YYYY-MM-DD).  Defaults to the last stored day.')
+    report_parser.add_argument('--meter', type=int, help='Only include this meter number.')
+    report_parser.add_argument('--store', type=str,
+                               help='Interval store file.  Defaults to pseg_parse/intervals.sqlite in the user data directory.')
+    report_parser.add_argument('--schedules', type=str, help=SCHEDULES_HELP)
+    report_parser.add_argument('--streaming', action='store_true',
+                               help='Flush rows as they are written to keep memory flat for long usage histories.')
     args = parser.parse_args()
-
-    pseg_parse (args.bill, args.excel)
+    schedules: Optional[dict[str, RateSchedule]] = None
+    if getattr(args, 'schedules', None) is not None:
+        if args.command in ('batch', 'watch'):
+            # Their worker processes only see the built-in schedules.
+            parser.error(f'--schedules can\'t be used with {args.command}.')
+        try:
+            schedules = load_rate_schedules(args.schedules)
+        except (OSError, ValueError) as error:
+            parser.error(f'Unable to read --schedules {args.schedules}: {error}')
+        use_rate_schedules(schedules)
+    # A bare --rollups means every rollup.
+    rollups: Optional[list[str]] = None
+    if getattr(args, 'rollups', None) is not None:
+        rollups = args.rollups or list(ROLLUP_SECONDS)
+
+    if args.command in ('ingest', 'report'):
+        # Imported here since interval_store imports this module through pseg_batch.
+        from interval_store import ingest_paths, write_report
+        if args.command == 'ingest':
+            sys.exit(1 if ingest_paths(args.paths, args.store) else 0)
+        sys.exit(0 if write_report(args.excel, args.store, args.start, args.end, args.meter, args.streaming,
+                                   args.output_format, rollups, args.intervals) else 1)
+
+    if args.command == 'simulate':
+        # Imported here since bill_simulation imports this module through pseg_batch.
+        from bill_simulation import run_simulation
+        failures = run_simulation(args.paths, args.format, args.output, args.rates, args.power_supply_rate,
+                                  args.jobs, args.cache_dir, schedules)
+        sys.exit(1 if failures else 0)
+
+    if args.command == 'watch':
+        # Imported here since pseg_watch (through pseg_batch) imports this module for its workers.
+        from pseg_watch import run_watch
+        sys.exit(run_watch(args.directory, args.output_dir, args.jobs, args.streaming, args.cache_dir, args.settle,
+                           args.poll_interval, args.poll, args.state))
+
+    if args.command == 'serve':
+        # Imported here since pseg_serve imports this module through pseg_batch.
+        from pseg_serve import run_serve
+        sys.exit(run_serve(args.host, args.port, args.cache_size, args.roots, args.jobs))
+
+    if args.command == 'batch':
+        # Imported here since pseg_batch imports this module for its workers.
+        from pseg_batch import run_batch
+        failures: int = run_batch(args.directory, args.output_dir, args.jobs, args.force, args.streaming,
+                                   args.cache_dir, args.check)
+        sys.exit(1 if failures else 0)
+
+    if args.check:
+        if args.bill is None:
+            parser.error('--check requires --bill.')
+        report: CheckReport = check_usage_file(args.bill)
+        print_check_report(report)
+        sys.exit(1 if report.problems else 0)
+
+    if args.bill is None or args.excel is None:
+        parser.error('--bill and --excel are required unless a command is given.')
+
+    if args.profile is None:
+        converted: bool = pseg_parse(args.bill, args.excel, args.streaming, args.cache_dir, args.output_format,
+                                     rollups, args.intervals, args.parse_jobs)
+    else:
+        with profiling.Profiler() as profiler:
+            converted = pseg_parse(args.bill, args.excel, args.streaming, args.cache_dir, args.output_format,
+                                   rollups, args.intervals, args.parse_jobs)
+        if args.profile == '-':
+            profiler.print_table()
+        else:
+            profiler.write_json(args.profile)
+
+    if not converted:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
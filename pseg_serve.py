@@ -0,0 +1,391 @@
+"""
+pseg_serve.py
+
+Local HTTP service for TOU analysis, so tools don't start an interpreter and import xlsxwriter for every file.
+
+Usage data is sent as the request body (a csv, or a multipart/form-data upload such as curl -F 'usage=@file.csv'),
+or named with ?path= for a csv under one of the server's root directories.
+
+    GET  /status                 Cache statistics.
+    POST /totals, GET /totals    Per-meter totals for each plan's periods and the plan cost comparison, as JSON.
+                                 ?power_supply_rate= is the monthly power supply rate in $ per kWh.
+    POST /xlsx, GET /xlsx        The TOU usage workbook.  ?layout=compact, ?rollups=hourly,daily,weekly and
+                                 ?intervals=0 work as on the command line.
+
+Parsed intervals are kept in a least recently used cache keyed by the SHA-256 of the csv, so a file sent again, or
+sent once and named by path once, isn't parsed again.  Requests are handled on threads.  When several requests ask
+for the same new file at once, one parses it and the others wait for its result.
+"""
+
+from typing import Callable, NamedTuple, Optional
+import csv
+import hashlib
+import json
+import os
+import signal
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from email.message import Message
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from tou_engine import UnmatchedInterval
+from interval_cache import hash_file
+from interval_table import IntervalTable, as_interval_table
+from parallel_parse import load_usage_intervals_parallel
+from output_writers import summarize_usage, write_usage
+from usage_rollups import ROLLUP_SECONDS
+from bill_simulation import simulate_usage
+from pseg_batch import get_output_name, handle_sigterm, warm_up_worker
+from pseg_parse import MAX_LISTED_UNMATCHED
+
+DEFAULT_HOST: str = '127.0.0.1'
+DEFAULT_PORT: int = 8765
+DEFAULT_CACHE_ENTRIES: int = 16
+MAX_UPLOAD_BYTES: int = 256 * 1024 * 1024
+XLSX_CONTENT_TYPE: str = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# File name used for uploads that don't have one, e.g. a raw csv body.
+DEFAULT_UPLOAD_NAME: str = 'usage.csv'
+# ?layout= values and their output_writers formats.
+XLSX_LAYOUTS: dict[str, str] = {'full': 'xlsx', 'compact': 'xlsx-compact'}
+
+
+class ParsedUsage(NamedTuple):
+    table: IntervalTable
+    unmatched: list[UnmatchedInterval]
+
+
+class UsageRequest(NamedTuple):
+    content_hash: str
+    name: str                           # File name of the csv, for the workbook name
+    load: Callable[[], ParsedUsage]     # Parses the csv
+
+
+class RequestError(Exception):
+    """
+    A problem with a request, sent back as a JSON error with an HTTP status.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status: int = status
+
+
+class UsageCache:
+    """
+    Thread-safe least recently used cache of ParsedUsage keyed by content hash.
+
+    get() loads a missing entry once, however many threads ask for it at the same time.  Load errors aren't cached,
+    so a bad file is reported to every request for it.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries: int = max_entries
+        self.entries: OrderedDict[str, ParsedUsage] = OrderedDict()
+        self.loading: dict[str, Future] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.waits: int = 0     # Requests that waited for another request's load
+
+    def get(self, content_hash: str, load: Callable[[], ParsedUsage]) -> ParsedUsage:
+        """
+        Return the entry for content_hash, calling load to create it if needed.  Raises whatever load raises.
+        """
+        with self.lock:
+            parsed: Optional[ParsedUsage] = self.entries.get(content_hash)
+            if parsed is not None:
+                self.entries.move_to_end(content_hash)
+                self.hits += 1
+                return parsed
+            future: Optional[Future] = self.loading.get(content_hash)
+            is_loader: bool = future is None
+            if is_loader:
+                future = self.loading[content_hash] = Future()
+                self.misses += 1
+            else:
+                self.waits += 1
+        if not is_loader:
+            return future.result()
+
+        try:
+            parsed = load()
+        except BaseException as error:
+            with self.lock:
+                del self.loading[content_hash]
+            future.set_exception(error)
+            raise
+        with self.lock:
+            self.entries[content_hash] = parsed
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            del self.loading[content_hash]
+        future.set_result(parsed)
+        return parsed
+
+    def get_status(self) -> dict:
+        """
+        Return the number of entries and the hit, miss and wait counts.
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses, 'waits': self.waits}
+
+
+def parse_usage_file(csv_file_name: str, jobs: Optional[int] = 1) -> ParsedUsage:
+    """
+    Parse a csv into a ParsedUsage.  Raises ValueError or csv.Error for data that can't be parsed.
+    """
+    usage, unmatched = load_usage_intervals_parallel(csv_file_name, jobs)
+    return ParsedUsage(as_interval_table(usage), unmatched)
+
+
+def parse_usage_bytes(data: bytes, jobs: Optional[int] = 1) -> ParsedUsage:
+    """
+    Parse uploaded csv contents through a temporary file, since the loaders read files.
+    """
+    file_descriptor, temp_name = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        return parse_usage_file(temp_name, jobs)
+    finally:
+        os.remove(temp_name)
+
+
+def get_upload(content_type: str, body: bytes) -> tuple[bytes, str]:
+    """
+    Return the csv contents and file name of a request body, which is either the csv itself or multipart/form-data
+    with the csv as its first file (or only field).
+    """
+    if not content_type.lower().startswith('multipart/form-data'):
+        return body, DEFAULT_UPLOAD_NAME
+    message: Message = BytesParser(policy=HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + body)
+    parts: list[Message] = list(message.iter_parts()) if message.is_multipart() else []
+    files: list[Message] = [part for part in parts if part.get_filename()] or parts[:1]
+    if not files:
+        raise RequestError(400, 'The form has no usage csv file.')
+    return files[0].get_payload(decode=True) or b'', files[0].get_filename() or DEFAULT_UPLOAD_NAME
+
+
+def find_served_file(path_text: str, roots: list[Path]) -> Path:
+    """
+    Resolve a ?path= value.  It must be a file under one of roots.
+    """
+    path: Path = Path(path_text).expanduser().resolve()
+    if not any(path.is_relative_to(root) for root in roots):
+        raise RequestError(403, f'{path_text} is not under a served directory.')
+    if not path.is_file():
+        raise RequestError(404, f'{path_text} not found.')
+    return path
+
+
+def get_flag(query: dict[str, list[str]], name: str, default: bool) -> bool:
+    """
+    Return a query flag: 0, false, no or off are False, anything else True.
+    """
+    if name not in query:
+        return default
+    return query[name][-1].lower() not in ('0', 'false', 'no', 'off')
+
+
+def get_totals(parsed: ParsedUsage, content_hash: str, name: str, power_supply_rate: float = 0.0) -> dict:
+    """
+    Return the /totals response: per-meter period totals (see output_writers.summarize_usage) and plan costs (see
+    bill_simulation.simulate_usage).
+    """
+    return {
+        'source': name,
+        'sha256': content_hash,
+        'intervals': len(parsed.table.timestamps),
+        'unmatched': len(parsed.unmatched),
+        'unmatched_rows': [interval._asdict() for interval in parsed.unmatched[:MAX_LISTED_UNMATCHED]],
+        'meters': summarize_usage(parsed.table),
+        'plans': simulate_usage(parsed.table, name, power_supply_rate=power_supply_rate),
+    }
+
+
+def write_workbook_bytes(table: IntervalTable, layout: str, rollups: list[str], intervals: bool) -> bytes:
+    """
+    Return the contents of the TOU usage workbook, written through a temporary file.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        xlsx_file_name: str = os.path.join(temp_dir, 'usage.xlsx')
+        if not write_usage(table, xlsx_file_name, XLSX_LAYOUTS[layout], {'rollups': rollups, 'intervals': intervals}):
+            raise RequestError(500, 'Unable to write the workbook.')
+        with open(xlsx_file_name, 'rb') as xlsx_file:
+            return xlsx_file.read()
+
+
+class UsageServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer holding the cache and settings the request handlers share.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], cache: UsageCache, roots: list[Path], jobs: Optional[int] = 1):
+        super().__init__(address, UsageRequestHandler)
+        self.cache: UsageCache = cache
+        self.roots: list[Path] = roots
+        self.jobs: Optional[int] = jobs
+
+
+class UsageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles /status, /totals and /xlsx.  See the module docstring.
+    """
+    server: UsageServer
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        self.handle_request()
+
+    def do_POST(self) -> None:
+        self.handle_request()
+
+    def handle_request(self) -> None:
+        """
+        Route a request and send its response, or a JSON error.
+        """
+        url = urlsplit(self.path)
+        query: dict[str, list[str]] = parse_qs(url.query)
+        try:
+            if url.path == '/status':
+                self.read_body()
+                self.send_json(200, self.server.cache.get_status())
+            elif url.path == '/totals':
+                usage_request: UsageRequest = self.get_usage_request(query)
+                try:
+                    power_supply_rate: float = float(query.get('power_supply_rate', ['0'])[-1])
+                except ValueError:
+                    raise RequestError(400, 'power_supply_rate must be a number.')
+                parsed: ParsedUsage = self.server.cache.get(usage_request.content_hash, usage_request.load)
+                self.send_json(200, get_totals(parsed, usage_request.content_hash, usage_request.name,
+                                               power_supply_rate))
+            elif url.path == '/xlsx':
+                self.send_workbook(query)
+            else:
+                raise RequestError(404, f'Unknown path {url.path}.  Use /totals, /xlsx or /status.')
+        except RequestError as error:
+            self.send_json(error.status, {'error': str(error)})
+        except (ValueError, csv.Error) as error:
+            # The csv couldn't be parsed.
+            self.send_json(422, {'error': str(error)})
+        except (FileNotFoundError, PermissionError) as error:
+            # A ?path= file removed or made unreadable since find_served_file checked it.
+            self.send_json(404 if isinstance(error, FileNotFoundError) else 403,
+                           {'error': f'Unable to read the usage csv: {error.strerror or error}.'})
+        except ConnectionError:
+            # The client has gone, so there's no one to send an error to.
+            raise
+        except OSError as error:
+            self.send_json(500, {'error': f'Unable to read or write usage data: {error}'})
+
+    def send_workbook(self, query: dict[str, list[str]]) -> None:
+        """
+        Send the workbook for the request's usage data.
+        """
+        layout: str = query.get('layout', ['full'])[-1]
+        if layout not in XLSX_LAYOUTS:
+            raise RequestError(400, f'Unknown layout {layout!r}.  Choose from {", ".join(XLSX_LAYOUTS)}.')
+        rollups: list[str] = [rollup for value in query.get('rollups', []) for rollup in value.split(',') if rollup]
+        unknown: list[str] = [rollup for rollup in rollups if rollup not in ROLLUP_SECONDS]
+        if unknown:
+            raise RequestError(400, f'Unknown rollups {", ".join(unknown)}.  Choose from {", ".join(ROLLUP_SECONDS)}.')
+        intervals: bool = get_flag(query, 'intervals', True)
+        if not intervals and not rollups:
+            raise RequestError(400, 'Nothing to write: interval rows are turned off and no rollups were requested.')
+
+        usage_request: UsageRequest = self.get_usage_request(query)
+        parsed: ParsedUsage = self.server.cache.get(usage_request.content_hash, usage_request.load)
+        data: bytes = write_workbook_bytes(parsed.table, layout, rollups, intervals)
+        file_name: str = get_output_name(Path(usage_request.name))
+        self.send_response(200)
+        self.send_header('Content-Type', XLSX_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
+        self.send_header('X-Unmatched-Intervals', str(len(parsed.unmatched)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def get_usage_request(self, query: dict[str, list[str]]) -> UsageRequest:
+        """
+        Return the usage data a request names with ?path=, or sends as its body.
+        """
+        body: bytes = self.read_body()
+        jobs: Optional[int] = self.server.jobs
+        if 'path' in query:
+            path: Path = find_served_file(query['path'][-1], self.server.roots)
+            return UsageRequest(hash_file(str(path)), path.name, lambda: parse_usage_file(str(path), jobs))
+
+        data, name = get_upload(self.headers.get('Content-Type', ''), body)
+        if not data:
+            raise RequestError(400, 'Send a usage csv as the request body, or name one with ?path=.')
+        return UsageRequest(hashlib.sha256(data).hexdigest(), name, lambda: parse_usage_bytes(data, jobs))
+
+    def read_body(self) -> bytes:
+        """
+        Read the request body.  Raises RequestError if it's too large.
+        """
+        try:
+            length: int = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise RequestError(400, 'Invalid Content-Length.')
+        if length > MAX_UPLOAD_BYTES:
+            # The body is left unread, so the connection can't be reused.
+            self.close_connection = True
+            raise RequestError(413, f'Uploads are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+        return self.rfile.read(length) if length > 0 else b''
+
+    def send_json(self, status: int, data) -> None:
+        """
+        Send data as a JSON response.
+        """
+        body: bytes = json.dumps(data, indent=1).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_serve(host: Optional[str] = None, port: Optional[int] = None, cache_entries: Optional[int] = None,
+              roots: Optional[list[str]] = None, jobs: Optional[int] = 1) -> int:
+    """
+    Serve until stopped (Ctrl+C or SIGTERM).  host, port and cache_entries default to DEFAULT_HOST, DEFAULT_PORT
+    and DEFAULT_CACHE_ENTRIES.  ?path= requests may read csv files under roots (default: the current directory).
+
+    Returns 1 if a root isn't a directory or the server can't listen, otherwise 0.
+    """
+    root_paths: list[Path] = [Path(root).expanduser().resolve() for root in roots or ['.']]
+    for root in root_paths:
+        if not root.is_dir():
+            print(f'{root} is not a directory!')
+            return 1
+
+    cache: UsageCache = UsageCache(DEFAULT_CACHE_ENTRIES if cache_entries is None else cache_entries)
+    try:
+        server: UsageServer = UsageServer((host or DEFAULT_HOST, DEFAULT_PORT if port is None else port), cache,
+                                          root_paths, jobs)
+    except OSError as error:
+        print(f'Unable to listen on {host or DEFAULT_HOST}:{port or DEFAULT_PORT}: {error}')
+        return 1
+
+    # Import what writing a workbook needs now, rather than during the first request.
+    warm_up_worker()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    served_host, served_port = server.server_address[:2]
+    print(f'Serving TOU analysis on http://{served_host}:{served_port}/ (paths under '
+          f'{", ".join(map(str, root_paths))}).  Press Ctrl+C to stop.', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopping.', flush=True)
+    finally:
+        server.server_close()
+    return 0
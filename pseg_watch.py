@@ -0,0 +1,322 @@
+"""
+pseg_watch.py
+
+Long-running watch mode: convert usage downloads as they appear in a folder.
+
+The folder (e.g. 'PSEG Bills/Downloaded Usage') is watched with inotify on Linux, or polled elsewhere.  Events only
+trigger a rescan, so nothing is missed if events are dropped.  A csv is converted once its size and modification
+time have stayed the same for the settle time, so files still being written are left alone.  Conversions run on a
+pool of worker processes that stay up between files, with xlsxwriter already imported.
+
+A JSON state file in the output folder records the size and modification time of each file handled, so restarting
+doesn't convert completed files again.  A file is converted again when it changes.
+"""
+
+from typing import Optional, TypedDict
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from pseg_batch import (BatchResult, convert_usage_file, find_usage_files, format_result, get_output_dir,
+                        get_output_name, handle_sigterm, is_up_to_date, warm_up_worker)
+
+STATE_FILE_NAME: str = '.pseg_watch.json'
+DEFAULT_SETTLE_SECONDS: float = 2.0
+DEFAULT_POLL_SECONDS: float = 2.0
+# With inotify, rescan this often anyway, e.g. for network folders that don't send events.
+RESCAN_SECONDS: float = 60.0
+# How often to check on files that are settling or being converted.
+BUSY_SECONDS: float = 0.5
+
+# From <sys/inotify.h>.
+IN_MODIFY: int = 0x002
+IN_CLOSE_WRITE: int = 0x008
+IN_MOVED_TO: int = 0x080
+IN_CREATE: int = 0x100
+IN_DELETE_SELF: int = 0x400
+WATCH_MASK: int = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+
+class FileState(TypedDict):
+    size: int
+    mtime_ns: int
+    status: str         # 'ok', 'failed' or 'skipped' (Excel file was already newer)
+    output: str
+    processed: str      # ISO local time
+
+
+class InotifyWatcher:
+    """
+    inotify watches on a folder and its subfolders, through libc with ctypes.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd: int = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watched: set[Path] = set()
+
+    def add(self, directory: Path) -> None:
+        """
+        Watch directory, if it isn't already.
+        """
+        if directory in self.watched:
+            return
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f'Unable to watch {directory}')
+        self.watched.add(directory)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds for changes.  Returns True if there were any.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # The events themselves aren't needed, since any change means a rescan.
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify: every wait ends in a rescan.
+    """
+
+    def add(self, directory: Path) -> None:
+        pass
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(timeout)
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(polling: bool = False):
+    """
+    Return an InotifyWatcher, or a PollingWatcher if polling is requested or inotify isn't available.
+    """
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as error:
+            print(f'inotify is not available ({error}), polling instead.')
+    return PollingWatcher()
+
+
+def load_state(state_path: Path) -> dict[str, FileState]:
+    """
+    Read the state file.  A missing or unreadable file is an empty state.
+    """
+    try:
+        with open(state_path) as state_file:
+            return json.load(state_file)['files']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def save_state(state_path: Path, files: dict[str, FileState]) -> None:
+    """
+    Write the state file through a temporary file, so it's never left half written.
+    """
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temp_name = tempfile.mkstemp(dir=state_path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w') as temp_file:
+            json.dump({'version': 1, 'files': files}, temp_file, indent=1)
+        os.replace(temp_name, state_path)
+    except OSError:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+def init_worker() -> None:
+    """
+    Pool initializer.  Workers ignore Ctrl+C and SIGTERM, which reach the whole process group, so conversions that
+    are running when watch mode stops still finish.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    warm_up_worker()
+
+
+class UsageFolderWatcher:
+    """
+    Converts new and changed csv files under input_dir into output_dir.  Call run(), or scan() and collect() in a loop.
+    """
+
+    def __init__(self, input_dir: Path, output_dir: Path, jobs: int = 1, streaming: bool = False,
+                 cache_dir: Optional[str] = None, settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+                 state_path: Optional[Path] = None):
+        self.input_dir: Path = input_dir
+        self.output_dir: Path = output_dir
+        self.jobs: int = jobs
+        self.streaming: bool = streaming
+        self.cache_dir: Optional[str] = cache_dir
+        self.settle_seconds: float = settle_seconds
+        self.state_path: Path = state_path or output_dir / STATE_FILE_NAME
+        self.files: dict[str, FileState] = load_state(self.state_path)
+        # (size, mtime_ns) of files waiting to settle, and when they were first seen that way.
+        self.settling: dict[Path, tuple[tuple[int, int], float]] = {}
+        self.running: dict[Future, tuple[Path, tuple[int, int]]] = {}
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def scan(self, watcher=None) -> None:
+        """
+        Submit every csv that is new or changed since it was last handled and has settled.
+        """
+        now: float = time.monotonic()
+        busy: set[Path] = {csv_path for csv_path, _ in self.running.values()}
+        seen: set[Path] = set()
+        if watcher is not None:
+            watcher.add(self.input_dir)
+            for directory in self.input_dir.rglob('*'):
+                try:
+                    if directory.is_dir():
+                        watcher.add(directory)
+                except OSError:
+                    # Removed since rglob listed it.
+                    pass
+
+        for csv_path in find_usage_files(self.input_dir):
+            try:
+                stat: os.stat_result = csv_path.stat()
+            except OSError:
+                continue
+            signature: tuple[int, int] = (stat.st_size, stat.st_mtime_ns)
+            state: Optional[FileState] = self.files.get(str(csv_path))
+            if csv_path in busy or (state is not None and (state['size'], state['mtime_ns']) == signature):
+                continue
+            seen.add(csv_path)
+
+            previous: Optional[tuple[tuple[int, int], float]] = self.settling.get(csv_path)
+            if previous is None or previous[0] != signature:
+                self.settling[csv_path] = (signature, now)
+            elif now - previous[1] >= self.settle_seconds:
+                del self.settling[csv_path]
+                self.submit(csv_path, signature)
+
+        # Forget files that were deleted or renamed while settling.
+        for csv_path in set(self.settling) - seen:
+            del self.settling[csv_path]
+
+    def submit(self, csv_path: Path, signature: tuple[int, int]) -> None:
+        """
+        Convert one settled file on the pool, unless its Excel file is already newer (e.g. from a batch run).
+        """
+        xlsx_path: Path = self.output_dir / get_output_name(csv_path)
+        if str(csv_path) not in self.files and is_up_to_date(csv_path, xlsx_path):
+            self.record(BatchResult(csv_path, xlsx_path, 'skipped', 'Excel file is newer than csv.'), signature)
+            return
+        if self.executor is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker)
+        future: Future = self.executor.submit(convert_usage_file, csv_path, xlsx_path, self.streaming, self.cache_dir)
+        self.running[future] = (csv_path, signature)
+
+    def collect(self) -> None:
+        """
+        Record and print the results of finished conversions.
+        """
+        for future in [future for future in self.running if future.done()]:
+            csv_path, signature = self.running.pop(future)
+            # Cancelled when stopping.  Left out of the state so it's converted after a restart.
+            if future.cancelled():
+                continue
+            try:
+                result: BatchResult = future.result()
+            except BaseException as error:
+                # Worker process died (e.g. out of memory), or a KeyboardInterrupt came back from it.
+                result = BatchResult(csv_path, self.output_dir / get_output_name(csv_path), 'failed',
+                                     f'{type(error).__name__}: {error}')
+            self.record(result, signature)
+
+    def record(self, result: BatchResult, signature: tuple[int, int]) -> None:
+        """
+        Print a result and save it to the state file.  Failed files are retried once they change.
+        """
+        print(format_result(result), flush=True)
+        self.files[str(result.csv_path)] = {
+            'size': signature[0],
+            'mtime_ns': signature[1],
+            'status': result.status,
+            'output': str(result.xlsx_path),
+            'processed': datetime.now().isoformat(timespec='seconds'),
+        }
+        try:
+            save_state(self.state_path, self.files)
+        except OSError as error:
+            print(f'Unable to save {self.state_path}: {error}')
+
+    def is_busy(self) -> bool:
+        """
+        Returns True while files are settling or being converted.
+        """
+        return bool(self.settling or self.running)
+
+    def run(self, polling: bool = False, poll_seconds: float = DEFAULT_POLL_SECONDS) -> None:
+        """
+        Watch until interrupted (Ctrl+C or SIGTERM), then finish running conversions.
+        """
+        watcher = open_watcher(polling)
+        idle_seconds: float = poll_seconds if isinstance(watcher, PollingWatcher) else RESCAN_SECONDS
+        print(f'Watching {self.input_dir} for usage csv files ({type(watcher).__name__}).  Press Ctrl+C to stop.',
+              flush=True)
+        try:
+            self.scan(watcher)
+            while True:
+                watcher.wait(min(BUSY_SECONDS, poll_seconds) if self.is_busy() else idle_seconds)
+                self.collect()
+                self.scan(watcher)
+        except KeyboardInterrupt:
+            print('Stopping.  Waiting for running conversions to finish.', flush=True)
+        finally:
+            watcher.close()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+            self.collect()
+
+
+def run_watch(directory: str, output_dir: Optional[str] = None, jobs: Optional[int] = None, streaming: bool = False,
+              cache_dir: Optional[str] = None, settle_seconds: Optional[float] = None,
+              poll_seconds: Optional[float] = None, polling: bool = False, state_file: Optional[str] = None) -> int:
+    """
+    Watch directory and convert usage csv files into output_dir (default 'Parsed' next to directory) until stopped.
+    settle_seconds and poll_seconds default to DEFAULT_SETTLE_SECONDS and DEFAULT_POLL_SECONDS.
+
+    Returns 1 if directory doesn't exist, otherwise 0.
+    """
+    input_dir: Path = Path(directory)
+    if not input_dir.is_dir():
+        print(f'{directory} is not a directory!')
+        return 1
+
+    # Small pool: downloads arrive one or two at a time.
+    watcher: UsageFolderWatcher = UsageFolderWatcher(
+        input_dir.resolve(), get_output_dir(input_dir, output_dir), jobs or min(2, os.cpu_count() or 1), streaming,
+        cache_dir, DEFAULT_SETTLE_SECONDS if settle_seconds is None else settle_seconds,
+        Path(state_file) if state_file else None)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    watcher.run(polling, DEFAULT_POLL_SECONDS if poll_seconds is None else poll_seconds)
+    return 0
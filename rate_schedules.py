@@ -0,0 +1,224 @@
+"""
+rate_schedules.py
+
+TOU rate schedules described as data, compiled into (month, day type, 15-minute slot) lookup tables.
+"""
+
+from typing import Optional, TypedDict
+import json
+import re
+import numpy as np
+from tou_engine import OFF_PEAK, PEAK, SUPER_OFF_PEAK, SECONDS_PER_DAY, EPOCH_DAY_OF_WEEK, INTERVAL_SECONDS
+
+# Schedules are looked up by interval start, one slot per reading.
+SLOT_SECONDS: int = INTERVAL_SECONDS
+SLOTS_PER_DAY: int = SECONDS_PER_DAY // SLOT_SECONDS
+TIME_PATTERN = re.compile(r'([01]?\d|2[0-3]):[0-5]\d')
+
+# Day types index the second axis of a compiled table: 0 = Sunday, ..., 6 = Saturday, 7 = holiday.
+HOLIDAY: int = 7
+DAY_TYPES: int = 8
+ALL_DAYS: list[int] = [0, 1, 2, 3, 4, 5, 6]
+WEEKDAYS: list[int] = [1, 2, 3, 4, 5]
+
+PERIOD_NAMES: dict[int, str] = {OFF_PEAK: 'Off-Peak', PEAK: 'Peak', SUPER_OFF_PEAK: 'Super Off-Peak'}
+
+
+class PeriodWindow(TypedDict, total=False):
+    period: int             # Period code from tou_engine
+    start: str              # 'HH:MM', first reading time in the window
+    end: str                # 'HH:MM', first reading time after the window.  Wraps past midnight if <= start.
+    days: list[int]         # Days of week the window applies to.  Defaults to ALL_DAYS.
+    months: list[int]       # Months (1-12) the window applies to.  Defaults to every month.
+    holidays: bool          # Whether the window also applies on holidays.  Defaults to True.
+
+
+class RateSchedule(TypedDict):
+    name: str
+    windows: list[PeriodWindow]     # Later windows take precedence.  Times outside every window are OFF_PEAK.
+
+
+# Holiday rules: ('fixed', month, day) moves to Friday/Monday when it falls on Saturday/Sunday, and
+# ('weekday', month, day of week, n) is the nth such day of the month, or the last one when n is -1.
+HOLIDAY_RULES: list[tuple] = [
+    ('fixed', 1, 1),            # New Year's Day
+    ('weekday', 5, 1, -1),      # Memorial Day
+    ('fixed', 7, 4),            # Independence Day
+    ('weekday', 9, 1, 1),       # Labor Day
+    ('weekday', 11, 4, 4),      # Thanksgiving Day
+    ('fixed', 12, 25),          # Christmas Day
+]
+
+# Timestamps are interval starts (see tou_engine.INTERVAL_SECONDS).  As in PSEG's downloads, the 3:00 PM reading is
+# the first peak reading and the 7:00 PM reading is off-peak.  The 10:00 PM reading is the last off-peak reading and the 6:00 AM reading is the last
+# super off-peak reading.
+RATE_SCHEDULES: dict[str, RateSchedule] = {
+    '180': {
+        'name': 'Non-TOU',
+        'windows': [],
+    },
+    '194': {
+        'name': 'Off-Peak',
+        'windows': [
+            {'period': PEAK, 'start': '15:00', 'end': '19:00', 'days': WEEKDAYS, 'holidays': False},
+        ],
+    },
+    '195': {
+        'name': 'Super Off-Peak',
+        'windows': [
+            {'period': PEAK, 'start': '15:00', 'end': '19:00', 'days': WEEKDAYS, 'holidays': False},
+            {'period': SUPER_OFF_PEAK, 'start': '22:15', 'end': '06:15'},
+        ],
+    },
+}
+
+
+def load_rate_schedules(json_file_name: str) -> dict[str, RateSchedule]:
+    """
+    Read schedules in the RATE_SCHEDULES format from a JSON file.  Periods may be given by code or name.
+
+    Raises ValueError if a schedule isn't in that format.
+    """
+    codes: dict[str, int] = {name: code for code, name in PERIOD_NAMES.items()}
+    with open(json_file_name) as json_file:
+        schedules: dict[str, RateSchedule] = json.load(json_file)
+    if not isinstance(schedules, dict):
+        raise ValueError(f'{json_file_name} must be an object of schedules keyed by rate.')
+    for rate, schedule in schedules.items():
+        if not isinstance(schedule, dict) or 'name' not in schedule or not isinstance(schedule.get('windows'), list):
+            raise ValueError(f'Schedule {rate!r} needs a name and a list of windows.')
+        for window in schedule['windows']:
+            period = window.get('period')
+            window['period'] = codes.get(period, period)
+            if window['period'] not in PERIOD_NAMES:
+                raise ValueError(f'Schedule {rate!r} has unknown period {period!r}.  '
+                                 f'Use one of {", ".join(PERIOD_NAMES.values())}.')
+            for key in ('start', 'end'):
+                if not TIME_PATTERN.fullmatch(str(window.get(key, ''))):
+                    raise ValueError(f'Schedule {rate!r} has {key} {window.get(key)!r}, which isn\'t an HH:MM time.')
+    return schedules
+
+
+def use_rate_schedules(schedules: dict[str, RateSchedule]) -> None:
+    """
+    Add schedules to RATE_SCHEDULES, replacing built-in schedules with the same rate.
+    """
+    RATE_SCHEDULES.update(schedules)
+    for rate in schedules:
+        _COMPILED_SCHEDULES.pop(rate, None)
+
+
+def time_to_slot(time_string: str) -> int:
+    """
+    Return the first 15-minute slot at or after an 'HH:MM' time.
+    """
+    hours, minutes = time_string.split(':')
+    return -(-(int(hours) * 3600 + int(minutes) * 60) // SLOT_SECONDS)
+
+
+def compile_schedule(schedule: RateSchedule) -> np.ndarray:
+    """
+    Build a uint8 period table indexed by [month - 1, day type, slot].
+    """
+    table: np.ndarray = np.full((12, DAY_TYPES, SLOTS_PER_DAY), OFF_PEAK, dtype=np.uint8)
+    for window in schedule['windows']:
+        start_slot: int = time_to_slot(window['start'])
+        end_slot: int = time_to_slot(window['end'])
+        if end_slot > start_slot:
+            slots: np.ndarray = np.arange(start_slot, end_slot)
+        else:
+            slots = np.r_[start_slot:SLOTS_PER_DAY, 0:end_slot]
+
+        day_types: list[int] = list(window.get('days', ALL_DAYS))
+        if window.get('holidays', True):
+            day_types.append(HOLIDAY)
+        months: np.ndarray = np.asarray(window.get('months', range(1, 13))) - 1
+
+        table[np.ix_(months, day_types, slots)] = window['period']
+    return table
+
+
+def get_holidays(years: range) -> set[int]:
+    """
+    Return day numbers (days since 1970-01-01) of every HOLIDAY_RULES holiday in years.
+    """
+    holidays: set[int] = set()
+    for year in years:
+        for rule in HOLIDAY_RULES:
+            if rule[0] == 'fixed':
+                day = int(np.datetime64(f'{year:04}-{rule[1]:02}-{rule[2]:02}', 'D').astype(np.int64))
+                day_of_week: int = (day + EPOCH_DAY_OF_WEEK) % 7
+                if day_of_week == 6:
+                    day -= 1
+                elif day_of_week == 0:
+                    day += 1
+            else:
+                _, month, weekday, nth = rule
+                first = int(np.datetime64(f'{year:04}-{month:02}', 'M').astype('datetime64[D]').astype(np.int64))
+                if nth > 0:
+                    day = first + (weekday - first - EPOCH_DAY_OF_WEEK) % 7 + 7 * (nth - 1)
+                else:
+                    next_month = int((np.datetime64(f'{year:04}-{month:02}', 'M') + 1).astype('datetime64[D]').astype(np.int64))
+                    last: int = next_month - 1
+                    day = last - (last + EPOCH_DAY_OF_WEEK - weekday) % 7
+            holidays.add(day)
+    return holidays
+
+
+def get_day_rows(first_day: int, last_day: int) -> np.ndarray:
+    """
+    Return the flattened table row (month * DAY_TYPES + day type) for each day from first_day to last_day.
+    """
+    days: np.ndarray = np.arange(first_day, last_day + 1, dtype=np.int64)
+    dates: np.ndarray = days.astype('datetime64[D]')
+    months: np.ndarray = dates.astype('datetime64[M]').astype(np.int64) % 12
+    day_types: np.ndarray = (days + EPOCH_DAY_OF_WEEK) % 7
+
+    years: np.ndarray = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    holidays: np.ndarray = np.fromiter(get_holidays(range(int(years[0]), int(years[-1]) + 1)), dtype=np.int64)
+    day_types[np.isin(days, holidays)] = HOLIDAY
+
+    return months * DAY_TYPES + day_types
+
+
+class CompiledSchedule:
+    """
+    A RateSchedule compiled to a lookup table, so classifying an interval is a single array index.
+    """
+
+    def __init__(self, schedule: RateSchedule):
+        self.name: str = schedule['name']
+        self.table: np.ndarray = compile_schedule(schedule).reshape(-1)
+
+    def classify(self, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Return the period code for each timestamp (seconds since EPOCH, local time).
+        """
+        if len(timestamps) == 0:
+            return np.empty(0, dtype=np.uint8)
+
+        days: np.ndarray = timestamps // SECONDS_PER_DAY
+        first_day: int = int(days.min())
+        day_rows: np.ndarray = get_day_rows(first_day, int(days.max()))
+        slots: np.ndarray = (timestamps % SECONDS_PER_DAY) // SLOT_SECONDS
+        return self.table[day_rows[days - first_day] * SLOTS_PER_DAY + slots]
+
+
+_COMPILED_SCHEDULES: dict[str, CompiledSchedule] = {}
+
+
+def get_compiled_schedule(rate: str) -> CompiledSchedule:
+    """
+    Return the compiled RATE_SCHEDULES entry for rate, compiling it the first time it's used.
+    """
+    compiled: Optional[CompiledSchedule] = _COMPILED_SCHEDULES.get(rate)
+    if compiled is None:
+        compiled = _COMPILED_SCHEDULES[rate] = CompiledSchedule(RATE_SCHEDULES[rate])
+    return compiled
+
+
+def classify_rate(rate: str, timestamps: np.ndarray) -> np.ndarray:
+    """
+    Return period codes for timestamps under RATE_SCHEDULES[rate].
+    """
+    return get_compiled_schedule(rate).classify(timestamps)
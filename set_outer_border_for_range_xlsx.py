@@ -2,11 +2,15 @@
 import re
 import string
 from typing import TypedDict
+from weakref import WeakKeyDictionary
 
 # Third Party Stuff
 import xlsxwriter
 from xlsxwriter.utility import xl_cell_to_rowcol
 
+# Local
+import profiling
+
 CellCentering = TypedDict('CellCentering', {'align': str, 'valign': str})
 CenteringType = TypedDict('CenteringType', {'range_string': str, 'centering': CellCentering})
 
@@ -46,16 +50,74 @@ XLSXWRITER_FORMAT_PROPERTIES = (
 )
 
 
-def duplicate_xlsxwriter_format_object(workbook, old_format):
+def get_format_properties(old_format):
 
     properties = {}
     if old_format is not None:
         for property_name in XLSXWRITER_FORMAT_PROPERTIES:
             val = getattr(old_format, property_name)
             if val is not None:
-                properties[property_name] = val 
+                properties[property_name] = val
+
+    return properties
+
+
+def duplicate_xlsxwriter_format_object(workbook, old_format):
+
+    return workbook.add_format(get_format_properties(old_format))
+
+
+class FormatRegistry:
+    """
+    Interns xlsxwriter formats by their resolved properties so identical cell formats share one Format object.
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.formats = {}
+        self.requested = 0
 
-    return workbook.add_format(properties)
+    @staticmethod
+    def format_key(properties):
+        # Colors are xlsxwriter Color objects that compare by identity, so key them by their repr.
+        return tuple(sorted(
+            (name, value if isinstance(value, (int, float, str)) else repr(value))
+            for name, value in properties.items()
+        ))
+
+    def get_format(self, properties):
+        self.requested += 1
+        key = self.format_key(properties)
+        cell_format = self.formats.get(key)
+        if cell_format is None:
+            cell_format = self.workbook.add_format(properties)
+            self.formats[key] = cell_format
+        return cell_format
+
+    @property
+    def unique(self):
+        return len(self.formats)
+
+    def stats(self):
+        return {"requested": self.requested, "unique": self.unique}
+
+    def count_since(self, before):
+        """
+        Add format requests and new unique formats since before (an earlier stats()) to the running profiling stage.
+        """
+        after = self.stats()
+        profiling.count(format_requests=after["requested"] - before["requested"],
+                        unique_formats=after["unique"] - before["unique"])
+
+
+_FORMAT_REGISTRIES = WeakKeyDictionary()
+
+
+def get_format_registry(workbook):
+    registry = _FORMAT_REGISTRIES.get(workbook)
+    if registry is None:
+        registry = _FORMAT_REGISTRIES[workbook] = FormatRegistry(workbook)
+    return registry
 
 
 def col2num(col):
@@ -87,23 +149,23 @@ def excel_range_string_to_indices(range_string):
 
 
 def apply_border_to_cell(workbook, worksheet, row_index, col_index, format_properties):
+    registry = get_format_registry(workbook)
     try:
         cell = worksheet.table[row_index][col_index]
-        new_format = duplicate_xlsxwriter_format_object(workbook, cell.format)
-
-        # Convert properties in the constructor to method calls.
-        for key, value in format_properties.items():
-            getattr(new_format, 'set_' + key)(value)
+        properties = get_format_properties(cell.format)
+        properties.update(format_properties)
 
         # Update cell object
-        worksheet.table[row_index][col_index] = cell = cell._replace(format=new_format)
+        worksheet.table[row_index][col_index] = cell = cell._replace(format=registry.get_format(properties))
     except KeyError:
-        format = workbook.add_format(format_properties)
+        format = registry.get_format(format_properties)
         worksheet.write(row_index, col_index, None, format)
 
 
 def apply_outer_border_to_range(workbook, worksheet, options=None):
     options = options or {}
+    registry = get_format_registry(workbook)
+    before = registry.stats()
 
     border_style = options.get("border_style", 1)
     range_string = options.get("range_string", None)
@@ -175,6 +237,10 @@ def apply_outer_border_to_range(workbook, worksheet, options=None):
     }
     apply_border_to_cell(workbook, worksheet, last_row_index, last_col_index, bottom_right_border)
 
+    # Every edge cell is rewritten once per side, plus once more for each corner.
+    profiling.count(cells=2 * (last_row_index - first_row_index + 1) + 2 * (last_col_index - first_col_index + 1) + 4)
+    registry.count_since(before)
+
 # def apply_centering_to_range(book, sheet, options: CenteringType) -> None:
 #    """
 #    Applies vertical and horizontal alignment to a range of cells.
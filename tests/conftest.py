@@ -0,0 +1,10 @@
+"""
+conftest.py
+
+The modules are flat files at the top of the repo, so put it on the import path.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,37 @@
+"""
+test_bill_simulation.py
+
+Tests for bill_simulation.
+"""
+
+from datetime import datetime
+import numpy as np
+from bill_simulation import simulate_usage
+from tou_engine import EPOCH, EST_OFFSET, INTERVAL_SECONDS, SECONDS_PER_DAY, UsageArrays
+
+
+def get_flat_week() -> UsageArrays:
+    """
+    1 kWh in every interval of the week of Monday, January 13, 2025, which has no holidays.
+    """
+    start: int = int((datetime(2025, 1, 13) - EPOCH).total_seconds())
+    timestamps: np.ndarray = np.arange(start, start + 7 * SECONDS_PER_DAY, INTERVAL_SECONDS, dtype=np.int64)
+    count: int = len(timestamps)
+    return UsageArrays(timestamps, np.full(count, 80395501, dtype=np.int64), np.ones(count), np.zeros(count),
+                       np.full(count, np.nan), np.full(count, EST_OFFSET, dtype=np.int32))
+
+
+def test_flat_week_bills():
+    rows: list[dict] = simulate_usage(get_flat_week(), power_supply_rate=0.1)
+    bills: dict[str, dict] = {row['plan']: row for row in rows}
+
+    # Peak is 3:00 through 6:45 PM on weekdays, and super off-peak 10:15 PM through 6:00 AM every day.
+    assert [(row['plan'], row['days'], row['net'], row['peak_net'], row['super_off_peak_net']) for row in rows] == [
+        ('180', 7, 672, 0, 0), ('194', 7, 672, 80, 0), ('195', 7, 672, 80, 224)]
+    # Non-summer prices: 672 kWh of delivery, with the excess rate equal to the base rate in winter.
+    assert (bills['180']['service_charge'], bills['180']['delivery'], bills['180']['power_supply'],
+            bills['180']['total']) == (3.78, 68.61, 67.2, 139.59)
+    # 592 off-peak and 80 peak kWh.
+    assert (bills['194']['delivery'], bills['194']['power_supply'], bills['194']['total']) == (67.22, 65.96, 136.96)
+    # 224 super off-peak, 368 off-peak and 80 peak kWh.
+    assert (bills['195']['delivery'], bills['195']['power_supply'], bills['195']['total']) == (61.19, 65.65, 130.62)
@@ -0,0 +1,59 @@
+"""
+test_interval_cache.py
+
+Tests for interval_cache.
+"""
+
+from datetime import date
+import numpy as np
+import interval_cache
+from interval_cache import IntervalCache
+from tou_engine import load_usage_intervals
+from usage_generator import write_usage_csv
+
+
+def assert_usage_equal(usage, expected) -> None:
+    for column, expected_column in zip(usage, expected):
+        np.testing.assert_array_equal(column, expected_column)
+
+
+def test_cache_hits_until_file_or_parser_changes(tmp_path, monkeypatch):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 2)
+    cache: IntervalCache = IntervalCache(str(tmp_path / 'cache'))
+
+    usage, _ = cache.load_usage_intervals(str(csv_path))
+    cached, unmatched = cache.load_usage_intervals(str(csv_path))
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert unmatched == []
+    assert_usage_equal(cached, usage)
+
+    # Changed contents are a new entry.
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 2, seed=1)
+    changed, _ = cache.load_usage_intervals(str(csv_path))
+    assert (cache.misses, cache.hits) == (2, 1)
+    assert_usage_equal(changed, load_usage_intervals(str(csv_path))[0])
+    assert not np.array_equal(changed.consumed, usage.consumed)
+
+    # A new parser version misses, and evicts the old version's entries.
+    monkeypatch.setattr(interval_cache, 'PARSER_VERSION', interval_cache.PARSER_VERSION + 1)
+    cache.load_usage_intervals(str(csv_path))
+    assert (cache.misses, cache.hits) == (3, 1)
+    assert [path.name.rsplit('-', 1)[1] for path in (tmp_path / 'cache').glob('*.npy')] == [
+        f'v{interval_cache.PARSER_VERSION}.npy']
+
+
+def test_files_with_unmatched_intervals_are_not_cached(tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 1)
+    lines: list[str] = csv_path.read_text().splitlines(keepends=True)
+    csv_path.write_text(''.join(lines[:-1]))
+    cache: IntervalCache = IntervalCache(str(tmp_path / 'cache'))
+
+    for _ in range(2):
+        _, unmatched = cache.load_usage_intervals(str(csv_path))
+        assert len(unmatched) == 1
+    assert (cache.misses, cache.hits) == (2, 0)
@@ -0,0 +1,33 @@
+"""
+test_parallel_parse.py
+
+Tests for parallel_parse.
+"""
+
+from datetime import date
+import numpy as np
+import parallel_parse
+from tou_engine import load_usage_intervals
+from usage_generator import write_usage_csv
+
+
+def test_quoted_file_is_split_on_intervals(tmp_path, monkeypatch):
+    """
+    A fully quoted download is parsed in chunks without falling back to the serial parse.
+    """
+    csv_path = tmp_path / 'quoted.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 30, meters=2, quoted=True)
+    expected_usage, expected_unmatched = load_usage_intervals(str(csv_path))
+
+    def serial_parse(csv_file_name):
+        raise AssertionError('fell back to the serial parse')
+
+    monkeypatch.setattr(parallel_parse, 'load_usage_intervals', serial_parse)
+    monkeypatch.setattr(parallel_parse, 'MIN_CHUNK_BYTES', csv_path.stat().st_size // 8)
+    assert len(parallel_parse.split_file(str(csv_path), 4)) == 4
+    usage, unmatched = parallel_parse.load_usage_intervals_parallel(str(csv_path), 4)
+
+    for column, expected in zip(usage, expected_usage):
+        np.testing.assert_array_equal(column, expected)
+    assert unmatched == expected_unmatched
@@ -0,0 +1,30 @@
+"""
+test_pseg_parse.py
+
+Tests for pseg_parse.
+"""
+
+import sys
+import pytest
+from pseg_parse import main, pseg_parse
+
+
+@pytest.mark.parametrize('contents, message', [
+    (None, 'No such file'),
+    ('Start,Meter,kWh,kW\n"' + 'x' * 200000 + '",Meter #1 - Off-Peak,1,\n', 'field larger than field limit'),
+], ids=['missing', 'oversized field'])
+def test_unreadable_csv_is_reported(tmp_path, capsys, contents, message):
+    csv_path = tmp_path / 'usage.csv'
+    if contents is not None:
+        csv_path.write_text(contents)
+    assert not pseg_parse(str(csv_path), str(tmp_path / 'usage.xlsx'))
+    assert message in capsys.readouterr().out
+    assert not (tmp_path / 'usage.xlsx').exists()
+
+
+def test_simulate_requires_power_supply_rate(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['pseg_parse.py', 'simulate', str(tmp_path)])
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 2
+    assert '--power-supply-rate' in capsys.readouterr().err
@@ -0,0 +1,72 @@
+"""
+test_pseg_serve.py
+
+Tests for pseg_serve, against a server on a free local port.
+"""
+
+from typing import Optional
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import date
+import pytest
+import pseg_serve
+from usage_generator import write_usage_csv
+
+
+@pytest.fixture
+def server(tmp_path):
+    usage_server = pseg_serve.UsageServer(('127.0.0.1', 0), pseg_serve.UsageCache(2), [tmp_path])
+    thread = threading.Thread(target=usage_server.serve_forever, daemon=True)
+    thread.start()
+    yield usage_server
+    usage_server.shutdown()
+    usage_server.server_close()
+
+
+def get(server, path: str, data: Optional[bytes] = None) -> tuple[int, dict]:
+    url = f'http://127.0.0.1:{server.server_address[1]}{path}'
+    try:
+        with urllib.request.urlopen(url, data) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_totals_by_path_are_parsed_once(server, tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 2)
+
+    for _ in range(2):
+        status, totals = get(server, f'/totals?path={csv_path}')
+        assert status == 200
+        assert totals['intervals'] == 2 * 96
+        assert {plan['plan'] for plan in totals['plans']} == {'180', '194', '195'}
+    assert server.cache.get_status()['misses'] == 1
+    assert server.cache.get_status()['hits'] == 1
+
+
+@pytest.mark.parametrize('error, status', [
+    (FileNotFoundError(2, 'No such file or directory'), 404),
+    (PermissionError(13, 'Permission denied'), 403),
+    (OSError(5, 'Input/output error'), 500),
+])
+def test_unreadable_path_is_a_json_error(server, tmp_path, monkeypatch, error, status):
+    (tmp_path / 'usage.csv').write_text('Start,Meter,kWh,kW\n')
+
+    def hash_file(csv_file_name):
+        raise error
+
+    monkeypatch.setattr(pseg_serve, 'hash_file', hash_file)
+    response_status, response = get(server, f'/totals?path={tmp_path / "usage.csv"}')
+    assert response_status == status
+    assert error.strerror in response['error']
+
+
+def test_malformed_upload_is_a_json_error(server):
+    body: bytes = ('Start,Meter,kWh,kW\n"' + 'x' * 200000 + '",Meter #1 - Off-Peak,1,\n').encode()
+    status, response = get(server, '/totals', body)
+    assert status == 422
+    assert 'field larger than field limit' in response['error']
@@ -0,0 +1,42 @@
+"""
+test_rate_schedules.py
+
+Tests for rate_schedules.
+"""
+
+import json
+import numpy as np
+import pytest
+import rate_schedules
+from tou_engine import OFF_PEAK, PEAK, SUPER_OFF_PEAK
+
+# 2025-01-16 (a Thursday) 4:00 PM and 11:00 PM, local time.
+THURSDAY_4_PM: int = 1737043200
+THURSDAY_11_PM: int = THURSDAY_4_PM + 7 * 3600
+
+
+def test_loaded_schedule_replaces_built_in(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_schedules, 'RATE_SCHEDULES', dict(rate_schedules.RATE_SCHEDULES))
+    monkeypatch.setattr(rate_schedules, '_COMPILED_SCHEDULES', {})
+    timestamps: np.ndarray = np.array([THURSDAY_4_PM, THURSDAY_11_PM], dtype=np.int64)
+    assert rate_schedules.classify_rate('195', timestamps).tolist() == [PEAK, SUPER_OFF_PEAK]
+
+    schedules_path = tmp_path / 'schedules.json'
+    schedules_path.write_text(json.dumps({'195': {'name': 'Evening Peak', 'windows': [
+        {'period': 'Peak', 'start': '17:00', 'end': '21:00'},
+        {'period': 'Super Off-Peak', 'start': '00:15', 'end': '06:15'},
+    ]}}))
+    rate_schedules.use_rate_schedules(rate_schedules.load_rate_schedules(str(schedules_path)))
+    assert rate_schedules.classify_rate('195', timestamps).tolist() == [OFF_PEAK, OFF_PEAK]
+    assert rate_schedules.get_compiled_schedule('195').name == 'Evening Peak'
+
+
+@pytest.mark.parametrize('window', [
+    {'period': 'Mid-Peak', 'start': '15:00', 'end': '19:00'},
+    {'period': 'Peak', 'start': '3 PM', 'end': '19:00'},
+])
+def test_invalid_schedule_is_rejected(tmp_path, window):
+    schedules_path = tmp_path / 'schedules.json'
+    schedules_path.write_text(json.dumps({'195': {'name': 'Bad', 'windows': [window]}}))
+    with pytest.raises(ValueError):
+        rate_schedules.load_rate_schedules(str(schedules_path))
@@ -0,0 +1,28 @@
+"""
+test_set_outer_border.py
+
+Tests for set_outer_border_for_range_xlsx.
+"""
+
+import xlsxwriter
+import profiling
+from set_outer_border_for_range_xlsx import apply_outer_border_to_range, get_format_registry
+
+
+def test_format_requests_and_unique_formats_are_counted(tmp_path):
+    workbook = xlsxwriter.Workbook(str(tmp_path / 'borders.xlsx'))
+    worksheet = workbook.add_worksheet()
+    with profiling.Profiler() as profiler:
+        with profiling.stage('first'):
+            apply_outer_border_to_range(workbook, worksheet, {'range_string': 'A1:C3'})
+        with profiling.stage('second'):
+            apply_outer_border_to_range(workbook, worksheet, {'range_string': 'E1:G3'})
+    workbook.close()
+
+    first, second = (profile['counters'] for profile in profiler.stages)
+    # 3 rows on each side, 3 columns on top and bottom, and 4 corners.
+    assert first['format_requests'] == second['format_requests'] == 16
+    assert first['unique_formats'] == get_format_registry(workbook).unique > 0
+    # The same range elsewhere reuses every format.
+    assert second['unique_formats'] == 0
+    assert get_format_registry(workbook).stats() == {'requested': 32, 'unique': first['unique_formats']}
@@ -0,0 +1,176 @@
+"""
+test_tou_engine.py
+
+Tests for tou_engine.
+"""
+
+from typing import Optional
+import random
+from datetime import date, datetime
+import numpy as np
+import pytest
+from tou_engine import (EDT_OFFSET, EPOCH, EST_OFFSET, INTERVAL_SECONDS, SECONDS_PER_DAY, UnmatchedInterval,
+                        UsageArrays, load_usage_intervals, parse_fixed_timestamps, parse_timestamps,
+                        try_parse_timestamps)
+from usage_generator import write_usage_csv
+
+
+def strptime_timestamp(value: str) -> Optional[int]:
+    """
+    Return the timestamp strptime gives for a PSEG time, or None if it rejects it.
+    """
+    try:
+        return int((datetime.strptime(value, '%m/%d/%Y %I:%M:%S %p') - EPOCH).total_seconds())
+    except ValueError:
+        return None
+
+
+def get_fuzzed_times(count: int) -> list[str]:
+    """
+    Return PSEG style times whose fields are often out of range: months 0-13, days 0-32, hours 0-13 (sometimes zero
+    padded), minutes and seconds up to 60, and AM/PM in any case or misspelled.
+    """
+    rng: random.Random = random.Random(0)
+    times: list[str] = []
+    for _ in range(count):
+        hour: int = rng.randint(0, 13)
+        hour_text: str = f'{hour:02}' if rng.random() < 0.2 else str(hour)
+        times.append(f'{rng.randint(0, 13):02}/{rng.randint(0, 32):02}/{rng.choice([1999, 2024, 2025, 2100])} '
+                     f'{hour_text}:{rng.randint(0, 60):02}:{rng.randint(0, 60):02} '
+                     f'{rng.choice(["AM", "PM", "am", "Pm", "XM", "AN"])}')
+    return times
+
+
+def test_timestamps_match_strptime():
+    times: list[str] = get_fuzzed_times(20000) + ['02/29/2024 12:00:00 AM', '02/29/2025 12:00:00 AM',
+                                                  '04/31/2025 1:00:00 PM', '12/31/2025 11:59:59 PM']
+    timestamps, valid = try_parse_timestamps(times)
+
+    expected: list[Optional[int]] = [strptime_timestamp(value) for value in times]
+    assert valid.tolist() == [value is not None for value in expected]
+    assert timestamps.tolist() == [value or 0 for value in expected]
+    # The fuzzed times cover both outcomes.
+    assert 0 < valid.sum() < len(times)
+
+    # Without the strptime retry, the array parser still accepts exactly the valid upper case times.
+    for width in (21, 22):
+        fixed_times: np.ndarray = np.array([value for value in times if len(value) == width], dtype=f'U{width}')
+        fixed_timestamps, fixed_valid = parse_fixed_timestamps(
+            fixed_times.view(np.uint32).reshape(len(fixed_times), width))
+        fixed_expected: list[Optional[int]] = [strptime_timestamp(value) if value[-2:] in ('AM', 'PM') else None
+                                               for value in fixed_times.tolist()]
+        assert fixed_valid.tolist() == [value is not None for value in fixed_expected]
+        assert fixed_timestamps.tolist() == [value or 0 for value in fixed_expected]
+
+
+def test_invalid_timestamp_raises_strptime_error():
+    with pytest.raises(ValueError, match='out of range'):
+        parse_timestamps(['01/16/2025 3:15:00 PM', '02/30/2025 3:15:00 PM'])
+    assert parse_timestamps(['01/16/2025 3:15:00 PM']).tolist() == [
+        int((datetime(2025, 1, 16, 15, 15) - EPOCH).total_seconds())]
+    assert parse_timestamps([]).dtype == np.int64
+
+
+def write_rows(csv_path, rows: list[str]) -> str:
+    """
+    Write a usage csv with the given data rows and return its name.
+    """
+    csv_path.write_text('Start,Meter,kWh,kW\n' + ''.join(f'{row}\n' for row in rows))
+    return str(csv_path)
+
+
+def test_join_unordered_rows(tmp_path):
+    csv_file_name: str = write_rows(tmp_path / 'usage.csv', [
+        '01/16/2025 12:30:00 AM,Meter #2g - Off-Peak,-0.2,',
+        '01/16/2025 12:15:00 AM,Meter #1g - Off-Peak,-0.1,',
+        '01/16/2025 12:30:00 AM,Meter #1 - Off-Peak,1.3,5.2',
+        '01/16/2025 12:15:00 AM,Meter #2 - Off-Peak,2.1,',
+        '01/16/2025 12:30:00 AM,Meter #2 - Off-Peak,2.3,9.2',
+        '01/16/2025 12:15:00 AM,Meter #1 - Off-Peak,1.1,4.4',
+        '01/16/2025 12:30:00 AM,Meter #1g - Off-Peak,0,',
+        '01/16/2025 12:15:00 AM,Meter #2g - Off-Peak,0,',
+    ])
+    usage, unmatched = load_usage_intervals(csv_file_name)
+
+    # Intervals are in the order of the consumed rows, each with its own meter's generated kWh.
+    assert usage.meters.tolist() == [1, 2, 2, 1]
+    assert usage.consumed.tolist() == [1.3, 2.1, 2.3, 1.1]
+    assert usage.generated.tolist() == [0, 0, -0.2, -0.1]
+    np.testing.assert_array_equal(usage.demand, [5.2, np.nan, 9.2, 4.4])
+    assert unmatched == []
+
+
+def test_join_reports_missing_and_repeated_rows(tmp_path):
+    csv_file_name: str = write_rows(tmp_path / 'usage.csv', [
+        '01/16/2025 12:15:00 AM,Meter #1 - Off-Peak,1.1,',
+        '01/16/2025 12:15:00 AM,Meter #1g - Off-Peak,-0.1,',
+        '01/16/2025 12:15:00 AM,Meter #1g - Off-Peak,-0.9,',
+        '01/16/2025 12:30:00 AM,Meter #1 - Off-Peak,1.3,',
+        '01/16/2025 12:45:00 AM,Meter #1g - Off-Peak,-0.4,',
+        '01/16/2025 1:00:00 AM,Meter #1 - Off-Peak,1.5,',
+        '01/16/2025 1:00:00 AM,Meter #1g - Off-Peak,-0.5,',
+        '01/16/2025 1:00:00 AM,Meter #1 - Off-Peak,1.6,',
+    ])
+    usage, unmatched = load_usage_intervals(csv_file_name)
+
+    # The first of repeated rows is kept.
+    assert usage.consumed.tolist() == [1.1, 1.5]
+    assert usage.generated.tolist() == [-0.1, -0.5]
+    # Lines count the header, and unmatched rows are in line order.
+    assert unmatched == [
+        UnmatchedInterval(4, 1, '01/16/2025 12:15:00 AM', 'generated'),
+        UnmatchedInterval(5, 1, '01/16/2025 12:30:00 AM', 'consumed'),
+        UnmatchedInterval(6, 1, '01/16/2025 12:45:00 AM', 'generated'),
+        UnmatchedInterval(9, 1, '01/16/2025 1:00:00 AM', 'consumed'),
+    ]
+
+
+def load_generated_day(tmp_path, day: date) -> UsageArrays:
+    """
+    Generate and load one day of usage starting at 12:15 AM on day.
+    """
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, day, 1)
+    usage, unmatched = load_usage_intervals(str(csv_path))
+    assert unmatched == []
+    return usage
+
+
+def test_fall_back_keeps_both_repeated_hours(tmp_path):
+    usage: UsageArrays = load_generated_day(tmp_path, date(2025, 11, 2))
+    utc_timestamps: np.ndarray = usage.timestamps - usage.utc_offsets
+
+    assert len(usage.timestamps) == 25 * 4
+    assert (np.diff(utc_timestamps) == INTERVAL_SECONDS).all()
+    one_am: np.ndarray = usage.timestamps % SECONDS_PER_DAY // 3600 == 1
+    assert usage.utc_offsets[one_am].tolist() == [EDT_OFFSET] * 4 + [EST_OFFSET] * 4
+    # 12:15 through 12:45 AM are EDT, and everything after the repeated hour is EST.
+    assert usage.utc_offsets[:3].tolist() == [EDT_OFFSET] * 3
+    assert set(usage.utc_offsets[3 + 8:].tolist()) == {EST_OFFSET}
+
+
+def test_spring_forward_skips_an_hour(tmp_path):
+    usage: UsageArrays = load_generated_day(tmp_path, date(2025, 3, 9))
+    utc_timestamps: np.ndarray = usage.timestamps - usage.utc_offsets
+
+    assert len(usage.timestamps) == 23 * 4
+    assert (np.diff(utc_timestamps) == INTERVAL_SECONDS).all()
+    assert not (usage.timestamps % SECONDS_PER_DAY // 3600 == 2).any()
+    # 12:15 through 1:45 AM are EST, and 3:00 AM onwards EDT.
+    assert usage.utc_offsets[:7].tolist() == [EST_OFFSET] * 7
+    assert set(usage.utc_offsets[7:].tolist()) == {EDT_OFFSET}
+
+
+def test_repeated_time_is_only_a_fold_in_the_fall_back_hour(tmp_path):
+    rows: list[str] = []
+    for day in ('11/02/2025', '11/09/2025'):
+        for kwh in ('1', '2', '3'):
+            rows += [f'{day} 1:30:00 AM,Meter #1 - Off-Peak,{kwh},', f'{day} 1:30:00 AM,Meter #1g - Off-Peak,0,']
+    usage, unmatched = load_usage_intervals(write_rows(tmp_path / 'usage.csv', rows))
+
+    # The fall-back day keeps one reading per 1:30 AM, and a third reading is a repeat like any other.
+    assert usage.consumed.tolist() == [1, 2, 1]
+    assert usage.utc_offsets.tolist() == [EDT_OFFSET, EST_OFFSET, EST_OFFSET]
+    assert [(interval.line, interval.kind) for interval in unmatched] == [
+        (6, 'consumed'), (7, 'generated'), (10, 'consumed'), (11, 'generated'), (12, 'consumed'), (13, 'generated')]
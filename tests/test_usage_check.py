@@ -0,0 +1,47 @@
+"""
+test_usage_check.py
+
+Tests for usage_check.
+"""
+
+from datetime import date
+import pytest
+from usage_check import check_usage_file
+from usage_generator import write_usage_csv
+
+
+def write_usage_without_line(csv_path, line: int) -> str:
+    """
+    Write a two-meter day of usage with one line (1 is the header) left out, and return that line.
+    """
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 1, meters=2)
+    lines: list[str] = csv_path.read_text().splitlines(keepends=True)
+    removed: str = lines.pop(line - 1)
+    csv_path.write_text(''.join(lines))
+    return removed
+
+
+def test_complete_file_has_no_problems(tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 1, meters=2)
+    assert check_usage_file(str(csv_path)).problems == []
+
+
+# Data rows alternate consumed and generated, so line 40 is a consumed row and line 41 its generated row.
+@pytest.mark.parametrize('line, kind', [(40, 'consumed'), (41, 'generated')])
+def test_missing_row_is_only_unpaired(tmp_path, line, kind):
+    csv_path = tmp_path / 'usage.csv'
+    removed: str = write_usage_without_line(csv_path, line)
+    assert ('g - ' in removed) == (kind == 'generated')
+
+    problems = check_usage_file(str(csv_path)).problems
+    assert [problem.kind for problem in problems] == ['unpaired']
+    assert f'has no {kind} row' in problems[0].message
+
+
+def test_missing_file_is_a_problem(tmp_path):
+    problems = check_usage_file(str(tmp_path / 'missing.csv')).problems
+    assert [(problem.kind, problem.line) for problem in problems] == [('file', 0)]
+    assert 'No such file' in problems[0].message
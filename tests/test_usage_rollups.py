@@ -0,0 +1,37 @@
+"""
+test_usage_rollups.py
+
+Tests for usage_rollups.
+"""
+
+from datetime import date
+from tou_engine import EDT_OFFSET, EST_OFFSET, SECONDS_PER_DAY, load_usage_intervals
+from usage_generator import write_usage_csv
+from usage_rollups import compute_rollup
+
+
+def test_fall_back_hours_have_their_own_offsets(tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 11, 1), 2)
+    usage, _ = load_usage_intervals(str(csv_path))
+
+    rollup = compute_rollup(usage, 'hourly', ['180'])
+    one_am = rollup.starts == rollup.starts[rollup.utc_offsets == EST_OFFSET][0]
+    assert rollup.utc_offsets[one_am].tolist() == [EDT_OFFSET, EST_OFFSET]
+    assert rollup.intervals[one_am].tolist() == [4, 4]
+    # Every interval is in exactly one bucket.
+    assert rollup.intervals.sum() == len(usage.timestamps)
+
+
+def test_peak_readings_are_in_the_peak_hours(tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 2)
+    usage, _ = load_usage_intervals(str(csv_path))
+
+    rollup = compute_rollup(usage, 'hourly', ['194'])
+    peak = rollup.periods == 'Peak'
+    hours = rollup.starts[peak] % SECONDS_PER_DAY // 3600
+    assert sorted(set(hours.tolist())) == [15, 16, 17, 18]
+    assert rollup.intervals[peak].tolist() == [4] * len(hours)
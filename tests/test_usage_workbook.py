@@ -0,0 +1,105 @@
+"""
+test_usage_workbook.py
+
+Tests for usage_workbook.
+"""
+
+from typing import Union
+import re
+import zipfile
+from datetime import date
+import pytest
+import xlsxwriter
+from xlsxwriter.utility import xl_cell_to_rowcol, xl_rowcol_to_cell
+from interval_table import IntervalTable, as_interval_table
+from tou_engine import PEAK, load_usage_intervals
+from usage_generator import write_usage_csv
+from usage_workbook import FIRST_HEADER_ROW, SHEET_LAYOUTS, SheetLayout, write_usage_workbook
+from xlsx_streaming import RecordingSheet
+
+SUM_FORMULA = re.compile(r'=SUM\((\w+):(\w+)\)')
+SUMIFS_FORMULA = re.compile(r'=SUMIFS\((\w+):(\w+),(\w+):(\w+),"(\w)"\)')
+ADD_FORMULA = re.compile(r'=(\w+) \+ (\w+)')
+
+
+def get_column(sheet: RecordingSheet, first: str, last: str) -> list:
+    """
+    Return the values of a one-column range.
+    """
+    (first_row, col), (last_row, _) = xl_cell_to_rowcol(first), xl_cell_to_rowcol(last)
+    return [sheet.cells[(row, col)][1] for row in range(first_row, last_row + 1)]
+
+
+def evaluate(sheet: RecordingSheet, cell: str) -> Union[int, float]:
+    """
+    Return the value of a cell, working out the SUM, SUMIFS and addition formulas the layouts use.
+    """
+    kind, value, *_ = sheet.cells[xl_cell_to_rowcol(cell)]
+    if kind == 'write':
+        return value
+    if match := SUM_FORMULA.fullmatch(value):
+        return sum(get_column(sheet, *match.groups()))
+    if match := SUMIFS_FORMULA.fullmatch(value):
+        sum_first, sum_last, criteria_first, criteria_last, code = match.groups()
+        return sum(number for number, criteria in zip(get_column(sheet, sum_first, sum_last),
+                                                       get_column(sheet, criteria_first, criteria_last))
+                   if criteria == code)
+    if match := ADD_FORMULA.fullmatch(value):
+        return evaluate(sheet, match[1]) + evaluate(sheet, match[2])
+    raise AssertionError(f'Unexpected formula {value!r} in {cell}.')
+
+
+def get_totals(tmp_path, table: IntervalTable, layout: SheetLayout) -> dict[str, Union[int, float]]:
+    """
+    Build a layout's interval sheet and return the value of each header formula by cell.
+    """
+    workbook = xlsxwriter.Workbook(str(tmp_path / 'unused.xlsx'))
+    sheet: RecordingSheet = RecordingSheet()
+    first_row: int = layout.add_title_cells(workbook, sheet, None)
+    last_row: int = first_row - 1 + len(table.timestamps)
+    for offset, cells in enumerate(layout.get_rows(table, 0, len(table.timestamps))):
+        sheet.write_row(first_row - 1 + offset, 1, cells)
+    layout.add_formulas(sheet, FIRST_HEADER_ROW, first_row, last_row)
+    workbook.close()
+    return {xl_rowcol_to_cell(row, col): evaluate(sheet, xl_rowcol_to_cell(row, col))
+            for (row, col), cell in sheet.cells.items() if cell[0] == 'write_formula'}
+
+
+def test_compact_totals_match_full_layout(tmp_path):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 6, 1), 14)
+    table: IntervalTable = as_interval_table(load_usage_intervals(str(csv_path))[0])
+
+    full: dict = get_totals(tmp_path, table, SHEET_LAYOUTS['full'])
+    compact: dict = get_totals(tmp_path, table, SHEET_LAYOUTS['compact'])
+    assert len(full) == 18
+    assert compact.keys() == full.keys()
+    for cell, total in full.items():
+        assert compact[cell] == pytest.approx(total), cell
+
+    # Spot check: the rate 194 peak consumed total.
+    peak_consumed: float = float(table.consumed[table.periods('194') == PEAK].sum())
+    assert full[f'F{FIRST_HEADER_ROW + 2}'] == pytest.approx(peak_consumed)
+    assert peak_consumed > 0
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_each_meter_gets_its_own_sheet(tmp_path, streaming):
+    csv_path = tmp_path / 'usage.csv'
+    with open(csv_path, 'w', newline='') as output:
+        write_usage_csv(output, date(2025, 1, 16), 2, meters=2)
+    usage = load_usage_intervals(str(csv_path))[0]
+    xlsx_path = tmp_path / 'usage.xlsx'
+    assert write_usage_workbook(usage, str(xlsx_path), streaming, rollups=['daily'])
+
+    with zipfile.ZipFile(xlsx_path) as workbook:
+        sheet_names: list[str] = re.findall(r'<sheet name="([^"]+)"', workbook.read('xl/workbook.xml').decode())
+        sheets: list[str] = [workbook.read(f'xl/worksheets/sheet{number}.xml').decode() for number in (1, 2)]
+    assert sheet_names == ['PSEG TOU Usage 80395501', 'PSEG TOU Usage 80396501', 'Daily Totals']
+    # Each interval sheet totals its own meter's rows.
+    for sheet, meter in zip(sheets, (80395501, 80396501)):
+        meter_rows: int = int((usage.meters == meter).sum())
+        assert meter_rows == len(usage.timestamps) // 2
+        first_row, last_row = map(int, re.search(r'SUM\(B(\d+):B(\d+)\)', sheet).groups())
+        assert last_row - first_row + 1 == meter_rows
@@ -0,0 +1,462 @@
+"""
+tou_engine.py
+
+Columnar parse-and-classify engine for PSEG downloaded usage data.
+"""
+
+from typing import NamedTuple, Optional, Sequence
+import re
+from csv import reader
+from datetime import datetime, time, timedelta
+import numpy as np
+
+# Bump when the parsed arrays change so cached intervals (see interval_cache.py) are parsed again.
+PARSER_VERSION: int = 1
+
+# Period codes returned by rate_schedules.classify_rate.
+OFF_PEAK: int = 0
+PEAK: int = 1
+SUPER_OFF_PEAK: int = 2
+
+# Timestamps are stored as int64 seconds since EPOCH in local (wall clock) time.
+EPOCH: datetime = datetime(1970, 1, 1)
+SECONDS_PER_DAY: int = 86400
+# Meters are read every 15 minutes.  As the csv's Start column says, a reading's timestamp is the start of its
+# interval: the 3:00 PM reading covers 3:00 to 3:15 PM, and PSEG labels it On-Peak.
+INTERVAL_SECONDS: int = 15 * 60
+# 1970-01-01 was a Thursday.  Adding this to the day number gives 0 = Sunday, ..., 6 = Saturday.
+EPOCH_DAY_OF_WEEK: int = 4
+
+# PSEG meters are in America/New_York.  Offsets are seconds added to UTC to get local time.
+EST_OFFSET: int = -5 * 3600
+EDT_OFFSET: int = -4 * 3600
+# DST (US rules since 2007) starts at 2:00 AM on the second Sunday in March, skipping to 3:00 AM, and ends at
+# 2:00 AM EDT on the first Sunday in November, going back to 1:00 AM, so 1:00 to 1:59 AM happens twice.
+DST_START_HOUR: int = 2
+DST_END_HOUR: int = 1
+
+CONSUMED_METER_SPLIT = re.compile(' #| - ')
+GENERATED_METER_SPLIT = re.compile(' #|g - ')
+
+
+class UsageArrays(NamedTuple):
+    """
+    One entry per consumed/generated meter pair, in the order of the consumed rows.
+    """
+    timestamps: np.ndarray     # int64, seconds since EPOCH (local time)
+    meters: np.ndarray         # int64, meter number
+    consumed: np.ndarray       # float64, kWh
+    generated: np.ndarray      # float64, kWh
+    demand: np.ndarray         # float64, kW from the consumed row, NaN where missing
+    utc_offsets: np.ndarray    # int32, EST_OFFSET or EDT_OFFSET; tells apart the two 1 AM hours when DST ends
+
+
+class UnmatchedInterval(NamedTuple):
+    """
+    A consumed or generated row with no matching row for the same meter and time, or a repeated row.
+    """
+    line: int
+    meter: int
+    time: str
+    kind: str                  # 'consumed' or 'generated'
+
+
+def seconds_of_day(time_val: time) -> int:
+    """
+    Return number of seconds since midnight for a time object.
+    """
+    return time_val.hour * 3600 + time_val.minute * 60 + time_val.second
+
+
+def to_datetime(timestamp: int) -> datetime:
+    """
+    Convert a timestamp from UsageArrays back to a naive datetime.
+    """
+    return EPOCH + timedelta(seconds=int(timestamp))
+
+
+def parse_timestamps(values: Sequence[str]) -> np.ndarray:
+    """
+    Convert PSEG timestamps ('01/16/2025 3:15:00 PM') to int64 seconds since EPOCH.
+
+    See try_parse_timestamps.  If any value isn't a real date and time, raises parse_timestamps_strptime's error.
+    """
+    timestamps, valid = try_parse_timestamps(values)
+    if not valid.all():
+        # Raises strptime's error for the first bad value.
+        parse_timestamps_strptime(values)
+    return timestamps
+
+
+def try_parse_timestamps(values: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert PSEG timestamps to int64 seconds since EPOCH without raising.  Returns (timestamps, valid), with
+    timestamps 0 where valid is False.
+
+    The fixed format is parsed with array arithmetic on character codes, with the hour taking one or two characters.
+    Values that aren't in exactly that format, or aren't a real date and time, go through parse_timestamps_strptime
+    one unique value at a time, which accepts strptime's looser variants.
+    """
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+
+    text: np.ndarray = np.asarray(values, dtype=np.str_)
+    timestamps: np.ndarray = np.zeros(len(text), dtype=np.int64)
+    valid: np.ndarray = np.zeros(len(text), dtype=bool)
+    width: int = text.dtype.itemsize // 4
+    characters: np.ndarray = text.view(np.uint32).reshape(len(text), width)
+    if width in (21, 22) and not (characters > 127).any():
+        timestamps, valid = parse_fixed_timestamps(characters)
+
+    retry: np.ndarray = np.flatnonzero(~valid)
+    if len(retry) == 0:
+        return timestamps, valid
+    try:
+        timestamps[retry] = parse_timestamps_strptime(text[retry])
+        valid[retry] = True
+    except ValueError:
+        # Some values are bad, so find out which one at a time.
+        cache: dict[str, Optional[int]] = {}
+        for index in retry.tolist():
+            value: str = str(text[index])
+            if value not in cache:
+                try:
+                    cache[value] = int(parse_timestamps_strptime([value])[0])
+                except ValueError:
+                    cache[value] = None
+            if cache[value] is not None:
+                timestamps[index] = cache[value]
+                valid[index] = True
+    return timestamps, valid
+
+
+def parse_fixed_timestamps(characters: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parse rows of 21 or 22 ASCII character codes ('01/16/2025 3:15:00 PM', zero padded) with array arithmetic.
+    Returns (timestamps, valid).
+    """
+    # One column per character plus a zero column, so every value ends in a zero.
+    codes: np.ndarray = np.zeros((len(characters), 23), dtype=np.int16)
+    codes[:, :characters.shape[1]] = characters
+
+    # Everything after the hour is one column further right for two digit hours.
+    long_hour: np.ndarray = codes[:, 12] != ord(':')
+    tail_columns: np.ndarray = np.arange(12, 22) + long_hour[:, np.newaxis]
+    tail: np.ndarray = np.take_along_axis(codes, tail_columns, axis=1)
+    digits: np.ndarray = codes[:, :13] - ord('0')
+    tail_digits: np.ndarray = tail - ord('0')
+
+    is_digit: np.ndarray = (digits >= 0) & (digits <= 9)
+    tail_is_digit: np.ndarray = (tail_digits >= 0) & (tail_digits <= 9)
+    valid: np.ndarray = (is_digit[:, [0, 1, 3, 4, 6, 7, 8, 9, 11]].all(axis=1) & (~long_hour | is_digit[:, 12])
+                         & (codes[:, 2] == ord('/')) & (codes[:, 5] == ord('/')) & (codes[:, 10] == ord(' '))
+                         & (tail[:, 0] == ord(':')) & (tail[:, 3] == ord(':')) & (tail[:, 6] == ord(' '))
+                         & tail_is_digit[:, [1, 2, 4, 5]].all(axis=1)
+                         & ((tail[:, 7] == ord('A')) | (tail[:, 7] == ord('P'))) & (tail[:, 8] == ord('M'))
+                         & (tail[:, 9] == 0))
+
+    month: np.ndarray = digits[:, 0] * 10 + digits[:, 1]
+    day: np.ndarray = digits[:, 3] * 10 + digits[:, 4]
+    year: np.ndarray = (digits[:, 6].astype(np.int64) * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9])
+    hour: np.ndarray = np.where(long_hour, digits[:, 11] * 10 + digits[:, 12], digits[:, 11])
+    minute: np.ndarray = tail_digits[:, 1] * 10 + tail_digits[:, 2]
+    second: np.ndarray = tail_digits[:, 4] * 10 + tail_digits[:, 5]
+
+    month_index: np.ndarray = (year - 1970) * 12 + np.clip(month, 1, 12) - 1
+    month_start: np.ndarray = month_index.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    month_days: np.ndarray = (month_index + 1).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) - month_start
+    valid &= ((year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+              & (hour >= 1) & (hour <= 12) & (minute <= 59) & (second <= 59))
+
+    hour_of_day: np.ndarray = hour % 12 + np.where(tail[:, 7] == ord('P'), 12, 0)
+    timestamps: np.ndarray = (month_start + day - 1) * SECONDS_PER_DAY + hour_of_day * 3600 + minute * 60 + second
+    return np.where(valid, timestamps, 0), valid
+
+
+def parse_timestamps_strptime(values: Sequence[str]) -> np.ndarray:
+    """
+    parse_timestamps using strptime.
+
+    Consumed and generated rows share timestamps and a file only contains a handful of distinct dates and
+    times of day, so only the unique dates and times are run through strptime.
+    """
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    unique_values, inverse = np.unique(np.asarray(values), return_inverse=True)
+    day_cache: dict[str, int] = {}
+    time_cache: dict[str, int] = {}
+    parsed: np.ndarray = np.empty(len(unique_values), dtype=np.int64)
+
+    for index, value in enumerate(unique_values.tolist()):
+        date_part, _, time_part = value.partition(' ')
+        day: Optional[int] = day_cache.get(date_part)
+        if day is None:
+            day = (datetime.strptime(date_part, '%m/%d/%Y') - EPOCH).days
+            day_cache[date_part] = day
+        seconds: Optional[int] = time_cache.get(time_part)
+        if seconds is None:
+            seconds = seconds_of_day(datetime.strptime(time_part, '%I:%M:%S %p').time())
+            time_cache[time_part] = seconds
+        parsed[index] = day * SECONDS_PER_DAY + seconds
+
+    return parsed[inverse.reshape(-1)]
+
+
+def get_dst_days(years: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the day numbers (days since EPOCH) DST starts and ends on in each year.
+    """
+    months: np.ndarray = (np.asarray(years, dtype=np.int64) - 1970) * 12
+    march_first: np.ndarray = (months + 2).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    november_first: np.ndarray = (months + 10).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    # Second Sunday in March and first Sunday in November.
+    dst_start: np.ndarray = march_first + (7 - (march_first + EPOCH_DAY_OF_WEEK) % 7) % 7 + 7
+    dst_end: np.ndarray = november_first + (7 - (november_first + EPOCH_DAY_OF_WEEK) % 7) % 7
+    return dst_start, dst_end
+
+
+def get_years(timestamps: np.ndarray) -> np.ndarray:
+    """
+    Return the year of each timestamp.
+    """
+    days: np.ndarray = np.asarray(timestamps) // SECONDS_PER_DAY
+    return days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def get_utc_offsets(timestamps: np.ndarray, folds: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return the America/New_York UTC offset of each local timestamp.
+
+    Times from 1:00 to 1:59 AM on the day DST ends happen twice.  As with datetime.fold, fold 0 is the first (EDT)
+    and fold 1 the second (EST).  Times skipped when DST starts get EST_OFFSET.
+    """
+    timestamps = np.asarray(timestamps)
+    dst_start, dst_end = get_dst_days(get_years(timestamps))
+    # First local times in EDT, and of the repeated hour.
+    first_daylight: np.ndarray = dst_start * SECONDS_PER_DAY + (DST_START_HOUR + 1) * 3600
+    first_repeated: np.ndarray = dst_end * SECONDS_PER_DAY + DST_END_HOUR * 3600
+    daylight: np.ndarray = (timestamps >= first_daylight) & (timestamps < first_repeated)
+    repeated: np.ndarray = (timestamps >= first_repeated) & (timestamps < first_repeated + 3600)
+    daylight |= repeated & (np.asarray(folds) == 0 if folds is not None else True)
+    return np.where(daylight, EDT_OFFSET, EST_OFFSET).astype(np.int32)
+
+
+def utc_to_local(utc_timestamps: np.ndarray) -> np.ndarray:
+    """
+    Convert seconds since EPOCH in UTC to America/New_York local time.
+    """
+    utc_timestamps = np.asarray(utc_timestamps)
+    dst_start, dst_end = get_dst_days(get_years(utc_timestamps))
+    daylight: np.ndarray = ((utc_timestamps >= dst_start * SECONDS_PER_DAY + DST_START_HOUR * 3600 - EST_OFFSET)
+                            & (utc_timestamps < dst_end * SECONDS_PER_DAY + (DST_END_HOUR + 1) * 3600 - EDT_OFFSET))
+    return utc_timestamps + np.where(daylight, EDT_OFFSET, EST_OFFSET)
+
+
+def is_dst_end_date(date_part: str) -> bool:
+    """
+    Returns True if date_part ('11/02/2025') is the day DST ends.
+    """
+    try:
+        day: datetime = datetime.strptime(date_part, '%m/%d/%Y')
+    except ValueError:
+        return False
+    return (day - EPOCH).days == get_dst_days(np.array([day.year]))[1][0]
+
+
+def parse_meter_label(label: str) -> tuple[int, bool]:
+    """
+    Return (meter number, is generated) for 'Meter #80395501 - Off-Peak' or 'Meter #80395501g - Off-Peak'.
+    """
+    for splitter, is_generated in ((GENERATED_METER_SPLIT, True), (CONSUMED_METER_SPLIT, False)):
+        try:
+            return int(splitter.split(label)[1]), is_generated
+        except (ValueError, IndexError):
+            pass
+    raise ValueError(f'Unexpected meter label {label!r}.')
+
+
+class UsageRows(NamedTuple):
+    """
+    Rows read from a usage CSV (or part of one) before consumed and generated rows are joined.
+    """
+    consumed: list[tuple[int, str, int, str, str, int]]     # (meter, time, fold, kWh, kW, line) in file order
+    generated: dict[tuple[int, str, int], tuple[str, int]]  # (meter, time, fold) -> (kWh, line) of the first row
+    unmatched: list[UnmatchedInterval]                      # Repeated generated rows
+
+
+class JoinedIntervals(NamedTuple):
+    """
+    Unparsed values of the matched intervals, in the order of the consumed rows.
+    """
+    meters: list[int]
+    times: list[str]
+    consumed: list[str]
+    generated: list[str]
+    demand: list[str]
+    folds: list[int]
+    consumed_lines: list[int]
+    generated_lines: list[int]
+
+
+def read_usage_header(csv_reader) -> tuple[int, Optional[int]]:
+    """
+    Read the header row and return the (kWh, kW) column numbers.  kW is optional and None if missing.
+    """
+    try:
+        header: list[str] = next(csv_reader)
+    except StopIteration:
+        raise ValueError('Downloaded usage data is empty!')
+    try:
+        kwh_col: int = header.index('kWh')
+    except ValueError:
+        raise ValueError('Downloaded usage data must include kWh!')
+    # Demand is optional.  Rows without it get NaN.
+    kw_col: Optional[int] = header.index('kW') if 'kW' in header else None
+    return kwh_col, kw_col
+
+
+def read_usage_rows(csv_reader, kwh_col: int, kw_col: Optional[int], line_offset: int = 0) -> UsageRows:
+    """
+    Read data rows, indexing generated rows by (meter number, time, fold).  line_offset is added to the reader's
+    line numbers, for readers that start partway into a file.
+
+    The fold is 1 for the second reading of a meter at the same 1:xx AM time on the day DST ends, and 0 otherwise, so
+    both hours are kept.  Any other repeated time is still a repeated row.
+
+    Raises ValueError for an unrecognized meter label or a row too short for the kWh column.
+    """
+    label_cache: dict[str, tuple[int, bool]] = {}
+    dst_end_dates: dict[str, bool] = {}
+    repeated_hour: set[tuple[int, str, bool]] = set()
+    rows: UsageRows = UsageRows([], {}, [])
+
+    meter: list[str]
+    for meter in csv_reader:
+        if not meter:
+            continue
+        line: int = csv_reader.line_num + line_offset
+        try:
+            meter_info: Optional[tuple[int, bool]] = label_cache.get(meter[1])
+            if meter_info is None:
+                meter_info = label_cache[meter[1]] = parse_meter_label(meter[1])
+            kwh: str = meter[kwh_col]
+            kw: str = meter[kw_col] if kw_col is not None and len(meter) > kw_col else ''
+        except (ValueError, IndexError):
+            raise ValueError(f'Error parsing usage data at line {line}.  Check that both meter and generated meter data are included.')
+
+        meter_num, is_generated = meter_info
+        time_string: str = meter[0]
+        fold: int = 0
+        # Cheap check for 'MM/DD/YYYY 1:MM:SS AM' first, since only those times can be in the repeated hour.
+        if time_string[11:13] == '1:' and time_string.endswith('AM'):
+            is_dst_end: Optional[bool] = dst_end_dates.get(time_string[:10])
+            if is_dst_end is None:
+                is_dst_end = dst_end_dates[time_string[:10]] = is_dst_end_date(time_string[:10])
+            if is_dst_end:
+                if (meter_num, time_string, is_generated) in repeated_hour:
+                    fold = 1
+                else:
+                    repeated_hour.add((meter_num, time_string, is_generated))
+
+        if not is_generated:
+            rows.consumed.append((meter_num, time_string, fold, kwh, kw, line))
+        elif (meter_num, time_string, fold) in rows.generated:
+            rows.unmatched.append(UnmatchedInterval(line, meter_num, time_string, 'generated'))
+        else:
+            rows.generated[(meter_num, time_string, fold)] = (kwh, line)
+    return rows
+
+
+def join_usage_rows(rows: UsageRows) -> tuple[JoinedIntervals, list[UnmatchedInterval]]:
+    """
+    Look up each consumed row's generated row.  Returns the matched intervals and every unmatched or repeated row,
+    ordered by line.  Empties rows.generated.
+    """
+    joined: JoinedIntervals = JoinedIntervals([], [], [], [], [], [], [], [])
+    unmatched: list[UnmatchedInterval] = list(rows.unmatched)
+    for meter_num, time_string, fold, kwh, kw, line in rows.consumed:
+        match: Optional[tuple[str, int]] = rows.generated.pop((meter_num, time_string, fold), None)
+        if match is None:
+            unmatched.append(UnmatchedInterval(line, meter_num, time_string, 'consumed'))
+            continue
+        joined.meters.append(meter_num)
+        joined.times.append(time_string)
+        joined.consumed.append(kwh)
+        joined.generated.append(match[0])
+        joined.demand.append(kw)
+        joined.folds.append(fold)
+        joined.consumed_lines.append(line)
+        joined.generated_lines.append(match[1])
+
+    # Whatever is left in the index never found its consumed row.
+    for (meter_num, time_string, _), (_, line) in rows.generated.items():
+        unmatched.append(UnmatchedInterval(line, meter_num, time_string, 'generated'))
+    unmatched.sort()
+    return joined, unmatched
+
+
+def load_usage_intervals(csv_file_name: str) -> tuple[UsageArrays, list[UnmatchedInterval]]:
+    """
+    Read a PSEG downloaded CSV file into columnar arrays, joining consumed and generated rows by meter and time.
+
+    Rows may be in any order and the file may hold any number of meters.  Generated rows are indexed by
+    (meter number, time) in one pass over the file, then each consumed row is looked up in the index.  Intervals
+    missing their other half, or repeated, are returned as UnmatchedInterval instead of stopping the parse.
+    Arrays are in the order of the consumed rows.
+
+    Raises ValueError for a missing kWh column, an unrecognized meter label, or a bad time or kWh value.  Line
+    numbers in messages are one-based file lines.
+    """
+    with open(csv_file_name, newline='') as csv_file:
+        csv_reader = reader(csv_file)
+        kwh_col, kw_col = read_usage_header(csv_reader)
+        rows: UsageRows = read_usage_rows(csv_reader, kwh_col, kw_col)
+
+    joined, unmatched = join_usage_rows(rows)
+    try:
+        timestamps: np.ndarray = parse_timestamps(joined.times)
+    except ValueError as error:
+        raise ValueError(f'Invalid time in usage data: {error}')
+
+    usage: UsageArrays = UsageArrays(timestamps, np.asarray(joined.meters, dtype=np.int64),
+                                     parse_kwh(joined.consumed, joined.consumed_lines),
+                                     parse_kwh(joined.generated, joined.generated_lines),
+                                     parse_kw(joined.demand, joined.consumed_lines),
+                                     get_utc_offsets(timestamps, np.asarray(joined.folds, dtype=np.int8)))
+    return usage, unmatched
+
+
+def parse_kwh(values: list[str], lines: list[int]) -> np.ndarray:
+    """
+    Convert kWh strings to float64, reporting the file line of the first bad value.
+    """
+    try:
+        return np.asarray(values, dtype=np.str_).astype(np.float64)
+    except ValueError:
+        for value, line in zip(values, lines):
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(f'Invalid kWh value {value!r} at line {line}.')
+        raise
+
+
+def parse_kw(values: list[str], lines: list[int]) -> np.ndarray:
+    """
+    Convert kW strings to float64, with NaN for blank values, reporting the file line of the first bad value.
+    """
+    text: np.ndarray = np.asarray(values, dtype=np.str_)
+    blank: np.ndarray = np.char.strip(text) == ''
+    if blank.any():
+        text = np.where(blank, 'nan', text)
+    try:
+        return text.astype(np.float64)
+    except ValueError:
+        for value, line in zip(text.tolist(), lines):
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(f'Invalid kW value {value!r} at line {line}.')
+        raise
+
@@ -0,0 +1,361 @@
+"""
+usage_check.py
+
+Validate a PSEG downloaded usage CSV without converting it, reporting every problem found instead of stopping at
+the first one.
+
+The file is read once with the csv module, keeping only the raw fields of each row.  Times, kWh and kW values are
+then checked as arrays, and rows are paired, ordered and checked for gaps with sorts on (meter, time) keys, so a
+check costs about as much as the parse alone and much less than writing a workbook.
+"""
+
+from typing import NamedTuple, Optional
+import csv
+from csv import reader
+import numpy as np
+from tou_engine import (DST_END_HOUR, EST_OFFSET, INTERVAL_SECONDS, SECONDS_PER_DAY, get_dst_days, get_utc_offsets,
+                        get_years, parse_meter_label, read_usage_header, try_parse_timestamps, utc_to_local)
+
+MAX_LISTED_PROBLEMS: int = 20
+
+# Problem kinds, in the order they're reported, and their headings.
+PROBLEM_KINDS: dict[str, str] = {
+    'file': 'Unreadable file',
+    'header': 'Header problems',
+    'bad_row': 'Unreadable rows',
+    'bad_time': 'Invalid times',
+    'bad_kwh': 'Invalid kWh values',
+    'bad_kw': 'Invalid kW values',
+    'mismatched_meter': 'Consumed and generated rows with different meters',
+    'mismatched_time': 'Consumed and generated rows with different times',
+    'unpaired': 'Unpaired rows',
+    'duplicate': 'Repeated rows',
+    'out_of_order': 'Out of order intervals',
+    'gap': 'Gaps',
+    'dst': 'Daylight saving time anomalies',
+    'end': 'Unexpected end of file',
+}
+
+
+class UsageProblem(NamedTuple):
+    kind: str           # Key of PROBLEM_KINDS
+    line: int           # One-based file line
+    message: str
+
+
+class CheckReport(NamedTuple):
+    csv_file_name: str
+    rows: int               # Data rows, including unreadable ones
+    intervals: int          # Paired intervals
+    meters: list[int]
+    problems: list[UsageProblem]
+
+
+class UsageFields(NamedTuple):
+    """
+    Raw fields of the readable data rows, in file order.
+    """
+    lines: list[int]
+    meters: list[int]
+    generated: list[bool]
+    times: list[str]
+    kwh: list[str]
+    kw: list[str]
+
+
+def read_usage_fields(csv_reader, kwh_col: int, kw_col: Optional[int],
+                      problems: list[UsageProblem]) -> tuple[UsageFields, int]:
+    """
+    Read every data row, adding a problem for each unreadable one.  Returns the fields and the number of data rows.
+    A last row that is missing columns is reported as the end of the file, since the download was likely cut off.
+    """
+    label_cache: dict[str, tuple[int, bool]] = {}
+    fields: UsageFields = UsageFields([], [], [], [], [], [])
+    rows: int = 0
+    short_row: Optional[UsageProblem] = None
+
+    row: list[str]
+    for row in csv_reader:
+        if not row:
+            continue
+        rows += 1
+        try:
+            meter_info: Optional[tuple[int, bool]] = label_cache.get(row[1])
+            if meter_info is None:
+                meter_info = label_cache[row[1]] = parse_meter_label(row[1])
+            kwh: str = row[kwh_col]
+        except IndexError:
+            short_row = UsageProblem('bad_row', csv_reader.line_num, f'Missing columns: {",".join(row)!r}.')
+            problems.append(short_row)
+            continue
+        except ValueError as error:
+            problems.append(UsageProblem('bad_row', csv_reader.line_num, str(error)))
+            continue
+        fields.lines.append(csv_reader.line_num)
+        fields.meters.append(meter_info[0])
+        fields.generated.append(meter_info[1])
+        fields.times.append(row[0])
+        fields.kwh.append(kwh)
+        fields.kw.append(row[kw_col] if kw_col is not None and len(row) > kw_col else '')
+
+    if short_row is not None and problems[-1] is short_row and short_row.line == csv_reader.line_num:
+        problems[-1] = short_row._replace(kind='end', message=f'{short_row.message[:-1]} on the last line.')
+    return fields, rows
+
+
+def find_invalid_numbers(values: list[str], blank_ok: bool = False) -> list[int]:
+    """
+    Return the indexes of values that aren't numbers.  With blank_ok, empty values are allowed.
+    """
+    try:
+        np.asarray(values, dtype=np.str_).astype(np.float64)
+        return []
+    except ValueError:
+        pass
+    invalid: list[int] = []
+    for index, value in enumerate(values):
+        if blank_ok and not value.strip():
+            continue
+        try:
+            float(value)
+        except ValueError:
+            invalid.append(index)
+    return invalid
+
+
+def get_folds(timestamps: np.ndarray, meters: np.ndarray, is_generated: np.ndarray) -> np.ndarray:
+    """
+    Number the readings of each meter and row kind at a time in the repeated 1 AM hour when DST ends: 0 for the
+    first (EDT), 1 for the second (EST), 2 and up for extra ones.  Every other reading is 0.
+    """
+    folds: np.ndarray = np.zeros(len(timestamps), dtype=np.int64)
+    repeated: np.ndarray = np.flatnonzero(get_utc_offsets(timestamps, np.zeros(len(timestamps), dtype=np.int8))
+                                          != get_utc_offsets(timestamps, np.ones(len(timestamps), dtype=np.int8)))
+    seen: dict[tuple[int, int, bool], int] = {}
+    for index in repeated.tolist():
+        key: tuple[int, int, bool] = (int(meters[index]), int(timestamps[index]), bool(is_generated[index]))
+        folds[index] = seen.get(key, 0)
+        seen[key] = folds[index] + 1
+    return folds
+
+
+def find_group_starts(*columns: np.ndarray) -> np.ndarray:
+    """
+    For columns already sorted together, return True for the first entry and wherever any column differs from the
+    entry before.
+    """
+    starts: np.ndarray = np.zeros(len(columns[0]), dtype=bool)
+    starts[:1] = True
+    for column in columns:
+        starts[1:] |= column[1:] != column[:-1]
+    return starts
+
+
+def get_repeated_hours(utc_timestamps: np.ndarray) -> np.ndarray:
+    """
+    Return the UTC start of the second 1 AM hour when DST ends, in the year of each timestamp.
+    """
+    _, dst_end = get_dst_days(get_years(utc_to_local(utc_timestamps)))
+    return dst_end * SECONDS_PER_DAY + DST_END_HOUR * 3600 - EST_OFFSET
+
+
+def check_intervals(fields: UsageFields, rows: np.ndarray, timestamps: np.ndarray, folds: np.ndarray,
+                    problems: list[UsageProblem]) -> None:
+    """
+    Check the intervals of each meter for readings out of file order and for gaps.  rows are indexes into fields of
+    one row per interval, in file order.
+    """
+    meters: np.ndarray = np.asarray(fields.meters, dtype=np.int64)[rows]
+    utc_timestamps: np.ndarray = timestamps - get_utc_offsets(timestamps, np.minimum(folds, 1))
+
+    # Out of order: earlier than a reading of the same meter above it in the file.  A stable sort by meter keeps
+    # each meter's readings in file order.
+    order: np.ndarray = np.argsort(meters, kind='stable')
+    sorted_meters: np.ndarray = meters[order]
+    sorted_utc: np.ndarray = utc_timestamps[order]
+    starts: np.ndarray = find_group_starts(sorted_meters)
+    latest: np.ndarray = np.empty_like(sorted_utc)
+    for start, end in zip(*get_runs(starts)):
+        latest[start:end] = np.maximum.accumulate(sorted_utc[start:end])
+    for position in (np.flatnonzero(~starts[1:] & (sorted_utc[1:] < latest[:-1])) + 1).tolist():
+        index: int = rows[order[position]]
+        problems.append(UsageProblem('out_of_order', fields.lines[index],
+                                     f'Meter {fields.meters[index]} at {fields.times[index]} comes after a later '
+                                     f'reading.'))
+
+    # Gaps: more than one interval between consecutive readings in time order.
+    order = np.lexsort((utc_timestamps, meters))
+    sorted_meters = meters[order]
+    sorted_utc = utc_timestamps[order]
+    steps: np.ndarray = np.diff(sorted_utc)
+    repeated_hours: np.ndarray = get_repeated_hours(sorted_utc[:-1])
+    for position in np.flatnonzero((steps > INTERVAL_SECONDS) & (sorted_meters[1:] == sorted_meters[:-1])).tolist():
+        before: int = rows[order[position]]
+        after: int = rows[order[position + 1]]
+        missing: int = -(-int(steps[position]) // INTERVAL_SECONDS) - 1
+        message: str = (f'Meter {fields.meters[after]}: {missing} missing intervals between {fields.times[before]} '
+                        f'(line {fields.lines[before]}) and {fields.times[after]}.')
+        # The missing readings overlap the readings of the second 1 AM hour.  Timestamps are interval starts, so those
+        # are 1:00 through 1:45 AM EST.
+        repeated_hour: int = int(repeated_hours[position])
+        if (sorted_utc[position] + INTERVAL_SECONDS <= repeated_hour + 3600 - INTERVAL_SECONDS
+                and repeated_hour <= sorted_utc[position + 1] - INTERVAL_SECONDS):
+            problems.append(UsageProblem('dst', fields.lines[after],
+                                         f'{message}  The second 1 AM hour when DST ends is missing.'))
+        else:
+            problems.append(UsageProblem('gap', fields.lines[after], message))
+
+
+def get_runs(starts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the (start, end) positions of the groups marked by find_group_starts.
+    """
+    positions: np.ndarray = np.flatnonzero(starts)
+    return positions, np.append(positions[1:], len(starts))
+
+
+def check_usage_file(csv_file_name: str) -> CheckReport:
+    """
+    Read a PSEG downloaded CSV once and return every problem found: an unreadable file or rows, bad times and kWh/kW
+    values, unpaired or mismatched consumed and generated rows, repeated rows, intervals out of order, gaps, and
+    readings that don't fit the DST changes.
+    """
+    problems: list[UsageProblem] = []
+    csv_reader = None
+    try:
+        with open(csv_file_name, newline='') as csv_file:
+            csv_reader = reader(csv_file)
+            try:
+                kwh_col, kw_col = read_usage_header(csv_reader)
+            except ValueError as error:
+                return CheckReport(csv_file_name, 0, 0, [], [UsageProblem('header', 1, str(error))])
+            fields, row_count = read_usage_fields(csv_reader, kwh_col, kw_col, problems)
+    except (OSError, csv.Error) as error:
+        # Line 0 when the file couldn't be opened at all.
+        line: int = csv_reader.line_num if csv_reader is not None else 0
+        return CheckReport(csv_file_name, 0, 0, [],
+                           problems + [UsageProblem('file', line, f'Unable to read the file: {error}')])
+
+    for index in find_invalid_numbers(fields.kwh):
+        problems.append(UsageProblem('bad_kwh', fields.lines[index], f'Invalid kWh value {fields.kwh[index]!r}.'))
+    for index in find_invalid_numbers(fields.kw, blank_ok=True):
+        problems.append(UsageProblem('bad_kw', fields.lines[index], f'Invalid kW value {fields.kw[index]!r}.'))
+
+    all_timestamps, valid = try_parse_timestamps(fields.times)
+    for index in np.flatnonzero(~valid).tolist():
+        problems.append(UsageProblem('bad_time', fields.lines[index], f'Invalid time {fields.times[index]!r}.'))
+
+    # The rest only looks at rows with a valid time.
+    rows: np.ndarray = np.flatnonzero(valid)
+    timestamps: np.ndarray = all_timestamps[rows]
+    meters: np.ndarray = np.asarray(fields.meters, dtype=np.int64)[rows]
+    is_generated: np.ndarray = np.asarray(fields.generated, dtype=bool)[rows]
+    folds: np.ndarray = get_folds(timestamps, meters, is_generated)
+    capped_folds: np.ndarray = np.minimum(folds, 1)
+
+    # Times skipped when DST starts don't survive a round trip through UTC.
+    skipped: np.ndarray = utc_to_local(timestamps - get_utc_offsets(timestamps, capped_folds)) != timestamps
+    for index in rows[skipped].tolist():
+        problems.append(UsageProblem('dst', fields.lines[index],
+                                     f'{fields.times[index]} is skipped when DST starts and can\'t be a reading.'))
+
+    # Repeated rows: the same meter, kind, time and fold as a row above.  Rows are in file order, so a stable sort
+    # keeps the first of each group first.
+    order: np.ndarray = np.lexsort((capped_folds, is_generated, timestamps, meters))
+    first: np.ndarray = find_group_starts(meters[order], is_generated[order], timestamps[order], capped_folds[order])
+    first_rows: np.ndarray = order[np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))]
+    for position in np.flatnonzero(~first).tolist():
+        index: int = rows[order[position]]
+        kind: str = 'generated' if fields.generated[index] else 'consumed'
+        problems.append(UsageProblem('duplicate', fields.lines[index],
+                                     f'{kind.capitalize()} row for meter {fields.meters[index]} at '
+                                     f'{fields.times[index]} repeats line {fields.lines[rows[first_rows[position]]]}.'))
+
+    # Pair the first of each group: a consumed row sorts right before its generated row.
+    kept: np.ndarray = np.sort(order[first])
+    order = np.lexsort((is_generated[kept], capped_folds[kept], timestamps[kept], meters[kept]))
+    kept = kept[order]
+    pairs: np.ndarray = np.flatnonzero(~is_generated[kept[:-1]] & is_generated[kept[1:]]
+                                       & (meters[kept[:-1]] == meters[kept[1:]])
+                                       & (timestamps[kept[:-1]] == timestamps[kept[1:]])
+                                       & (capped_folds[kept[:-1]] == capped_folds[kept[1:]]))
+    paired: np.ndarray = np.zeros(len(kept), dtype=bool)
+    paired[pairs] = True
+    paired[pairs + 1] = True
+    check_pairs(fields, rows[np.sort(kept[~paired])], valid, problems)
+
+    # An interval is read once, by its consumed row or else by its unpaired generated row.  So a row missing from
+    # either side is only reported as unpaired, not also as a gap.
+    readings: np.ndarray = np.sort(kept[(~is_generated[kept] | ~paired) & ~skipped[kept]])
+    check_intervals(fields, rows[readings], timestamps[readings], folds[readings], problems)
+
+    problems.sort(key=lambda problem: problem.line)
+    return CheckReport(csv_file_name, row_count, len(pairs), sorted(set(fields.meters)), problems)
+
+
+def check_pairs(fields: UsageFields, unpaired: np.ndarray, valid: np.ndarray, problems: list[UsageProblem]) -> None:
+    """
+    Add a problem for each unpaired row (indexes into fields, in file order).  valid marks rows with a valid time.
+    An unpaired consumed row followed by a generated row for another meter or time is reported as a mismatch
+    instead, along with the generated row if it's unpaired too.
+    """
+    unpaired_rows: list[int] = unpaired.tolist()
+    unpaired_set: set[int] = set(unpaired_rows)
+    matched: set[int] = set()
+    for index in unpaired_rows:
+        if index in matched:
+            continue
+        following: int = index + 1
+        if (not fields.generated[index] and following < len(fields.lines) and fields.generated[following]
+                and valid[following] and fields.lines[following] == fields.lines[index] + 1):
+            if fields.times[index] == fields.times[following]:
+                if following in unpaired_set:
+                    matched.add(following)
+                problems.append(UsageProblem('mismatched_meter', fields.lines[index],
+                                             f'Consumed row for meter {fields.meters[index]} is followed by a '
+                                             f'generated row for meter {fields.meters[following]} at '
+                                             f'{fields.times[index]}.'))
+                continue
+            if fields.meters[index] == fields.meters[following]:
+                if following in unpaired_set:
+                    matched.add(following)
+                problems.append(UsageProblem('mismatched_time', fields.lines[index],
+                                             f'Consumed row for meter {fields.meters[index]} at {fields.times[index]} '
+                                             f'is followed by a generated row at {fields.times[following]}.'))
+                continue
+        kind: str = 'generated' if fields.generated[index] else 'consumed'
+        other: str = 'consumed' if fields.generated[index] else 'generated'
+        problems.append(UsageProblem('unpaired', fields.lines[index],
+                                     f'{kind.capitalize()} row for meter {fields.meters[index]} at '
+                                     f'{fields.times[index]} has no {other} row.'))
+
+
+def format_problem_counts(report: CheckReport) -> str:
+    """
+    Return e.g. '3 problems: 2 gaps, 1 unpaired rows', or 'No problems'.
+    """
+    if not report.problems:
+        return 'No problems'
+    counts: list[str] = []
+    for kind, title in PROBLEM_KINDS.items():
+        count: int = sum(problem.kind == kind for problem in report.problems)
+        if count:
+            counts.append(f'{count} {title[0].lower()}{title[1:]}')
+    return f'{len(report.problems)} problems: {", ".join(counts)}'
+
+
+def print_check_report(report: CheckReport, max_listed: int = MAX_LISTED_PROBLEMS) -> None:
+    """
+    Print totals, then the count and first max_listed lines of each kind of problem.
+    """
+    print(f'{report.csv_file_name}: {report.rows} rows, {report.intervals} intervals, {len(report.meters)} meters.  '
+          f'{format_problem_counts(report)}.')
+    for kind, title in PROBLEM_KINDS.items():
+        problems: list[UsageProblem] = [problem for problem in report.problems if problem.kind == kind]
+        if not problems:
+            continue
+        print(f'{title} ({len(problems)}):')
+        for problem in problems[:max_listed]:
+            print(f'  Line {problem.line}: {problem.message}' if problem.line else f'  {problem.message}')
+        if len(problems) > max_listed:
+            print(f'  ... and {len(problems) - max_listed} more.')
@@ -0,0 +1,118 @@
+"""
+usage_generator.py
+
+Generate synthetic PSEG downloaded usage csv files for benchmarking and testing.
+
+Rows follow the PSEG download format: a 'Start,Meter,kWh,kW' header, then for each 15-minute interval and meter a
+'Meter #N - Off-Peak' consumed row followed by its 'Meter #Ng - Off-Peak' generated row.  Times are America/New_York
+wall clock times, so the fall-back hour appears twice and the spring-forward hour is missing, as in real downloads.
+They come from tou_engine's DST rules, so the generator and the parser agree on them (and no time zone database is
+needed).
+"""
+
+from typing import Optional, TextIO
+import csv
+import math
+import random
+import sys
+from argparse import ArgumentParser
+from datetime import date, datetime
+import numpy as np
+from tou_engine import EPOCH, INTERVAL_SECONDS, SECONDS_PER_DAY, get_utc_offsets, to_datetime, utc_to_local
+
+FIRST_METER_NUMBER: int = 80395501
+
+# Named sizes used by the benchmark, in days.
+SIZES: dict[str, int] = {
+    'month': 30,
+    'quarter': 91,
+    'year': 365,
+    'three-years': 3 * 365,
+}
+
+
+def format_pseg_time(local_time: datetime) -> str:
+    """
+    Format like PSEG: zero-padded month and day, unpadded 12-hour hour ('01/16/2025 3:15:00 PM').
+    """
+    hour: int = local_time.hour % 12 or 12
+    return f'{local_time:%m/%d/%Y} {hour}:{local_time:%M:%S} {"AM" if local_time.hour < 12 else "PM"}'
+
+
+def is_on_peak(local_time: datetime) -> bool:
+    """
+    Returns True for weekday readings from 3:00 PM up to 7:00 PM, which PSEG labels 'On-Peak'.
+    """
+    return local_time.weekday() < 5 and 15 <= local_time.hour < 19
+
+
+def generate_usage_rows(start: date, days: int, meters: int = 1, solar: bool = True, seed: Optional[int] = 0):
+    """
+    Yield csv rows (without header) from 12:15 AM on start through 12:00 AM days later, for each meter.
+    """
+    rng: random.Random = random.Random(seed)
+    meter_numbers: list[int] = [FIRST_METER_NUMBER + 1000 * index for index in range(meters)]
+    # Per-meter base load and solar capacity so meters don't look identical.
+    base_loads: list[float] = [rng.uniform(0.15, 0.6) for _ in meter_numbers]
+    solar_sizes: list[float] = [rng.uniform(0.5, 2.0) if solar else 0.0 for _ in meter_numbers]
+
+    # Step in UTC and convert, so DST transitions repeat or skip local times like the meter does.  Midnight is never
+    # a repeated or skipped time.
+    midnights: np.ndarray = ((datetime(start.year, start.month, start.day) - EPOCH).days
+                             + np.array([0, days], dtype=np.int64)) * SECONDS_PER_DAY
+    first_utc, last_utc = (midnights - get_utc_offsets(midnights)).tolist()
+    local_timestamps: np.ndarray = utc_to_local(np.arange(first_utc + INTERVAL_SECONDS, last_utc + 1, INTERVAL_SECONDS))
+    for local_timestamp in local_timestamps.tolist():
+        local_time: datetime = to_datetime(local_timestamp)
+        time_string: str = format_pseg_time(local_time)
+        period: str = 'On-Peak' if is_on_peak(local_time) else 'Off-Peak'
+        hour: float = local_time.hour + local_time.minute / 60
+        evening: float = max(math.sin((hour - 12) / 12 * math.pi), 0)
+        daylight: float = max(math.sin((hour - 6) / 14 * math.pi), 0) if 6 <= hour <= 20 else 0
+
+        for meter_number, base_load, solar_size in zip(meter_numbers, base_loads, solar_sizes):
+            consumed: float = round(base_load + evening * rng.uniform(0.2, 1.2) + rng.uniform(0, 0.1), 2)
+            generated: float = -round(solar_size * daylight * rng.uniform(0.3, 1.0), 2) or 0
+            yield [time_string, f'Meter #{meter_number} - {period}', f'{consumed:g}', f'{consumed * 4:.2f}']
+            yield [time_string, f'Meter #{meter_number}g - {period}', f'{generated:g}', '']
+
+
+def write_usage_csv(output: TextIO, start: date, days: int, meters: int = 1, solar: bool = True,
+                    quoted: bool = False, seed: Optional[int] = 0) -> int:
+    """
+    Write a complete usage csv to output.  Returns the number of data rows written.
+    """
+    writer = csv.writer(output, quoting=csv.QUOTE_ALL if quoted else csv.QUOTE_MINIMAL, lineterminator='\n')
+    writer.writerow(['Start', 'Meter', 'kWh', 'kW'])
+    rows: int = 0
+    for row in generate_usage_rows(start, days, meters, solar, seed):
+        writer.writerow(row)
+        rows += 1
+    return rows
+
+
+def main():
+    """
+    Main function for usage_generator.
+    """
+    parser = ArgumentParser(description='Generate a synthetic PSEG usage csv.')
+    parser.add_argument('--output', '-o', type=str, help='File to write.  Defaults to standard output.')
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2025, 1, 16), help='First day (YYYY-MM-DD).')
+    parser.add_argument('--days', type=int, default=None, help='Number of days.')
+    parser.add_argument('--size', choices=SIZES, default='month', help='Named number of days, if --days is not given.')
+    parser.add_argument('--meters', type=int, default=1, help='Number of meters.')
+    parser.add_argument('--no-solar', action='store_true', help='Write zero generation.')
+    parser.add_argument('--quoted', action='store_true', help='Quote every field, like some PSEG downloads.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    args = parser.parse_args()
+
+    days: int = args.days if args.days is not None else SIZES[args.size]
+    if args.output is None:
+        write_usage_csv(sys.stdout, args.start, days, args.meters, not args.no_solar, args.quoted, args.seed)
+    else:
+        with open(args.output, 'w', newline='') as output:
+            write_usage_csv(output, args.start, days, args.meters, not args.no_solar, args.quoted, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+usage_rollups.py
+
+Hourly, daily and weekly totals per TOU period, computed from parsed intervals with sorted group reductions.
+
+A reading's timestamp is the start of its 15-minute interval (see tou_engine.INTERVAL_SECONDS), so each reading
+is bucketed by its own time: the 3:00 PM reading belongs to the 3 PM hour, as it does to the peak period.  Weeks
+start on Sunday.  Buckets are worked out in UTC, so the two 1 AM hours when DST ends are separate hourly buckets,
+told apart by their UTC offsets.  Days and weeks are local, so they can be 23 or 25 hours.
+"""
+
+from typing import NamedTuple, Optional
+import numpy as np
+from tou_engine import EPOCH_DAY_OF_WEEK, SECONDS_PER_DAY, UsageArrays, get_utc_offsets, utc_to_local
+from rate_schedules import PERIOD_NAMES, RATE_SCHEDULES
+from interval_table import IntervalTable, as_interval_table
+
+# Bucket length in seconds for each rollup.
+ROLLUP_SECONDS: dict[str, int] = {
+    'hourly': 3600,
+    'daily': SECONDS_PER_DAY,
+    'weekly': 7 * SECONDS_PER_DAY,
+}
+
+# Plans with a row per period in each bucket.  Plans without TOU windows get a single 'Non-TOU' row.
+ROLLUP_RATES: list[str] = ['180', '194', '195']
+NON_TOU_PERIOD: str = 'Non-TOU'
+ROUND_DECIMALS: int = 6
+
+# Output column name of each UsageRollup field, in order.
+ROLLUP_COLUMNS: list[str] = ['start', 'utc_offset', 'meter', 'rate', 'period', 'intervals', 'consumed', 'generated',
+                             'net', 'peak_demand']
+
+
+class UsageRollup(NamedTuple):
+    """
+    One entry per (meter, bucket, rate, period) with at least one interval, ordered by meter, bucket, rate, period.
+    """
+    starts: np.ndarray          # int64, bucket start (seconds since EPOCH, local time)
+    utc_offsets: np.ndarray     # int32, seconds added to UTC to get starts
+    meters: np.ndarray          # int64
+    rates: np.ndarray           # str, rate plan
+    periods: np.ndarray         # str, period name, or NON_TOU_PERIOD
+    intervals: np.ndarray       # int64, number of 15-minute intervals
+    consumed: np.ndarray        # float64, kWh
+    generated: np.ndarray       # float64, kWh
+    net: np.ndarray             # float64, kWh
+    peak_demand: np.ndarray     # float64, highest kW, NaN if no interval had demand
+
+
+def get_bucket_starts(timestamps: np.ndarray, utc_offsets: np.ndarray, rollup: str) -> np.ndarray:
+    """
+    Return the start (seconds since EPOCH in UTC) of the hourly, daily or weekly bucket holding each interval.
+    """
+    utc_timestamps: np.ndarray = np.asarray(timestamps) - np.asarray(utc_offsets)
+    if rollup == 'hourly':
+        # Offsets are whole hours, so UTC hours are local hours.
+        return utc_timestamps - utc_timestamps % ROLLUP_SECONDS['hourly']
+
+    days: np.ndarray = np.asarray(timestamps) // SECONDS_PER_DAY
+    if rollup == 'weekly':
+        days -= (days + EPOCH_DAY_OF_WEEK) % 7
+    # Midnight is never skipped or repeated, so its offset is unambiguous.
+    local_starts: np.ndarray = days * SECONDS_PER_DAY
+    return local_starts - get_utc_offsets(local_starts)
+
+
+def compute_rollup(usage: UsageArrays, rollup: str, rates: Optional[list[str]] = None) -> UsageRollup:
+    """
+    Total consumed, generated and net kWh and the peak kW for each bucket and TOU period of each rate plan.
+    """
+    rates = rates if rates is not None else ROLLUP_RATES
+    table: IntervalTable = as_interval_table(usage)
+    buckets: np.ndarray = get_bucket_starts(table.timestamps, table.utc_offsets, rollup)
+    meters: np.ndarray = np.asarray(table.meters)
+    consumed: np.ndarray = np.asarray(table.consumed)
+    generated: np.ndarray = np.asarray(table.generated)
+    demand: np.ndarray = np.asarray(table.demand)
+
+    parts: list[UsageRollup] = []
+    for rate in rates:
+        has_periods: bool = bool(RATE_SCHEDULES[rate]['windows'])
+        periods: np.ndarray = table.periods(rate)
+        order: np.ndarray = np.lexsort((periods, buckets, meters))
+        sorted_meters: np.ndarray = meters[order]
+        sorted_buckets: np.ndarray = buckets[order]
+        sorted_periods: np.ndarray = periods[order]
+        if len(order) == 0:
+            continue
+
+        # Groups start wherever meter, bucket or period changes.
+        changes: np.ndarray = ((sorted_meters[1:] != sorted_meters[:-1]) | (sorted_buckets[1:] != sorted_buckets[:-1])
+                               | (sorted_periods[1:] != sorted_periods[:-1]))
+        group_starts: np.ndarray = np.concatenate([[0], np.flatnonzero(changes) + 1])
+        # Readings have two decimals, so rounding only drops float noise like 79.74000000000001.
+        group_consumed: np.ndarray = np.round(np.add.reduceat(consumed[order], group_starts), ROUND_DECIMALS)
+        group_generated: np.ndarray = np.round(np.add.reduceat(generated[order], group_starts), ROUND_DECIMALS)
+        group_periods: np.ndarray = sorted_periods[group_starts]
+        period_names: np.ndarray = np.array([PERIOD_NAMES[code] if has_periods else NON_TOU_PERIOD
+                                             for code in range(len(PERIOD_NAMES))])
+
+        parts.append(UsageRollup(
+            sorted_buckets[group_starts],
+            np.zeros(len(group_starts), np.int32),
+            sorted_meters[group_starts],
+            np.full(len(group_starts), rate),
+            period_names[group_periods],
+            np.diff(np.append(group_starts, len(order))),
+            group_consumed,
+            group_generated,
+            np.round(group_consumed + group_generated, ROUND_DECIMALS),
+            # fmax skips NaN, so a bucket is NaN only if none of its intervals had demand.
+            np.fmax.reduceat(demand[order], group_starts),
+        ))
+
+    if not parts:
+        return UsageRollup(np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.int64), np.empty(0, str),
+                           np.empty(0, str), np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+
+    combined: UsageRollup = UsageRollup(*(np.concatenate(column) for column in zip(*parts)))
+    rate_order: np.ndarray = np.concatenate([np.full(len(part.starts), index) for index, part in enumerate(parts)])
+    order = np.lexsort((rate_order, combined.starts, combined.meters))
+    ordered: UsageRollup = UsageRollup(*(column[order] for column in combined))
+    local_starts: np.ndarray = utc_to_local(ordered.starts)
+    return ordered._replace(starts=local_starts, utc_offsets=(local_starts - ordered.starts).astype(np.int32))
+
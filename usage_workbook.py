@@ -0,0 +1,524 @@
+"""
+usage_workbook.py
+
+The TOU usage workbook: a sheet with a row per interval in one of SHEET_LAYOUTS, and a sheet per rollup.
+"""
+
+from typing import Callable, NamedTuple, Optional, Union
+import numpy as np
+from tou_engine import OFF_PEAK, PEAK, SUPER_OFF_PEAK, UsageArrays, to_datetime
+from rate_schedules import PERIOD_NAMES
+from interval_table import IntervalTable, as_interval_table
+from usage_rollups import UsageRollup, compute_rollup
+import profiling
+
+FIRST_HEADER_ROW: int = 3
+USAGE_SHEET_NAME: str = 'PSEG TOU Usage'
+# Period codes written to the compact layout's period columns.
+COMPACT_PERIOD_CODES: dict[int, str] = {OFF_PEAK: 'O', PEAK: 'P', SUPER_OFF_PEAK: 'S'}
+COMPACT_PERIOD_LETTERS: np.ndarray = np.array([COMPACT_PERIOD_CODES[code] for code in range(len(COMPACT_PERIOD_CODES))],
+                                              dtype=object)
+# Data rows are built this many at a time, so memory stays flat in streaming mode.
+ROW_BLOCK: int = 4096
+ROLLUP_HEADERS: list[str] = ['Start', 'UTC Offset', 'Meter', 'Rate', 'Period', 'Intervals', 'Consumed', 'Generated',
+                             'Net', 'Peak kW']
+
+
+def add_summary_titles(sheet, merge_left) -> int:
+    """
+    Adds the labels for the kWh totals and bills of each TOU plan, shared by every layout.
+    """
+    row_num: int = FIRST_HEADER_ROW
+    sheet.write(f'B{row_num}', 'Non-TOU Consumed:', merge_left)
+    sheet.write(f'E{row_num}', 'Off-Peak Consumed:', merge_left)
+    sheet.write(f'H{row_num}', 'Super Off-Peak Consumed:', merge_left)
+    row_num += 1
+
+    sheet.write(f'B{row_num}', 'Non-TOU Generated:', merge_left)
+    sheet.write(f'E{row_num}', 'Off-Peak Generated:', merge_left)
+    sheet.write(f'H{row_num}', 'Super Off-Peak Generated:', merge_left)
+    row_num += 1
+
+    sheet.write(f'E{row_num}', 'Peak Consumed:', merge_left)
+    sheet.write(f'H{row_num}', 'Off-Peak Consumed:', merge_left)
+    row_num += 1
+
+    sheet.write(f'E{row_num}', 'Peak Generated:', merge_left)
+    sheet.write(f'H{row_num}', 'Off-Peak Generated:', merge_left)
+    row_num += 1
+
+    sheet.write(f'H{row_num}', 'Peak Consumed:', merge_left)
+    row_num += 1
+
+    sheet.write(f'H{row_num}', 'Peak Generated:', merge_left)
+    row_num += 2
+
+    sheet.write(f'B{row_num}', 'Non-TOU Net:', merge_left)
+    sheet.write(f'E{row_num}', 'Off-Peak Net:', merge_left)
+    sheet.write(f'H{row_num}', 'Super Off-Peak Net:', merge_left)
+    row_num += 1
+
+    sheet.write(f'E{row_num}', 'Peak Net:', merge_left)
+    sheet.write(f'H{row_num}', 'Off-Peak Net:', merge_left)
+    row_num += 1
+
+    sheet.write(f'H{row_num}', 'Peak Net:', merge_left)
+    row_num += 2
+
+    sheet.write(f'B{row_num}', 'Bill:', merge_left)
+    sheet.write(f'E{row_num}', 'Bill:', merge_left)
+    sheet.write(f'H{row_num}', 'Bill:', merge_left)
+    row_num += 2
+
+    # Return first row number after summary titles
+    return row_num
+
+def add_title_cells(book, sheet, default_format) -> int:
+    """
+    Adds titles for various TOU plans
+    """
+    merge_center = book.add_format({
+        "bold": 0,
+        "border": 0,
+        "align": "center",
+        "valign": "vcenter"
+    })
+    merge_left = book.add_format({
+        "bold": 0,
+        "border": 0,
+        "align": "left",
+        "valign": "vcenter"
+    })
+
+    row_num: int = add_summary_titles(sheet, merge_left)
+
+    sheet.merge_range(f'B{row_num}:C{row_num}', 'Non-TOU Billing', merge_center)
+    sheet.merge_range(f'E{row_num}:H{row_num}', 'Off-Peak Billing', merge_center)
+    sheet.merge_range(f'J{row_num}:O{row_num}', 'Super Off-Peak Billing', merge_center)
+    row_num += 1
+
+    sheet.merge_range(f'E{row_num}:F{row_num}', 'Peak', merge_center)
+    sheet.merge_range(f'G{row_num}:H{row_num}', 'Off-Peak', merge_center)
+
+    sheet.merge_range(f'J{row_num}:K{row_num}', 'Peak', merge_center)
+    sheet.merge_range(f'L{row_num}:M{row_num}', 'Off-Peak', merge_center)
+    sheet.merge_range(f'N{row_num}:O{row_num}', 'Super Off-Peak', merge_center)
+    row_num += 1
+
+    sheet.write_row(f'A{row_num}', ['Time', 'Consumed', 'Generated', '',
+                           'Consumed', 'Generated', 'Consumed', 'Generated', '',
+                           'Consumed', 'Generated', 'Consumed', 'Generated', 'Consumed', 'Generated'], default_format)
+    row_num += 1
+
+    # Return first row number after titles
+    return row_num
+
+def add_formulas(sheet, first_header_row: int, first_data_row: int, last_data_row: int) -> None:
+    """
+    Populates formulas in header of worksheet.
+    """
+
+    # Non-TOU billing formulas
+    sheet.write_formula(f'C{first_header_row}', f'=SUM(B{first_data_row}:B{last_data_row})')                # Consumed
+    sheet.write_formula(f'C{first_header_row + 1}', f'=SUM(C{first_data_row}:C{last_data_row})')            # Generated
+    sheet.write_formula(f'C{first_header_row + 7}', f'=C{first_header_row} + C{first_header_row + 1}')      # Net
+
+    # Off-Peak billing formulas
+    sheet.write_formula(f'F{first_header_row}', f'=SUM(G{first_data_row}:G{last_data_row})')                # Off-Peak consumed
+    sheet.write_formula(f'F{first_header_row + 1}', f'=SUM(H{first_data_row}:H{last_data_row})')            # Off-Peak generated
+    sheet.write_formula(f'F{first_header_row + 7}', f'=F{first_header_row} + F{first_header_row + 1}')      # Off-Peak net
+    sheet.write_formula(f'F{first_header_row + 2}', f'=SUM(E{first_data_row}:E{last_data_row})')            # Peak consumed
+    sheet.write_formula(f'F{first_header_row + 3}', f'=SUM(F{first_data_row}:F{last_data_row})')            # Peak generated
+    sheet.write_formula(f'F{first_header_row + 8}', f'=F{first_header_row + 2} + F{first_header_row + 3}')  # Peak net
+
+    # Super Off-Peak billing formulas
+    sheet.write_formula(f'I{first_header_row}', f'=SUM(N{first_data_row}:N{last_data_row})')                # Super Off-Peak consumed
+    sheet.write_formula(f'I{first_header_row + 1}', f'=SUM(O{first_data_row}:O{last_data_row})')            # Super Off-Peak generated
+    sheet.write_formula(f'I{first_header_row + 7}', f'=I{first_header_row} + I{first_header_row + 1}')      # Super Off-Peak net
+    sheet.write_formula(f'I{first_header_row + 2}', f'=SUM(L{first_data_row}:L{last_data_row})')            # Off-Peak consumed
+    sheet.write_formula(f'I{first_header_row + 3}', f'=SUM(M{first_data_row}:M{last_data_row})')            # Off-Peak generated
+    sheet.write_formula(f'I{first_header_row + 8}', f'=I{first_header_row + 2} + I{first_header_row + 3}')  # Off-Peak net
+    sheet.write_formula(f'I{first_header_row + 4}', f'=SUM(J{first_data_row}:J{last_data_row})')            # Peak consumed
+    sheet.write_formula(f'I{first_header_row + 5}', f'=SUM(K{first_data_row}:K{last_data_row})')            # Peak generated
+    sheet.write_formula(f'I{first_header_row + 9}', f'=I{first_header_row + 4} + I{first_header_row + 5}')  # Peak net
+
+
+def get_border_ranges(first_data_row: int, last_data_row: int) -> list[dict]:
+    """
+    Return apply_outer_border_to_range options for data and header columns, in the order they are applied.
+    """
+    return [
+        # Non-TOU Billing Header
+        {"range_string": "B18:B18", "border_style": 1},
+        {"range_string": "C18:C18", "border_style": 1},
+        {"range_string": "B16:C18", "border_style": 5},
+
+        # Non-TOU Billing data
+        {"range_string": f"B{first_data_row}:B{last_data_row}", "border_style": 1},
+        {"range_string": f"B{first_data_row}:C{last_data_row}", "border_style": 5},
+
+        # Off-Peak Billing Header
+        {"range_string": "E17:F17", "border_style": 1},
+        {"range_string": "G17:H17", "border_style": 1},
+        {"range_string": "E18:E18", "border_style": 1},
+        {"range_string": "F18:F18", "border_style": 1},
+        {"range_string": "G18:G18", "border_style": 1},
+        {"range_string": "H18:H18", "border_style": 1},
+        {"range_string": "E16:H18", "border_style": 5},
+
+        # Off-Peak Billing data
+        {"range_string": f"E{first_data_row}:E{last_data_row}", "border_style": 1},
+        {"range_string": f"F{first_data_row}:F{last_data_row}", "border_style": 1},
+        {"range_string": f"G{first_data_row}:G{last_data_row}", "border_style": 1},
+        {"range_string": f"E{first_data_row}:H{last_data_row}", "border_style": 5},
+
+        # Super Off-Peak Billing Header
+        {"range_string": "J17:K17", "border_style": 1},
+        {"range_string": "L17:M17", "border_style": 1},
+        {"range_string": "N17:O17", "border_style": 1},
+        {"range_string": "J18:J18", "border_style": 1},
+        {"range_string": "K18:K18", "border_style": 1},
+        {"range_string": "L18:L18", "border_style": 1},
+        {"range_string": "M18:M18", "border_style": 1},
+        {"range_string": "N18:N18", "border_style": 1},
+        {"range_string": "O18:O18", "border_style": 1},
+        {"range_string": "J16:O18", "border_style": 5},
+
+        # Super Off-Peak Billing data
+        {"range_string": f"J{first_data_row}:J{last_data_row}", "border_style": 1},
+        {"range_string": f"K{first_data_row}:K{last_data_row}", "border_style": 1},
+        {"range_string": f"L{first_data_row}:L{last_data_row}", "border_style": 1},
+        {"range_string": f"M{first_data_row}:M{last_data_row}", "border_style": 1},
+        {"range_string": f"N{first_data_row}:N{last_data_row}", "border_style": 1},
+        {"range_string": f"J{first_data_row}:O{last_data_row}", "border_style": 5},
+    ]
+
+
+def add_compact_title_cells(book, sheet, default_format) -> int:
+    """
+    Adds titles for the compact layout: time, consumed, generated and a period code column per TOU plan.
+    """
+    merge_center = book.add_format({
+        "bold": 0,
+        "border": 0,
+        "align": "center",
+        "valign": "vcenter"
+    })
+    merge_left = book.add_format({
+        "bold": 0,
+        "border": 0,
+        "align": "left",
+        "valign": "vcenter"
+    })
+
+    sheet.write(f'K{FIRST_HEADER_ROW}', 'Period codes:', merge_left)
+    for row_offset, period in enumerate([PEAK, OFF_PEAK, SUPER_OFF_PEAK], 1):
+        sheet.write(f'K{FIRST_HEADER_ROW + row_offset}', f'{COMPACT_PERIOD_CODES[period]} = {PERIOD_NAMES[period]}',
+                    merge_left)
+
+    row_num: int = add_summary_titles(sheet, merge_left)
+
+    sheet.merge_range(f'B{row_num}:C{row_num}', 'Usage', merge_center)
+    sheet.merge_range(f'D{row_num}:E{row_num}', 'Period', merge_center)
+    row_num += 1
+
+    sheet.write(f'D{row_num}', 'Off-Peak', merge_center)
+    sheet.write(f'E{row_num}', 'Super Off-Peak', merge_center)
+    row_num += 1
+
+    sheet.write_row(f'A{row_num}', ['Time', 'Consumed', 'Generated', 'Rate 194', 'Rate 195'], default_format)
+    row_num += 1
+
+    # Return first row number after titles
+    return row_num
+
+def add_compact_formulas(sheet, first_header_row: int, first_data_row: int, last_data_row: int) -> None:
+    """
+    Populates the same header totals as add_formulas with SUMIFS over the compact layout's period columns.
+    """
+    consumed: str = f'B{first_data_row}:B{last_data_row}'
+    generated: str = f'C{first_data_row}:C{last_data_row}'
+    periods_194: str = f'D{first_data_row}:D{last_data_row}'
+    periods_195: str = f'E{first_data_row}:E{last_data_row}'
+    off_peak: str = COMPACT_PERIOD_CODES[OFF_PEAK]
+    peak: str = COMPACT_PERIOD_CODES[PEAK]
+    super_off_peak: str = COMPACT_PERIOD_CODES[SUPER_OFF_PEAK]
+
+    # Non-TOU billing formulas
+    sheet.write_formula(f'C{first_header_row}', f'=SUM({consumed})')                                                # Consumed
+    sheet.write_formula(f'C{first_header_row + 1}', f'=SUM({generated})')                                           # Generated
+    sheet.write_formula(f'C{first_header_row + 7}', f'=C{first_header_row} + C{first_header_row + 1}')              # Net
+
+    # Off-Peak billing formulas
+    sheet.write_formula(f'F{first_header_row}', f'=SUMIFS({consumed},{periods_194},"{off_peak}")')                  # Off-Peak consumed
+    sheet.write_formula(f'F{first_header_row + 1}', f'=SUMIFS({generated},{periods_194},"{off_peak}")')             # Off-Peak generated
+    sheet.write_formula(f'F{first_header_row + 7}', f'=F{first_header_row} + F{first_header_row + 1}')              # Off-Peak net
+    sheet.write_formula(f'F{first_header_row + 2}', f'=SUMIFS({consumed},{periods_194},"{peak}")')                  # Peak consumed
+    sheet.write_formula(f'F{first_header_row + 3}', f'=SUMIFS({generated},{periods_194},"{peak}")')                 # Peak generated
+    sheet.write_formula(f'F{first_header_row + 8}', f'=F{first_header_row + 2} + F{first_header_row + 3}')          # Peak net
+
+    # Super Off-Peak billing formulas
+    sheet.write_formula(f'I{first_header_row}', f'=SUMIFS({consumed},{periods_195},"{super_off_peak}")')            # Super Off-Peak consumed
+    sheet.write_formula(f'I{first_header_row + 1}', f'=SUMIFS({generated},{periods_195},"{super_off_peak}")')       # Super Off-Peak generated
+    sheet.write_formula(f'I{first_header_row + 7}', f'=I{first_header_row} + I{first_header_row + 1}')              # Super Off-Peak net
+    sheet.write_formula(f'I{first_header_row + 2}', f'=SUMIFS({consumed},{periods_195},"{off_peak}")')              # Off-Peak consumed
+    sheet.write_formula(f'I{first_header_row + 3}', f'=SUMIFS({generated},{periods_195},"{off_peak}")')             # Off-Peak generated
+    sheet.write_formula(f'I{first_header_row + 8}', f'=I{first_header_row + 2} + I{first_header_row + 3}')          # Off-Peak net
+    sheet.write_formula(f'I{first_header_row + 4}', f'=SUMIFS({consumed},{periods_195},"{peak}")')                  # Peak consumed
+    sheet.write_formula(f'I{first_header_row + 5}', f'=SUMIFS({generated},{periods_195},"{peak}")')                 # Peak generated
+    sheet.write_formula(f'I{first_header_row + 9}', f'=I{first_header_row + 4} + I{first_header_row + 5}')          # Peak net
+
+
+def get_compact_border_ranges(first_data_row: int, last_data_row: int) -> list[dict]:
+    """
+    Return apply_outer_border_to_range options for the compact layout's data and header columns.
+    """
+    return [
+        # Usage header and data
+        {"range_string": "B18:B18", "border_style": 1},
+        {"range_string": "C18:C18", "border_style": 1},
+        {"range_string": "B16:C18", "border_style": 5},
+        {"range_string": f"B{first_data_row}:B{last_data_row}", "border_style": 1},
+        {"range_string": f"B{first_data_row}:C{last_data_row}", "border_style": 5},
+
+        # Period header and data
+        {"range_string": "D17:D18", "border_style": 1},
+        {"range_string": "E17:E18", "border_style": 1},
+        {"range_string": "D16:E18", "border_style": 5},
+        {"range_string": f"D{first_data_row}:D{last_data_row}", "border_style": 1},
+        {"range_string": f"D{first_data_row}:E{last_data_row}", "border_style": 5},
+    ]
+
+
+def format_cells(book, sheet, first_data_row: int, last_data_row: int,
+                 border_ranges: Optional[list[dict]] = None) -> None:
+    """
+    Add borders to data and header columns.  border_ranges defaults to get_border_ranges.
+    """
+    from set_outer_border_for_range_xlsx import apply_outer_border_to_range
+
+    if border_ranges is None:
+        border_ranges = get_border_ranges(first_data_row, last_data_row)
+    for border_range in border_ranges:
+        apply_outer_border_to_range(book, sheet, border_range)
+
+    sheet.autofit()
+    sheet.freeze_panes(f'B{first_data_row}')
+
+
+def get_kwh_rows(table: IntervalTable, start: int, stop: int) -> list[list[Union[float, str]]]:
+    """
+    Return cells for columns B-O of data rows start through stop - 1, built a column at a time from the intervals'
+    kWh and rate 194 and 195 period codes.
+    """
+    consumed: np.ndarray = np.asarray(table.consumed[start:stop], dtype=object)
+    generated: np.ndarray = np.asarray(table.generated[start:stop], dtype=object)
+    peak_194: np.ndarray = table.periods('194')[start:stop] == PEAK
+    periods_195: np.ndarray = table.periods('195')[start:stop]
+    cells: np.ndarray = np.empty((len(consumed), 15), dtype=object)
+
+    # Columns B-D - Non-TOU Billing: Consumed, Gen'd, and empty cell.
+    cells[:, 0] = consumed
+    cells[:, 1] = generated
+    cells[:, 2] = ''
+
+    # Columns E-I = Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, and empty cell.
+    # Periods that don't apply get the int 0, not 0.0, since autofit sizes columns from str() of each number.
+    for column, selected in ((3, peak_194), (5, ~peak_194)):
+        cells[:, column] = np.where(selected, consumed, 0)
+        cells[:, column + 1] = np.where(selected, generated, 0)
+    cells[:, 7] = ''
+
+    # Columns J-P - Super Off-Peak Billing - Peak Consumed and Gen'd, Off-Peak Consumed and Gen'd, Super Off-Peak Consumed and Gen'd, and empty cell.
+    peak_195: np.ndarray = periods_195 == PEAK
+    super_off_peak_195: np.ndarray = periods_195 == SUPER_OFF_PEAK
+    # If it's neither super off-peak nor peak, then it's off-peak.
+    for column, selected in ((8, peak_195), (10, ~(peak_195 | super_off_peak_195)), (12, super_off_peak_195)):
+        cells[:, column] = np.where(selected, consumed, 0)
+        cells[:, column + 1] = np.where(selected, generated, 0)
+    cells[:, 14] = ''
+    return cells.tolist()
+
+
+def get_compact_rows(table: IntervalTable, start: int, stop: int) -> list[list[Union[float, str]]]:
+    """
+    Return cells for columns B-E of compact layout data rows start through stop - 1.
+    """
+    consumed: np.ndarray = np.asarray(table.consumed[start:stop], dtype=object)
+    cells: np.ndarray = np.empty((len(consumed), 4), dtype=object)
+    cells[:, 0] = consumed
+    cells[:, 1] = np.asarray(table.generated[start:stop], dtype=object)
+    cells[:, 2] = COMPACT_PERIOD_LETTERS[table.periods('194')[start:stop]]
+    cells[:, 3] = COMPACT_PERIOD_LETTERS[table.periods('195')[start:stop]]
+    return cells.tolist()
+
+
+class SheetLayout(NamedTuple):
+    add_title_cells: Callable       # (book, sheet, default_format) -> first data row (one-based)
+    add_formulas: Callable          # (sheet, first_header_row, first_data_row, last_data_row)
+    get_border_ranges: Callable     # (first_data_row, last_data_row) -> apply_outer_border_to_range options
+    get_rows: Callable              # (table, start, stop) -> cells from column B for each row
+    columns: int                    # Cells per data row, including the time
+
+
+SHEET_LAYOUTS: dict[str, SheetLayout] = {
+    'full': SheetLayout(add_title_cells, add_formulas, get_border_ranges, get_kwh_rows, 16),
+    'compact': SheetLayout(add_compact_title_cells, add_compact_formulas, get_compact_border_ranges, get_compact_rows, 5),
+}
+
+
+def write_usage_rows(worksheet, centered_fmt, table: IntervalTable, first_row: int,
+                     layout: Optional[SheetLayout] = None) -> int:
+    """
+    Write one row per interval starting at first_row (one-based).  Returns the last row written (one-based).
+
+    layout defaults to the full layout.
+    """
+    layout = layout or SHEET_LAYOUTS['full']
+    sheet_row: int = first_row - 1
+    for start in range(0, len(table.timestamps), ROW_BLOCK):
+        for time_value, kwh_data in zip(table.get_datetimes(start, start + ROW_BLOCK),
+                                        layout.get_rows(table, start, start + ROW_BLOCK)):
+            # Column 0: Time
+            worksheet.write_datetime(sheet_row, 0, time_value)
+            worksheet.write_row(sheet_row, 1, kwh_data, centered_fmt)
+            sheet_row += 1
+    profiling.count(rows=len(table.timestamps), cells=len(table.timestamps) * layout.columns)
+    return sheet_row
+
+
+def write_usage_rows_streaming(workbook, worksheet, centered_fmt, table: IntervalTable,
+                               layout: Optional[SheetLayout] = None) -> None:
+    """
+    Write the same layout as add_title_cells, add_formulas and format_cells in row order, with every cell's final
+    border already applied, so the worksheet can be written in constant_memory mode.  layout defaults to the full
+    layout.
+    """
+    layout = layout or SHEET_LAYOUTS['full']
+    from xlsx_streaming import RecordingSheet, StreamingSheetWriter
+
+    header: RecordingSheet = RecordingSheet()
+    first_row: int = layout.add_title_cells(workbook, header, centered_fmt)
+    last_row: int = first_row - 1 + len(table.timestamps)
+    layout.add_formulas(header, FIRST_HEADER_ROW, first_row, last_row)
+
+    with profiling.stage('classify'):
+        table.periods('194')
+        table.periods('195')
+        profiling.count(rows=2 * len(table.timestamps))
+
+    with profiling.stage('write_cells', workbook):
+        writer: StreamingSheetWriter = StreamingSheetWriter(workbook, worksheet,
+                                                            layout.get_border_ranges(first_row, last_row))
+        format_stats: dict = writer.registry.stats()
+        writer.write_recorded(header)
+
+        sheet_row: int = first_row - 1
+        for start in range(0, len(table.timestamps), ROW_BLOCK):
+            for time_value, kwh_data in zip(table.get_datetimes(start, start + ROW_BLOCK),
+                                            layout.get_rows(table, start, start + ROW_BLOCK)):
+                # Column 0: Time
+                writer.write_datetime(sheet_row, 0, time_value)
+                writer.write_row(sheet_row, 1, kwh_data, centered_fmt)
+                sheet_row += 1
+        profiling.count(rows=len(table.timestamps), cells=len(table.timestamps) * layout.columns)
+        writer.registry.count_since(format_stats)
+
+        writer.autofit()
+        worksheet.freeze_panes(f'B{first_row}')
+
+
+def write_rollup_sheet(workbook, rollup_name: str, rollup: UsageRollup, centered_fmt) -> None:
+    """
+    Add a sheet with one row per rollup entry.  Rows are written in order, so this works in constant_memory mode.
+    """
+    from xlsx_streaming import StreamingSheetWriter
+
+    worksheet: Worksheet = workbook.add_worksheet(f'{rollup_name.title()} Totals')
+    writer: StreamingSheetWriter = StreamingSheetWriter(workbook, worksheet, [])
+    # Hourly starts use the workbook's default date and time format.
+    date_fmt = None if rollup_name == 'hourly' else workbook.add_format({'num_format': 'mmm dd yyyy'})
+
+    writer.write_row(0, 0, ROLLUP_HEADERS, centered_fmt)
+    sheet_row: int = 1
+    # Offsets are written in hours (-4 for EDT, -5 for EST), which tell apart the two 1 AM hours when DST ends.
+    offset_hours: list[int] = (rollup.utc_offsets // 3600).tolist()
+    for start, utc_offset, meter, rate, period, intervals, consumed, generated, net, peak_demand in zip(
+            rollup.starts.tolist(), offset_hours, *(column.tolist() for column in rollup[2:])):
+        writer.write_datetime(sheet_row, 0, to_datetime(start), date_fmt)
+        # Peak kW is NaN when no interval in the bucket had a kW reading.
+        writer.write_row(sheet_row, 1, [utc_offset, meter, rate, period, intervals, consumed, generated, net,
+                                        '' if peak_demand != peak_demand else peak_demand], centered_fmt)
+        sheet_row += 1
+    profiling.count(rows=len(rollup.starts), cells=len(rollup.starts) * len(ROLLUP_HEADERS))
+
+    writer.autofit()
+    worksheet.freeze_panes(1, 0)
+
+
+def get_meter_sheets(table: IntervalTable) -> list[tuple[str, IntervalTable]]:
+    """
+    Return the name and intervals of each interval sheet.  The layouts have no meter column and total every row, so
+    usage from several meters gets a sheet per meter.
+    """
+    meters: list[int] = np.unique(table.meters).tolist()
+    if len(meters) <= 1:
+        return [(USAGE_SHEET_NAME, table)]
+    return [(f'{USAGE_SHEET_NAME} {meter}', table.select(np.asarray(table.meters) == meter)) for meter in meters]
+
+
+def write_usage_workbook(usage: UsageArrays, xslx_file_name: str, streaming: bool = False,
+                         layout_name: str = 'full', rollups: Optional[list[str]] = None, intervals: bool = True) -> bool:
+    """
+    Create the Excel xslx file for parsed usage data in one of SHEET_LAYOUTS.  See pseg_parse.pseg_parse.
+
+    Usage from several meters gets an interval sheet per meter (see get_meter_sheets).  Each name in rollups (see
+    usage_rollups.ROLLUP_SECONDS) adds a sheet of totals.  Without intervals the interval sheets are left out, for
+    date ranges too long to be useful row by row.
+
+    Returns False if the worksheet couldn't be created.
+    """
+    # Imported here so xlsxwriter is only loaded when a workbook is written.
+    import xlsxwriter
+
+    layout: SheetLayout = SHEET_LAYOUTS[layout_name]
+    table: IntervalTable = as_interval_table(usage)
+    workbook: Workbook = xlsxwriter.Workbook(xslx_file_name, {'default_date_format': 'mmm dd yyyy hh:mm',
+                                                              'constant_memory': streaming})
+    centered_fmt = workbook.add_format({'align': 'center', 'valign': 'vcenter'})
+
+    for sheet_name, meter_table in (get_meter_sheets(table) if intervals else []):
+        worksheet: Unknown | Worksheet = workbook.add_worksheet(sheet_name)
+        if worksheet is None:
+            print('Error creating worksheet!')
+            return False
+
+        if streaming:
+            write_usage_rows_streaming(workbook, worksheet, centered_fmt, meter_table, layout)
+        else:
+            with profiling.stage('classify'):
+                meter_table.periods('194')
+                meter_table.periods('195')
+                profiling.count(rows=2 * len(meter_table.timestamps))
+
+            with profiling.stage('write_cells', workbook):
+                # first_row is cell addressing (one-based).
+                # sheet_row is row addressing (zero-based).
+                # add_title_cells returns row in cell addressing mode, which is one-based.
+                first_row: int = layout.add_title_cells(workbook, worksheet, centered_fmt)
+                sheet_row: int = write_usage_rows(worksheet, centered_fmt, meter_table, first_row, layout)
+                layout.add_formulas(worksheet, FIRST_HEADER_ROW, first_row, sheet_row)
+
+            with profiling.stage('format_cells', workbook):
+                format_cells(workbook, worksheet, first_row, sheet_row, layout.get_border_ranges(first_row, sheet_row))
+
+    for rollup_name in rollups or []:
+        with profiling.stage(f'{rollup_name}_rollup'):
+            rollup: UsageRollup = compute_rollup(table, rollup_name)
+            profiling.count(rows=len(rollup.starts))
+        with profiling.stage(f'{rollup_name}_sheet', workbook):
+            write_rollup_sheet(workbook, rollup_name, rollup, centered_fmt)
+
+    with profiling.stage('close'):
+        workbook.close()
+    return True
@@ -0,0 +1,191 @@
+"""
+xlsx_streaming.py
+
+Helpers for writing a worksheet in xlsxwriter's constant_memory mode, where each row is flushed to disk as
+soon as a later row is written.  Borders from apply_outer_border_to_range and autofit column widths can't be
+applied after the fact in that mode, so they are resolved up front for every cell as it is written.
+"""
+
+from typing import Optional
+from datetime import date, datetime, time, timedelta
+from xlsxwriter.utility import xl_pixel_width
+from xlsxwriter.worksheet import convert_cell_args, convert_range_args
+from set_outer_border_for_range_xlsx import excel_range_string_to_indices, get_format_properties, get_format_registry
+
+# Worksheet.autofit() caps columns at 1790 pixels.
+AUTOFIT_MAX_PIXELS: int = 1790
+
+
+class RecordingSheet:
+    """
+    Stand-in worksheet that records writes so a header built out of row order can be replayed in row order.
+
+    Supports the subset of the Worksheet API used by add_title_cells and add_formulas.
+    """
+
+    def __init__(self):
+        self.cells: dict[tuple[int, int], tuple] = {}
+        self.merges: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+
+    @convert_cell_args
+    def write(self, row: int, col: int, *args) -> int:
+        self.cells[(row, col)] = ('write',) + args
+        return 0
+
+    @convert_cell_args
+    def write_row(self, row: int, col: int, data, cell_format=None) -> int:
+        for offset, token in enumerate(data):
+            self.cells[(row, col + offset)] = ('write', token, cell_format)
+        return 0
+
+    @convert_cell_args
+    def write_formula(self, row: int, col: int, formula: str, cell_format=None, value=0) -> int:
+        self.cells[(row, col)] = ('write_formula', formula, cell_format, value)
+        return 0
+
+    @convert_range_args
+    def merge_range(self, first_row: int, first_col: int, last_row: int, last_col: int, data, cell_format=None) -> int:
+        self.merges[(first_row, first_col)] = (first_row, first_col, last_row, last_col)
+        self.cells[(first_row, first_col)] = ('write', data, cell_format)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                if (row, col) != (first_row, first_col):
+                    self.cells[(row, col)] = ('write', '', cell_format)
+        return 0
+
+
+class OuterBorderResolver:
+    """
+    Works out the border sides each cell ends up with after a list of apply_outer_border_to_range calls.
+
+    Later ranges override earlier ones side by side, the same as applying them to an existing sheet.
+    """
+
+    def __init__(self, border_ranges: list[dict]):
+        self.ranges: list[tuple[int, int, int, int, int]] = []
+        for options in border_ranges:
+            first_col, first_row, last_col, last_row = excel_range_string_to_indices(options['range_string'])
+            self.ranges.append((first_col, first_row, last_col, last_row, options.get('border_style', 1)))
+        self._row_cache: dict[tuple, dict[int, dict[str, int]]] = {}
+
+    def row_borders(self, row_index: int) -> dict[int, dict[str, int]]:
+        """
+        Return {column: {side: style}} for every bordered cell in row_index.
+        """
+        # Rows that cross the same ranges at the same edges share a border pattern, so data rows are only resolved
+        # once for the first, middle and last rows.
+        signature: tuple = tuple((index, row_index == first_row, row_index == last_row)
+                                 for index, (_, first_row, _, last_row, _) in enumerate(self.ranges)
+                                 if first_row <= row_index <= last_row)
+        borders: Optional[dict[int, dict[str, int]]] = self._row_cache.get(signature)
+        if borders is None:
+            borders = {}
+            for index, is_first_row, is_last_row in signature:
+                first_col, _, last_col, _, border_style = self.ranges[index]
+                for col in range(first_col, last_col + 1):
+                    sides: dict[str, int] = {}
+                    if col == first_col:
+                        sides['left'] = border_style
+                    if col == last_col:
+                        sides['right'] = border_style
+                    if is_first_row:
+                        sides['top'] = border_style
+                    if is_last_row:
+                        sides['bottom'] = border_style
+                    if sides:
+                        borders.setdefault(col, {}).update(sides)
+            self._row_cache[signature] = borders
+        return borders
+
+
+class StreamingSheetWriter:
+    """
+    Writes cells in row order with their final border format, tracking autofit column widths as it goes.
+    """
+
+    def __init__(self, workbook, worksheet, border_ranges: list[dict]):
+        self.workbook = workbook
+        self.worksheet = worksheet
+        self.registry = get_format_registry(workbook)
+        self.borders = OuterBorderResolver(border_ranges)
+        self.column_pixels: dict[int, int] = {}
+        self._formats: dict[tuple, object] = {}
+
+    def cell_format(self, row_index: int, col_index: int, base_format, borders: dict[int, dict[str, int]]):
+        """
+        Return base_format with any borders for the cell applied.
+        """
+        sides: Optional[dict[str, int]] = borders.get(col_index)
+        if sides is None:
+            return base_format
+        key: tuple = (id(base_format), col_index, tuple(sides.items()))
+        cell_format = self._formats.get(key)
+        if cell_format is None:
+            properties: dict = get_format_properties(base_format)
+            properties.update(sides)
+            cell_format = self._formats[key] = self.registry.get_format(properties)
+        return cell_format
+
+    def track_width(self, col_index: int, token) -> None:
+        """
+        Record the pixel width Worksheet.autofit() would use for token.
+        """
+        length: int = 0
+        if isinstance(token, str):
+            length = max(xl_pixel_width(line) for line in token.split('\n')) if token else 0
+        elif isinstance(token, bool):
+            length = 31 if token else 36
+        elif isinstance(token, (int, float)):
+            length = 7 * len(str(token))
+        elif isinstance(token, (datetime, date, time, timedelta)):
+            length = self.worksheet.default_date_pixels
+        if length > self.column_pixels.get(col_index, 0):
+            self.column_pixels[col_index] = length
+
+    def write_recorded(self, recording: RecordingSheet) -> None:
+        """
+        Replay a RecordingSheet in row order.
+        """
+        rows: dict[int, list[int]] = {}
+        for row_index, col_index in sorted(recording.cells):
+            rows.setdefault(row_index, []).append(col_index)
+
+        for row_index, columns in rows.items():
+            borders: dict[int, dict[str, int]] = self.borders.row_borders(row_index)
+            for col_index in sorted(set(columns) | set(borders)):
+                cell: tuple = recording.cells.get((row_index, col_index), ('write', None, None))
+                method: str = cell[0]
+                token = cell[1]
+                base_format = cell[2]
+                cell_format = self.cell_format(row_index, col_index, base_format, borders)
+
+                merge: Optional[tuple[int, int, int, int]] = recording.merges.get((row_index, col_index))
+                if merge is not None:
+                    self.worksheet.merge_range(*merge, token, cell_format)
+                elif method == 'write_formula':
+                    self.worksheet.write_formula(row_index, col_index, token, cell_format, cell[3])
+                    token = cell[3] if cell[3] else None
+                else:
+                    self.worksheet.write(row_index, col_index, token, cell_format)
+                self.track_width(col_index, token)
+
+    def write_row(self, row_index: int, col_index: int, data: list, base_format=None) -> None:
+        """
+        Write a row of data starting at col_index, adding borders to base_format where needed.
+        """
+        borders: dict[int, dict[str, int]] = self.borders.row_borders(row_index)
+        for offset, token in enumerate(data):
+            self.worksheet.write(row_index, col_index + offset, token,
+                                 self.cell_format(row_index, col_index + offset, base_format, borders))
+            self.track_width(col_index + offset, token)
+
+    def write_datetime(self, row_index: int, col_index: int, date_time_val: datetime, cell_format=None) -> None:
+        self.worksheet.write_datetime(row_index, col_index, date_time_val, cell_format)
+        self.track_width(col_index, date_time_val)
+
+    def autofit(self) -> None:
+        """
+        Set column widths the same way Worksheet.autofit() would have.
+        """
+        for col_index, pixels in sorted(self.column_pixels.items()):
+            self.worksheet.set_column_pixels(col_index, col_index, min(pixels + 7, AUTOFIT_MAX_PIXELS))